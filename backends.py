@@ -0,0 +1,717 @@
+# -*- coding: utf-8 -*-
+"""
+Systèmes de fichiers sous les panneaux de l'explorateur.
+
+Chaque chemin est servi par un backend : le disque local, ou une archive
+zip ou tar parcourue comme un dossier. Le chemin d'une entrée d'archive
+prolonge celui du fichier d'archive (/home/a/data.zip/docs/notes.txt).
+
+L'index d'une archive est lu une seule fois, sans rien extraire : le
+répertoire central d'un zip (en fin de fichier), ou les en-têtes d'un tar,
+parcourus une fois puis enregistrés dans le cache pour les ouvertures
+suivantes. Chaque dossier de l'archive devient un EntryStore, et une entrée
+n'est lue qu'à son ouverture, directement à sa position dans l'archive.
+
+Aucune dépendance Qt.
+"""
+import bz2
+import errno
+import gzip
+import hashlib
+import io
+import lzma
+import marshal
+import os
+import stat
+import struct
+import threading
+import time
+import zipfile
+import zlib
+from array import array
+from collections import OrderedDict
+from itertools import accumulate
+
+from explorer.dircache import default_cache_dir
+from explorer.entrystore import EntryStore
+from explorer.scanner import BATCH_SIZE, FIRST_BATCH, iter_batches, stat_entry
+
+ZIP_SUFFIXES = (".zip", ".jar", ".whl")
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+MAX_ARCHIVES = 4  # index d'archives gardés en mémoire
+INDEX_VERSION = 1  # format des index de tar enregistrés
+DIR_MODE = stat.S_IFDIR | 0o755
+FILE_MODE = stat.S_IFREG | 0o644
+READ_CHUNK = 1024 * 1024
+
+
+def default_index_dir():
+    return os.path.join(default_cache_dir(), "archives")
+
+
+def archive_kind(path):
+    """
+    @return : "zip", "tar" ou None, d'après le suffixe de path
+    """
+    lower = path.lower()
+    if lower.endswith(ZIP_SUFFIXES):
+        return "zip"
+    if lower.endswith(TAR_SUFFIXES):
+        return "tar"
+    return None
+
+
+class LocalBackend(object):
+    """
+    Disque local : énumération par scandir, surveillance et cache des dossiers.
+    """
+    local = True
+
+    def iter_batches(self, path, cancelled=None, first=FIRST_BATCH, size=BATCH_SIZE):
+        return iter_batches(path, cancelled, first, size)
+
+    def stat(self, path):
+        return stat_entry(*os.path.split(path))
+
+    def mtime(self, path):
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return 0.0
+
+    def is_dir(self, path):
+        return os.path.isdir(path)
+
+    def open(self, path):
+        return open(path, "rb")
+
+
+LOCAL = LocalBackend()
+
+
+# --- lecture d'une entrée
+
+class _Slice(io.RawIOBase):
+    """
+    length octets à partir de offset dans le flux rendu par opener (fichier
+    ou flux décompressé, dont seek avance en lisant).
+    """
+
+    def __init__(self, opener, offset, length):
+        io.RawIOBase.__init__(self)
+        self._file = opener()
+        self._offset = offset
+        self._length = length
+        self._pos = 0
+        self._file.seek(offset)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return self._file.seekable()
+
+    def readinto(self, buffer):
+        n = min(len(buffer), self._length - self._pos)
+        if n <= 0:
+            return 0
+        data = self._file.read(n)
+        buffer[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            pos += self._pos
+        elif whence == io.SEEK_END:
+            pos += self._length
+        self._pos = max(0, min(pos, self._length))
+        self._file.seek(self._offset + self._pos)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+        io.RawIOBase.close(self)
+
+
+class _Inflate(io.RawIOBase):
+    """
+    Décompression au fil de la lecture d'une entrée zip « deflate ».
+    """
+
+    def __init__(self, raw, size):
+        io.RawIOBase.__init__(self)
+        self._raw = raw
+        self._size = size
+        self._pos = 0
+        self._pending = b""
+        self._zlib = zlib.decompressobj(-15)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending and not self._zlib.eof:
+            chunk = self._raw.read(READ_CHUNK)
+            self._pending = self._zlib.decompress(chunk) if chunk else self._zlib.flush()
+            if not chunk:
+                break
+        n = min(len(buffer), len(self._pending))
+        buffer[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        self._pos += n
+        return n
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        if not self.closed:
+            self._raw.close()
+        io.RawIOBase.close(self)
+
+
+# --- index d'une archive
+
+class _Dir(object):
+    """
+    Dossier d'une archive : ses entrées, et pour chacune où lire son contenu.
+    """
+    __slots__ = ("store", "offsets", "lengths", "methods")
+
+    def __init__(self):
+        self.store = EntryStore()
+        self.offsets = array('q')  # en-tête local (zip) ou début des données (tar)
+        self.lengths = array('q')  # octets stockés, compressés pour un zip
+        self.methods = array('B')  # méthode de compression zip, 0 : stocké
+
+    def to_columns(self):
+        return self.store.to_columns() + (self.offsets.tobytes(), self.lengths.tobytes(), self.methods.tobytes())
+
+    @classmethod
+    def from_entries(cls, entries):
+        """
+        @param entries : [(nom en octets, taille, mtime, mode, offset, longueur, méthode)]
+        """
+        folder = cls()
+        if entries:
+            names, sizes, mtimes, modes, offsets, lengths, methods = zip(*entries)
+            folder.store = EntryStore.from_columns(
+                b"".join(names), array('Q', accumulate(map(len, names), initial=0)).tobytes(),
+                array('q', sizes).tobytes(), array('d', mtimes).tobytes(), array('I', modes).tobytes())
+            folder.offsets = array('q', offsets)
+            folder.lengths = array('q', lengths)
+            folder.methods = array('B', methods)
+        return folder
+
+    @classmethod
+    def from_columns(cls, columns):
+        folder = cls()
+        folder.store = EntryStore.from_columns(*columns[:5])
+        folder.offsets.frombytes(columns[5])
+        folder.lengths.frombytes(columns[6])
+        folder.methods.frombytes(columns[7])
+        return folder
+
+
+def _normalise(inner):
+    """
+    @return : inner (octets) sans "/" en tête ni en fin, ni "." ou "//"
+    """
+    if inner.startswith((b"/", b"./")) or b"//" in inner or b"/./" in inner:
+        inner = b"/".join(part for part in inner.split(b"/") if part and part != b".")
+    return inner.rstrip(b"/")
+
+
+class _IndexBuilder(object):
+    """
+    Range les entrées d'une archive (chemins en octets) par dossier. Les
+    dossiers parents absents de l'archive sont créés au passage.
+    Une entrée est un tuple (nom, taille, mtime, mode, offset, longueur,
+    méthode), ou un entier que l'index décode à la première lecture de son
+    dossier (position dans le répertoire central d'un zip).
+    """
+
+    def __init__(self, mtime):
+        self.mtime = mtime
+        self.entries = {b"": []}  # dossier -> entrées
+
+    def folder(self, inner, mtime=None):
+        entries = self.entries.get(inner)
+        if entries is None:
+            entries = self.entries[inner] = []
+            parent, _, name = inner.rpartition(b"/")
+            self.folder(parent).append((name, 0, self.mtime if mtime is None else mtime, DIR_MODE, -1, 0, 0))
+        return entries
+
+    def add(self, inner, size, mtime, mode, offset, length, method=0):
+        inner = _normalise(inner)
+        if not inner:
+            return
+        if stat.S_ISDIR(mode):
+            self.folder(inner, mtime)
+            return
+        parent, _, name = inner.rpartition(b"/")
+        entries = self.entries.get(parent)
+        if entries is None:
+            entries = self.folder(parent)
+        entries.append((name, size, mtime, mode, offset, length, method))
+
+    def finish(self, decode=None):
+        index = ArchiveIndex(decode)
+        index.dirs = {os.fsdecode(inner): entries for inner, entries in self.entries.items()}
+        if decode is None:
+            for inner in index.dirs:
+                index.folder(inner)
+        return index
+
+
+class ArchiveIndex(object):
+    """
+    Dossiers d'une archive par chemin intérieur ("" pour la racine). Un
+    dossier dont les entrées ne sont pas encore décodées est gardé sous
+    forme de liste jusqu'à sa première lecture.
+
+    @param decode : fonction qui rend le tuple d'une entrée donnée par un entier
+    """
+
+    def __init__(self, decode=None):
+        self.dirs = {}
+        self._decode = decode
+        self._lock = threading.Lock()
+
+    def folder(self, inner):
+        """
+        @return : le _Dir du dossier inner, ou None s'il n'existe pas
+        """
+        folder = self.dirs.get(inner)
+        if isinstance(folder, list):
+            with self._lock:
+                folder = self.dirs[inner]
+                if isinstance(folder, list):
+                    decode = self._decode
+                    folder = self.dirs[inner] = _Dir.from_entries(
+                        [entry if isinstance(entry, tuple) else decode(entry) for entry in folder])
+        return folder
+
+    def lookup(self, inner):
+        """
+        @return : (dossier, ligne) de l'entrée inner
+        """
+        parent, _, name = inner.rpartition("/")
+        folder = self.folder(parent)
+        row = folder.store.find(name) if folder is not None else -1
+        if row < 0:
+            raise OSError(errno.ENOENT, os.strerror(errno.ENOENT), inner)
+        return folder, row
+
+    def to_columns(self):
+        return {inner: self.folder(inner).to_columns() for inner in self.dirs}
+
+    @classmethod
+    def from_columns(cls, columns):
+        index = cls()
+        index.dirs = {inner: _Dir.from_columns(folder) for inner, folder in columns.items()}
+        return index
+
+
+class ArchiveBackend(object):
+    """
+    Archive vue comme un dossier en lecture seule. L'index est construit à
+    la première énumération, depuis un thread de travail ; is_dir, appelé
+    par l'interface, ne le construit jamais.
+    """
+    local = False
+
+    def __init__(self, archive, st):
+        self.archive = archive
+        self.stamp = (st.st_size, st.st_mtime)
+        self._index = None
+        self._lock = threading.Lock()
+
+    def inner(self, path):
+        if path == self.archive:
+            return ""
+        return path[len(self.archive) + 1:].replace(os.sep, "/")
+
+    def index(self):
+        """
+        @raise OSError : archive illisible, y compris tronquée ou mal formée
+        """
+        with self._lock:
+            if self._index is None:
+                try:
+                    self._index = self._build()
+                except (ValueError, EOFError, struct.error, zlib.error, lzma.LZMAError) as e:
+                    # erreurs d'analyse ou de décompression : même chemin que les erreurs de lecture
+                    raise OSError(errno.EINVAL, "archive illisible : {0}".format(e), self.archive)
+            return self._index
+
+    def iter_batches(self, path, cancelled=None, first=FIRST_BATCH, size=BATCH_SIZE):
+        folder = self.index().folder(self.inner(path))
+        if folder is None:
+            raise OSError(errno.ENOTDIR, os.strerror(errno.ENOTDIR), path)
+        store = folder.store
+        start, limit = 0, first
+        while start < len(store):
+            if cancelled is not None and cancelled.is_set():
+                return
+            stop = min(len(store), start + limit)
+            yield [store.entry(i) for i in range(start, stop)]
+            start, limit = stop, size
+
+    def stat(self, path):
+        inner = self.inner(path)
+        if not inner:
+            return os.path.basename(path), 0, self.stamp[1], DIR_MODE
+        try:
+            folder, row = self.index().lookup(inner)
+        except OSError:
+            return None
+        return folder.store.entry(row)
+
+    def mtime(self, path):
+        return self.stamp[1]
+
+    def is_dir(self, path):
+        """
+        Sans index (archive pas encore énumérée), un chemin intérieur est
+        supposé être un dossier : son énumération dira ce qu'il en est.
+        """
+        inner = self.inner(path)
+        index = self._index
+        return not inner or index is None or inner in index.dirs
+
+    def open(self, path):
+        folder, row = self.index().lookup(self.inner(path))
+        if stat.S_ISDIR(folder.store.modes[row]):
+            raise OSError(errno.EISDIR, os.strerror(errno.EISDIR), path)
+        return io.BufferedReader(self._open_member(path, folder, row), READ_CHUNK)
+
+
+class ZipBackend(ArchiveBackend):
+    """
+    Zip : seul le répertoire central est lu, d'un bloc ; une entrée est
+    lue à partir de son en-tête local (stockée ou deflate).
+    """
+    _EOCD = struct.Struct("<4s4H2LH")
+    _EOCD64_LOCATOR = struct.Struct("<4sLQL")
+    _EOCD64 = struct.Struct("<4sQ2H2L4Q")
+    _CENTRAL = struct.Struct("<4s4B4HL2L5H2L")
+    _CENTRAL_NAME = struct.Struct("<4s4xH18x3H")  # signature, drapeaux et longueurs seulement
+    _LOCAL = struct.Struct("<4s2B4HL2L2H")
+
+    def _build(self):
+        with open(self.archive, "rb") as f:
+            f.seek(0, io.SEEK_END)
+            end = f.tell()
+            tail_start = max(0, end - 65536 - self._EOCD.size)
+            f.seek(tail_start)
+            tail = f.read()
+            pos = tail.rfind(b"PK\x05\x06")
+            if pos < 0:
+                raise OSError(errno.EINVAL, "archive zip illisible", self.archive)
+            _, _, _, _, count, cd_size, cd_offset, _ = self._EOCD.unpack_from(tail, pos)
+            eocd = tail_start + pos
+            locator = pos - self._EOCD64_LOCATOR.size
+            if locator >= 0 and tail[locator:locator + 4] == b"PK\x06\x07":
+                _, _, eocd64, _ = self._EOCD64_LOCATOR.unpack_from(tail, locator)
+                f.seek(eocd64)
+                fields = self._EOCD64.unpack(f.read(self._EOCD64.size))
+                count, cd_size, cd_offset = fields[7], fields[8], fields[9]
+                eocd = eocd64
+            shift = eocd - cd_size - cd_offset  # données ajoutées en tête (auto-extractible)
+            f.seek(cd_offset + shift)
+            central = f.read(cd_size)
+
+        # premier passage : chaque entrée est seulement rangée dans son dossier,
+        # ses champs ne sont lus qu'à la première énumération de ce dossier
+        builder = _IndexBuilder(self.stamp[1])
+        entries, folder = builder.entries, builder.folder
+        unpack = self._CENTRAL_NAME.unpack_from
+        header = self._CENTRAL.size
+        end = len(central) - header
+        pos = 0
+        while pos <= end:
+            signature, flags, name_length, extra_length, comment_length = unpack(central, pos)
+            if signature != b"PK\x01\x02":
+                break
+            start = pos + header
+            name = central[start:start + name_length]
+            record = pos
+            pos = start + name_length + extra_length + comment_length
+            if not flags & 0x800 and not name.isascii():
+                name = os.fsencode(name.decode("cp437"))
+            is_dir = name.endswith(b"/")
+            if is_dir or name.startswith((b"/", b"./")) or b"//" in name or b"/./" in name:
+                name = _normalise(name)
+                if not name:
+                    continue
+                if is_dir:
+                    if name not in entries:
+                        entries[name] = []
+                        folder(name.rpartition(b"/")[0]).append(record)
+                    continue
+            parent = name.rpartition(b"/")[0]
+            siblings = entries.get(parent)
+            if siblings is None:
+                siblings = folder(parent)
+            siblings.append(record)
+        times = {}
+        return builder.finish(lambda record: self._entry(central, record, shift, times))
+
+    def _entry(self, central, pos, shift, times):
+        """
+        @return : tuple de l'entrée décrite à la position pos du répertoire central
+        """
+        (_, _, system, _, _, flags, method, dostime, dosdate, _, length, size,
+         name_length, extra_length, _, _, _, attributes, offset) = self._CENTRAL.unpack_from(central, pos)
+        start = pos + self._CENTRAL.size
+        name = central[start:start + name_length]
+        if 0xFFFFFFFF in (length, size, offset):
+            size, length, offset = self._zip64(central[start + name_length:start + name_length + extra_length],
+                                               size, length, offset)
+        if not flags & 0x800 and not name.isascii():
+            name = os.fsencode(name.decode("cp437"))
+        mtime = times.get((dosdate, dostime))
+        if mtime is None:
+            mtime = times[dosdate, dostime] = self._dos_time(dosdate, dostime)
+        mode = attributes >> 16 if system == 3 else 0
+        if name.endswith(b"/"):
+            mode = stat.S_IFDIR | (mode & 0o7777 or 0o755)
+        elif not mode:
+            mode = FILE_MODE
+        if flags & 0x1:
+            method = 255  # chiffrée
+        return _normalise(name).rpartition(b"/")[2], size, mtime, mode, offset + shift, length, method
+
+    @staticmethod
+    def _zip64(extra, size, length, offset):
+        pos = 0
+        while pos + 4 <= len(extra):
+            tag, data_length = struct.unpack_from("<2H", extra, pos)
+            if tag == 1:
+                values = list(struct.unpack_from("<{0}Q".format(data_length // 8), extra, pos + 4))
+                if size == 0xFFFFFFFF and values:
+                    size = values.pop(0)
+                if length == 0xFFFFFFFF and values:
+                    length = values.pop(0)
+                if offset == 0xFFFFFFFF and values:
+                    offset = values.pop(0)
+                break
+            pos += 4 + data_length
+        return size, length, offset
+
+    @staticmethod
+    def _dos_time(date, dostime):
+        try:
+            return time.mktime(((date >> 9) + 1980, (date >> 5) & 0xF, date & 0x1F,
+                                dostime >> 11, (dostime >> 5) & 0x3F, (dostime & 0x1F) * 2, 0, 0, -1))
+        except (OverflowError, ValueError):
+            return 0.0
+
+    def _open_member(self, path, folder, row):
+        offset, length, method = folder.offsets[row], folder.lengths[row], folder.methods[row]
+        if method == 255:
+            raise OSError(errno.EACCES, "entrée chiffrée", path)
+        with open(self.archive, "rb") as f:
+            f.seek(offset)
+            fields = self._LOCAL.unpack(f.read(self._LOCAL.size))
+        if fields[0] != b"PK\x03\x04":
+            raise OSError(errno.EINVAL, "en-tête local invalide", path)
+        start = offset + self._LOCAL.size + fields[10] + fields[11]
+        raw = _Slice(lambda: open(self.archive, "rb"), start, length)
+        if method == zipfile.ZIP_STORED:
+            return raw
+        if method == zipfile.ZIP_DEFLATED:
+            return _Inflate(raw, folder.store.sizes[row])
+        raw.close()
+        # bzip2, lzma : rares, laissés à zipfile (qui relit tout le répertoire central)
+        archive = zipfile.ZipFile(self.archive)
+        member = archive.open(self.inner(path))
+        member._explorer_archive = archive  # garde l'archive ouverte avec l'entrée
+        return member
+
+
+class TarBackend(ArchiveBackend):
+    """
+    Tar, éventuellement compressé : les en-têtes sont parcourus une fois
+    (les données sont sautées), et l'index est enregistré dans le cache.
+    Une entrée d'un tar non compressé est lue directement à sa position.
+    """
+    _BLOCK = 512
+
+    def __init__(self, archive, st, index_dir=None):
+        ArchiveBackend.__init__(self, archive, st)
+        self.index_dir = index_dir or default_index_dir()
+
+    def _opener(self):
+        lower = self.archive.lower()
+        if lower.endswith((".gz", ".tgz")):
+            return gzip.open(self.archive, "rb")
+        if lower.endswith((".bz2", ".tbz2")):
+            return bz2.open(self.archive, "rb")
+        if lower.endswith((".xz", ".txz")):
+            return lzma.open(self.archive, "rb")
+        return open(self.archive, "rb")
+
+    def _index_path(self):
+        key = hashlib.sha1(os.fsencode(os.path.realpath(self.archive))).hexdigest()
+        return os.path.join(self.index_dir, key + ".idx")
+
+    def _build(self):
+        path = self._index_path()
+        try:
+            with open(path, "rb") as f:
+                version, stamp, columns = marshal.load(f)
+            if version == INDEX_VERSION and tuple(stamp) == self.stamp:
+                return ArchiveIndex.from_columns(columns)
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+        with self._opener() as f:
+            index = self._scan(f)
+        try:
+            os.makedirs(self.index_dir, exist_ok=True)
+            tmp = "{0}.{1}.tmp".format(path, os.getpid())
+            with open(tmp, "wb") as f:
+                marshal.dump((INDEX_VERSION, self.stamp, index.to_columns()), f)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+        return index
+
+    @staticmethod
+    def _number(field):
+        if field[:1] and field[0] & 0x80:  # base 256 (GNU)
+            return int.from_bytes(field[1:], "big")
+        field = field.split(b"\0", 1)[0].strip()
+        return int(field, 8) if field else 0
+
+    @staticmethod
+    def _pax(data):
+        values = {}
+        pos = 0
+        while pos < len(data):
+            space = data.find(b" ", pos)
+            if space < 0:
+                break
+            length = int(data[pos:space])
+            key, _, value = data[space + 1:pos + length - 1].partition(b"=")
+            values[key] = value
+            pos += length
+        return values
+
+    def _scan(self, f):
+        builder = _IndexBuilder(self.stamp[1])
+        block = self._BLOCK
+        number = self._number
+        pos = 0
+        long_name = None
+        pax = {}
+        while True:
+            header = f.read(block)
+            if len(header) < block or header.count(0) == block:
+                break
+            size = number(header[124:136])
+            kind = header[156:157]
+            data = pos + block
+            padded = (size + block - 1) // block * block
+            pos = data + padded
+            if kind in (b"L", b"x"):
+                content = f.read(padded)[:size]
+                if kind == b"L":
+                    long_name = content.rstrip(b"\0")
+                else:
+                    pax = self._pax(content)
+                continue
+            if kind in (b"K", b"g"):
+                f.seek(padded, io.SEEK_CUR)
+                continue
+            name = header[0:100].split(b"\0", 1)[0]
+            if header[257:262] == b"ustar":
+                prefix = header[345:500].split(b"\0", 1)[0]
+                if prefix:
+                    name = prefix + b"/" + name
+            name = pax.get(b"path") or long_name or name
+            if b"size" in pax:
+                size = int(pax[b"size"])
+                padded = (size + block - 1) // block * block
+                pos = data + padded
+            mtime = float(pax[b"mtime"]) if b"mtime" in pax else number(header[136:148])
+            permissions = number(header[100:108]) & 0o7777
+            if kind == b"5":
+                mode = stat.S_IFDIR | permissions
+            elif kind == b"2":
+                mode = stat.S_IFLNK | permissions
+            elif kind in (b"3", b"4", b"6"):
+                mode = {b"3": stat.S_IFCHR, b"4": stat.S_IFBLK, b"6": stat.S_IFIFO}[kind] | permissions
+            else:
+                mode = stat.S_IFREG | permissions
+            builder.add(name, size, mtime, mode, data, size)
+            long_name = None
+            pax = {}
+            if padded:
+                f.seek(padded, io.SEEK_CUR)
+        return builder.finish()
+
+    def _open_member(self, path, folder, row):
+        return _Slice(self._opener, folder.offsets[row], folder.lengths[row])
+
+
+# --- choix du backend
+
+_archives = OrderedDict()  # chemin de l'archive -> backend, du moins au plus récent
+_archives_lock = threading.Lock()
+
+
+def _archive_backend(archive, st):
+    with _archives_lock:
+        backend = _archives.get(archive)
+        if backend is not None and backend.stamp == (st.st_size, st.st_mtime):
+            _archives.move_to_end(archive)
+            return backend
+        backend = (ZipBackend if archive_kind(archive) == "zip" else TarBackend)(archive, st)
+        _archives[archive] = backend
+        while len(_archives) > MAX_ARCHIVES:
+            _archives.popitem(last=False)
+        return backend
+
+
+def backend_for(path):
+    """
+    @return : backend qui sert path : LOCAL, ou celui de l'archive qui le contient
+    """
+    probe = path
+    while True:
+        try:
+            st = os.stat(probe)
+        except (FileNotFoundError, NotADirectoryError):
+            parent = os.path.dirname(probe)
+            if parent == probe:
+                return LOCAL
+            probe = parent
+            continue
+        except OSError:
+            return LOCAL
+        if stat.S_ISREG(st.st_mode) and archive_kind(probe):
+            return _archive_backend(probe, st)
+        return LOCAL
+
+
+def is_folder(path):
+    """
+    @return : True si path se parcourt comme un dossier (dossier local,
+              archive ou dossier d'une archive)
+    """
+    backend = backend_for(path)
+    if backend.local:
+        return os.path.isdir(path)
+    try:
+        return backend.is_dir(path)
+    except OSError:
+        return False
+
@@ -0,0 +1,520 @@
+# -*- coding: utf-8 -*-
+"""
+Mesures de performance de l'explorateur.
+
+Usage :
+    python -m explorer.benchmarks memory --count 5000000
+    python -m explorer.benchmarks suite --scale 0.1 --output avant.json
+    python -m explorer.benchmarks compare avant.json apres.json
+    python -m explorer.benchmarks startup --folder /usr/share --runs 10
+
+La suite crée des arborescences synthétiques dans un dossier temporaire
+(très large, très profonde, un million de petits fichiers, liens
+symboliques) et pilote ExploreClockScreen sur la plateforme Qt offscreen :
+délai avant la première ligne après un clic dans l'arborescence, délai de
+dépliage d'un noeud, pic de mémoire résidente et nombre d'appels système.
+Chaque arborescence est mesurée dans un processus neuf, avec des caches
+vides.
+
+La mesure startup lance la fenêtre plusieurs fois dans des processus neufs
+et note le délai entre le lancement et la première peinture de la liste
+remplie : la première fois sans cache ni session, ensuite avec la session
+et le cache des dossiers laissés par le lancement précédent.
+
+Chaque mesure écrit une ligne JSON sur la sortie standard.
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import stat
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from explorer.entrystore import EntryStore
+
+
+def synthetic_entries(count):
+    """
+    Entrées d'un dossier fictif de count fichiers, sans toucher au disque.
+    """
+    now = time.time()
+    mode = stat.S_IFREG | 0o644
+    for i in range(count):
+        yield "file_{0:08d}.dat".format(i), i * 37 % 1000003, now - i, mode
+
+
+def bench_entry_memory(count):
+    """
+    Compare la mémoire par entrée d'une liste de tuples (un objet Python par
+    ligne, comme avant) et de l'EntryStore en colonnes.
+    """
+    tracemalloc.start()
+    rows = list(synthetic_entries(count))
+    before = tracemalloc.get_traced_memory()[0]
+    del rows
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    store = EntryStore()
+    store.extend(synthetic_entries(count))
+    after = tracemalloc.get_traced_memory()[0]
+    del store
+    tracemalloc.stop()
+
+    return {
+        "bench": "entry_memory",
+        "count": count,
+        "bytes_per_entry_before": before / count,
+        "bytes_per_entry_after": after / count,
+    }
+
+
+TREE_KINDS = ("wide", "deep", "small", "symlinks")
+WIDE_FILES = 200000
+DEEP_LEVELS = 200
+DEEP_FILES = 10  # fichiers par niveau
+SMALL_DIRS = 1000
+SMALL_FILES = 1000  # fichiers par dossier
+SYMLINKS = 20000
+WAIT_TIMEOUT = 120.0
+
+
+def _touch(path, data=b""):
+    fd = os.open(path, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o644)
+    try:
+        if data:
+            os.write(fd, data)
+    finally:
+        os.close(fd)
+
+
+def make_tree(kind, root, scale=1.0):
+    """
+    Crée dans root (qui doit exister) l'arborescence synthétique kind.
+    @return : nombre d'entrées créées
+    """
+    def scaled(n):
+        return max(1, int(n * scale))
+
+    count = 0
+    if kind == "wide":
+        for i in range(scaled(WIDE_FILES)):
+            _touch(os.path.join(root, "file_{0:07d}.txt".format(i)))
+        count = scaled(WIDE_FILES)
+    elif kind == "deep":
+        path = root
+        for level in range(scaled(DEEP_LEVELS)):
+            path = os.path.join(path, "level_{0:03d}".format(level))
+            os.mkdir(path)
+            for i in range(DEEP_FILES):
+                _touch(os.path.join(path, "file_{0}.txt".format(i)))
+            count += DEEP_FILES + 1
+    elif kind == "small":
+        files = scaled(SMALL_FILES)
+        for d in range(SMALL_DIRS):
+            path = os.path.join(root, "dir_{0:04d}".format(d))
+            os.mkdir(path)
+            for i in range(files):
+                _touch(os.path.join(path, "f{0:04d}".format(i)), b"x" * (i % 64))
+            count += files + 1
+    elif kind == "symlinks":
+        targets = os.path.join(root, "targets")
+        os.mkdir(targets)
+        _touch(os.path.join(targets, "file.txt"), b"data")
+        os.mkdir(os.path.join(targets, "dir"))
+        links = os.path.join(root, "links")
+        os.mkdir(links)
+        # vers un fichier, vers un dossier, cassé : trois cas pour stat
+        choices = ("../targets/file.txt", "../targets/dir", "../targets/absent")
+        for i in range(scaled(SYMLINKS)):
+            os.symlink(choices[i % 3], os.path.join(links, "link_{0:06d}".format(i)))
+        count = scaled(SYMLINKS) + 4
+    else:
+        raise ValueError("arborescence inconnue : {0}".format(kind))
+    return count
+
+
+def bench_tree(kind, root, scale=1.0):
+    os.makedirs(root, exist_ok=True)
+    start = time.perf_counter()
+    count = make_tree(kind, root, scale)
+    return {"bench": "tree", "tree": kind, "root": root, "entries": count,
+            "seconds": time.perf_counter() - start}
+
+
+def _proc_io():
+    """
+    Appels système de lecture et d'écriture du processus (Linux).
+    """
+    counters = {}
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("syscr", "syscw"):
+                    counters[key] = int(value)
+    except OSError:
+        pass
+    return counters
+
+
+def _peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak  # octets sous macOS
+
+
+def _wait(app, predicate, timeout=WAIT_TIMEOUT):
+    """
+    Fait tourner la boucle d'événements jusqu'à ce que predicate() soit vrai.
+    @return : durée en millisecondes, ou None en cas de dépassement
+    """
+    start = time.perf_counter()
+    while not predicate():
+        if time.perf_counter() - start > timeout:
+            return None
+        app.processEvents()
+        time.sleep(0.0005)
+    return (time.perf_counter() - start) * 1000
+
+
+class _Measure(object):
+    """
+    Compteurs du DirectoryService et de /proc/self/io sur une durée.
+    """
+
+    def __init__(self, service):
+        self.service = service
+        service.stats.reset()
+        self.io = _proc_io()
+
+    def result(self):
+        io = _proc_io()
+        counters = dict(self.service.stats.counters)
+        for key, value in io.items():
+            counters[key] = value - self.io.get(key, 0)
+        return counters
+
+
+def _tree_index(app, window, path):
+    """
+    Déplie l'arborescence de la fenêtre jusqu'à path.
+    @return : l'index de path dans le modèle de l'arborescence
+    """
+    model = window.dirModel
+    view = window.ui.treeView
+    index = view.rootIndex()
+    current = model.rootPath()
+    rel = os.path.relpath(path, current)
+    for name in rel.split(os.sep):
+        view.expand(index)
+        if model.canFetchMore(index):
+            model.fetchMore(index)
+        found = []
+
+        def lookup():
+            for row in range(model.rowCount(index)):
+                child = model.index(row, 0, index)
+                if model.data(child) == name:
+                    found.append(child)
+                    return True
+            return False
+        if _wait(app, lookup) is None:
+            raise RuntimeError("{0} absent de l'arborescence".format(os.path.join(current, name)))
+        index = found[0]
+        current = os.path.join(current, name)
+    return index
+
+
+def _expand_ms(app, window, index):
+    """
+    Délai entre le dépliage d'un noeud et l'affichage de ses sous-dossiers.
+    """
+    model = window.dirModel
+    path = model.filePath(index)
+    start = time.perf_counter()
+    window.ui.treeView.expand(index)
+    if model.canFetchMore(index):
+        model.fetchMore(index)
+
+    def ready():
+        snap = model.service.snapshot(path)
+        return model.rowCount(index) > 0 or (snap is not None and snap.complete)
+    if _wait(app, ready) is None:
+        return None
+    return (time.perf_counter() - start) * 1000
+
+
+def bench_gui(kind, root):
+    """
+    Pilote la fenêtre principale sur l'arborescence root (créée par make_tree).
+    """
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    os.environ["XDG_CACHE_HOME"] = tempfile.mkdtemp(prefix="explorer-bench-cache-")
+    os.environ["EXPLORER_DIRCACHE"] = "0"
+    from PyQt5.QtWidgets import QApplication
+    from explorer.start_explorer import ExploreClockScreen
+
+    app = QApplication.instance() or QApplication([sys.argv[0]])
+    start = time.perf_counter()
+    window = ExploreClockScreen()
+    window.resize(1024, 768)
+    window.show()
+    app.processEvents()
+    result = {"bench": "gui", "tree": kind, "root": root,
+              "startup_ms": (time.perf_counter() - start) * 1000}
+
+    if kind == "symlinks":
+        root = os.path.join(root, "links")
+    index = _tree_index(app, window, root)
+    model = window.fileModel
+    loaded = []
+    model.directoryLoaded.connect(loaded.append)
+
+    # clic dans l'arborescence : première ligne puis dossier complet
+    measure = _Measure(window.dirService)
+    start = time.perf_counter()
+    window.on_clicked(index)
+    first = _wait(app, lambda: model.rowCount() > 0 or root in loaded)
+    full = _wait(app, lambda: root in loaded)
+    result["first_row_ms"] = first
+    result["loaded_ms"] = (time.perf_counter() - start) * 1000 if full is not None else None
+    result["rows"] = len(model.entries())
+    result["click_counters"] = measure.result()
+
+    # dépliage du même dossier : l'instantané de la liste est réutilisé
+    measure = _Measure(window.dirService)
+    result["expand_ms"] = _expand_ms(app, window, index)
+    result["expand_counters"] = measure.result()
+
+    if kind in ("deep", "small"):
+        # dépliage de dossiers jamais visités, niveau par niveau ou voisin par voisin
+        measure = _Measure(window.dirService)
+        latencies = []
+        for _ in range(50):
+            model_tree = window.dirModel
+            if model_tree.rowCount(index) == 0:
+                break
+            child = model_tree.index(0 if kind == "deep" else len(latencies), 0, index)
+            if not child.isValid():
+                break
+            latency = _expand_ms(app, window, child)
+            if latency is None:
+                break
+            latencies.append(latency)
+            if kind == "deep":
+                index = child
+        if latencies:
+            result["expand_new_ms"] = {"count": len(latencies),
+                                       "median": statistics.median(latencies),
+                                       "max": max(latencies)}
+        result["expand_new_counters"] = measure.result()
+
+    result["peak_rss_kb"] = _peak_rss_kb()
+    window.close()
+    shutil.rmtree(os.environ["XDG_CACHE_HOME"], ignore_errors=True)
+    return result
+
+
+def startup_window(launched):
+    """
+    Processus fils de bench_startup : lance la fenêtre comme main() et note
+    l'heure (time.monotonic, commune aux processus) de la première peinture
+    de la liste remplie, puis celle de la fin de la seconde phase.
+    @param launched : time.monotonic() du parent juste avant le lancement
+    """
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtCore import QEvent, QObject
+    from PyQt5.QtWidgets import QApplication
+    from explorer.start_explorer import ExploreClockScreen
+
+    app = QApplication.instance() or QApplication([sys.argv[0]])
+    window = ExploreClockScreen()
+    painted = []
+
+    class PaintWatch(QObject):
+        def eventFilter(self, obj, event):
+            if event.type() == QEvent.Paint and not painted and window.fileModel.rowCount() > 0:
+                painted.append(time.monotonic())
+            return False
+
+    watch = PaintWatch()
+    window.ui.listView.viewport().installEventFilter(watch)
+    window.resize(1024, 768)
+    window.show()
+    if _wait(app, lambda: painted, timeout=30) is None:
+        painted.append(None)
+    _wait(app, lambda: window._deferred_done, timeout=30)
+    deferred = time.monotonic()
+    result = {"bench": "startup_window", "folder": window.fileModel.rootPath(),
+              "usable_ms": (painted[0] - launched) * 1000 if painted[0] else None,
+              "deferred_ms": (deferred - launched) * 1000}
+    window.close()
+    return result
+
+
+def bench_startup(folder, runs):
+    """
+    Délai de démarrage jusqu'à une fenêtre utilisable sur folder : un
+    lancement à froid (ni cache ni session) puis runs - 1 lancements qui
+    reprennent la session et le cache du précédent.
+    """
+    from explorer.session import Session
+    cache = tempfile.mkdtemp(prefix="explorer-bench-cache-")
+    env = dict(os.environ, XDG_CACHE_HOME=cache)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    os.environ["XDG_CACHE_HOME"] = cache
+    Session(folder).save()  # la session seule : le cache des dossiers est vide
+    usable, deferred = [], []
+    try:
+        for _ in range(runs):
+            launched = time.monotonic()
+            proc = subprocess.run([sys.executable, "-m", "explorer.benchmarks", "startup-window",
+                                   "--launched", repr(launched)],
+                                  stdout=subprocess.PIPE, universal_newlines=True, env=env)
+            lines = [line for line in proc.stdout.splitlines() if line.startswith("{")]
+            if proc.returncode or not lines:
+                return {"bench": "startup", "folder": folder, "error": proc.returncode}
+            result = json.loads(lines[-1])
+            usable.append(result["usable_ms"])
+            deferred.append(result["deferred_ms"])
+    finally:
+        shutil.rmtree(cache, ignore_errors=True)
+    result = {"bench": "startup", "folder": folder, "runs": runs,
+              "cold": {"usable_ms": usable[0], "deferred_ms": deferred[0]}}
+    warm = [value for value in usable[1:] if value is not None]
+    if warm:
+        result["warm"] = {"usable_ms": statistics.median(warm), "usable_max_ms": max(warm),
+                          "deferred_ms": statistics.median(deferred[1:])}
+    return result
+
+
+def run_suite(kinds, scale, workdir=None, keep=False):
+    """
+    Crée chaque arborescence puis la mesure dans un processus neuf.
+    @return : liste des résultats (dictionnaires)
+    """
+    base = tempfile.mkdtemp(prefix="explorer-bench-", dir=workdir)
+    results = []
+    try:
+        for kind in kinds:
+            root = os.path.join(base, kind)
+            tree = bench_tree(kind, root, scale)
+            tree["scale"] = scale
+            results.append(tree)
+            print(json.dumps(tree), flush=True)
+            proc = subprocess.run([sys.executable, "-m", "explorer.benchmarks", "gui",
+                                   "--tree", kind, "--root", root],
+                                  stdout=subprocess.PIPE, universal_newlines=True)
+            for line in proc.stdout.splitlines():
+                if line.startswith("{"):
+                    result = json.loads(line)
+                    result["scale"] = scale
+                    results.append(result)
+                    print(json.dumps(result), flush=True)
+            if proc.returncode:
+                failure = {"bench": "gui", "tree": kind, "error": proc.returncode}
+                results.append(failure)
+                print(json.dumps(failure), flush=True)
+    finally:
+        if not keep:
+            shutil.rmtree(base, ignore_errors=True)
+    return results
+
+
+def _numbers(result, prefix=""):
+    for key, value in result.items():
+        if isinstance(value, dict):
+            for item in _numbers(value, prefix + key + "."):
+                yield item
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield prefix + key, value
+
+
+def compare(old_path, new_path):
+    """
+    Compare deux fichiers de résultats : une ligne JSON par mesure commune,
+    avec le rapport nouveau / ancien.
+    """
+    def load(path):
+        runs = {}
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    result = json.loads(line)
+                    runs[(result["bench"], result.get("tree"))] = result
+        return runs
+
+    old, new = load(old_path), load(new_path)
+    for key in sorted(set(old) & set(new), key=str):
+        before = dict(_numbers(old[key]))
+        for name, value in _numbers(new[key]):
+            if name in before and name != "scale":
+                ratio = value / before[name] if before[name] else None
+                yield {"bench": key[0], "tree": key[1], "metric": name,
+                       "old": before[name], "new": value, "ratio": ratio}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="explorer.benchmarks")
+    sub = parser.add_subparsers(dest="bench")
+    memory = sub.add_parser("memory", help="mémoire par entrée d'un dossier géant")
+    memory.add_argument("--count", type=int, default=5000000)
+    tree = sub.add_parser("tree", help="crée une arborescence synthétique")
+    tree.add_argument("--tree", choices=TREE_KINDS, required=True)
+    tree.add_argument("--root", required=True)
+    tree.add_argument("--scale", type=float, default=1.0)
+    gui = sub.add_parser("gui", help="mesure la fenêtre sur une arborescence existante")
+    gui.add_argument("--tree", choices=TREE_KINDS, required=True)
+    gui.add_argument("--root", required=True)
+    suite = sub.add_parser("suite", help="crée et mesure toutes les arborescences")
+    suite.add_argument("--tree", choices=TREE_KINDS, action="append")
+    suite.add_argument("--scale", type=float, default=1.0)
+    suite.add_argument("--dir", help="dossier de travail (par défaut : dossier temporaire)")
+    suite.add_argument("--output", help="fichier de résultats (une ligne JSON par mesure)")
+    suite.add_argument("--keep", action="store_true", help="garder les arborescences")
+    startup = sub.add_parser("startup", help="délai de démarrage jusqu'à une fenêtre utilisable")
+    startup.add_argument("--folder", default=os.path.expanduser("~"))
+    startup.add_argument("--runs", type=int, default=10)
+    window = sub.add_parser("startup-window", help=argparse.SUPPRESS)
+    window.add_argument("--launched", type=float, required=True)
+    comp = sub.add_parser("compare", help="compare deux fichiers de résultats")
+    comp.add_argument("old")
+    comp.add_argument("new")
+    args = parser.parse_args(argv)
+
+    if args.bench == "memory":
+        result = bench_entry_memory(args.count)
+    elif args.bench == "tree":
+        result = bench_tree(args.tree, os.path.abspath(args.root), args.scale)
+    elif args.bench == "gui":
+        result = bench_gui(args.tree, os.path.abspath(args.root))
+    elif args.bench == "startup":
+        result = bench_startup(os.path.abspath(args.folder), max(args.runs, 1))
+    elif args.bench == "startup-window":
+        result = startup_window(args.launched)
+    elif args.bench == "suite":
+        results = run_suite(args.tree or TREE_KINDS, args.scale, args.dir, args.keep)
+        if args.output:
+            with open(args.output, "w") as f:
+                for result in results:
+                    f.write(json.dumps(result) + "\n")
+        return 0
+    elif args.bench == "compare":
+        for line in compare(args.old, args.new):
+            print(json.dumps(line))
+        return 0
+    else:
+        parser.print_help()
+        return 1
+    print(json.dumps(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
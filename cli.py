@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+Mode sans interface : listes, tailles et recherches en NDJSON.
+
+    python -m explorer.start_explorer --list DOSSIER [--sort name] [--filter '*.log']
+    python -m explorer.start_explorer --du DOSSIER
+    python -m explorer.start_explorer --search TEXTE
+    python -m explorer.start_explorer --grep TEXTE DOSSIER
+    python -m explorer.start_explorer --compare GAUCHE DROITE [--contents]
+
+Les résultats sont ceux de l'explorateur : même énumération (backends,
+archives comprises), même cache des dossiers, même tri naturel et même
+filtre à jokers (ordering), même index des noms, même recherche dans le
+contenu, même comparaison de dossiers. Chaque commande est un générateur
+de lots d'objets JSON, écrits une ligne par objet au fur et à mesure : la
+mémoire ne dépend pas du nombre de résultats, sauf pour un tri qui doit
+connaître tout le dossier. Un dossier illisible est signalé sur la sortie
+d'erreur, avec un code de sortie non nul.
+
+La sortie est toujours en UTF-8 valide, quel que soit l'encodage de la
+console. Un nom qui n'est pas de l'UTF-8 (gardé par os.fsdecode en
+surrogateescape) est écrit en échappements JSON (\\udcXX), que json.loads relit.
+
+Les modules ne sont importés que par la commande qui s'en sert, pour
+démarrer vite.
+
+Aucune dépendance Qt.
+"""
+import argparse
+import json
+import os
+import stat
+import sys
+
+CACHE_MAX_ROWS = 256 * 1024  # au-delà, un dossier listé n'est pas gardé en cache
+BATCH_SIZE = 1024  # objets écrits entre deux vidages de la sortie
+
+
+def _kind(mode):
+    if stat.S_ISDIR(mode):
+        return "dir"
+    if stat.S_ISREG(mode):
+        return "file"
+    if stat.S_ISLNK(mode):
+        return "link"
+    return "other"
+
+
+def _record(folder, entry):
+    name, size, mtime, mode = entry
+    return {"path": os.path.join(folder, name), "name": name, "type": _kind(mode), "size": size, "mtime": mtime}
+
+
+def _batches(path, cache, cached):
+    """
+    Enumère path comme le DirectoryService (et complète le cache comme lui).
+    @param cached : se contenter de la liste en cache si le dossier n'a pas changé
+    @return : générateur de lots d'entrées (nom, taille, mtime, mode)
+    """
+    from explorer.backends import backend_for
+    from explorer.entrystore import EntryStore
+
+    backend = backend_for(path)
+    mtime = backend.mtime(path)
+    if not backend.local:
+        cache = None
+    if cache is not None and cached:
+        hit = cache.get(path)
+        if hit is not None and hit[0] == mtime:
+            store = hit[1]
+            for start in range(0, len(store), BATCH_SIZE):
+                yield [store.entry(i) for i in range(start, min(len(store), start + BATCH_SIZE))]
+            return
+    store = EntryStore() if cache is not None and cache.enabled else None
+    for batch in backend.iter_batches(path):
+        yield batch
+        if store is not None:
+            store.extend(batch)
+            if len(store) > CACHE_MAX_ROWS:
+                store = None  # trop gros pour le cache
+    if store is not None:
+        cache.put(path, mtime, store.to_columns())
+
+
+def list_folder(path, sort="none", descending=False, pattern=None, cached=False, cache=None):
+    """
+    @return : générateur de lots d'entrées du dossier path, triées et
+              filtrées comme dans le panneau de liste
+    """
+    from explorer.entrystore import EntryStore
+    from explorer.ordering import SortColumns, match_mask, wildcard
+
+    regex = wildcard(pattern or "")
+    if sort == "none":
+        for batch in _batches(path, cache, cached):
+            if regex is not None:
+                store = EntryStore()
+                store.extend(batch)
+                batch = [entry for entry, keep in zip(batch, match_mask(store, 0, len(store), regex)) if keep]
+            if batch:
+                yield [_record(path, entry) for entry in batch]
+        return
+    store = EntryStore()
+    for batch in _batches(path, cache, cached):
+        store.extend(batch)
+    columns = SortColumns(store)
+    columns.extend(len(store), names=sort == "name")
+    rows = range(len(store))
+    if regex is not None:
+        rows = [row for row, keep in zip(rows, match_mask(store, 0, len(store), regex)) if keep]
+    order = columns.argsort(rows, sort, descending)
+    for start in range(0, len(order), BATCH_SIZE):
+        yield [_record(path, store.entry(row)) for row in order[start:start + BATCH_SIZE]]
+
+
+def disk_usage(path):
+    """
+    Taille récursive de chaque sous-dossier de path, au fur et à mesure
+    qu'ils sont terminés, puis le total (champ "total").
+    """
+    import queue
+    import threading
+
+    from explorer.foldersize import FolderSizeWalker
+
+    done = queue.Queue()
+
+    def on_subtree(subtree, nbytes, files, dirs):
+        if os.path.dirname(subtree) == path:
+            done.put({"path": subtree, "bytes": nbytes, "files": files, "dirs": dirs})
+
+    walker = FolderSizeWalker(path, on_subtree=on_subtree)
+    result = []
+    thread = threading.Thread(target=lambda: (result.append(walker.run()), done.put(None)), daemon=True)
+    thread.start()
+    while True:
+        item = done.get()
+        if item is None:
+            break
+        batch = [item]
+        while len(batch) < BATCH_SIZE and not done.empty():
+            item = done.get()
+            if item is None:
+                done.put(None)
+                break
+            batch.append(item)
+        yield batch
+    nbytes, files, dirs = result[0] or (0, 0, 0)
+    yield [{"path": path, "bytes": nbytes, "files": files, "dirs": dirs, "total": True, "errors": walker.errors}]
+
+
+def search_names(query, limit):
+    """
+    Recherche dans l'index des noms de l'explorateur.
+    """
+    from explorer.search_index import SearchIndex
+
+    yield [{"path": path, "name": os.path.basename(path)} for path in SearchIndex.load().search(query, limit)]
+
+
+def search_contents(text, path, regex=False):
+    """
+    Recherche de text dans le contenu des fichiers de path, lot par lot.
+    """
+    import queue
+
+    from explorer.contentsearch import ContentSearch
+
+    os.scandir(path).close()  # dossier absent ou illisible : OSError, comme --list
+    found = queue.Queue()
+    search = ContentSearch(path, text, regex=regex, on_hits=lambda s, results: found.put(results),
+                           on_finished=lambda s: found.put(None))
+    search.start()
+    try:
+        while True:
+            results = found.get()
+            if results is None:
+                break
+            yield [{"path": hit_path, "line": line, "text": line_text}
+                   for hit_path, hits in results for line, line_text in hits]
+        if search.truncated:
+            yield [{"truncated": True}]
+    finally:
+        search.cancel()
+
+
+def compare_folders(left, right, check_contents=False):
+    """
+    Différences entre left et right, lot par lot.
+    """
+    import queue
+
+    from explorer.compare import TreeComparison
+
+    found = queue.Queue()
+    comparison = TreeComparison(left, right, check_contents, on_diffs=lambda c, diffs: found.put(diffs),
+                                on_finished=lambda c: found.put(None))
+    comparison.start()
+    try:
+        while True:
+            diffs = found.get()
+            if diffs is None:
+                break
+            yield [{"path": path, "status": status, "detail": detail} for path, status, detail in diffs]
+        if comparison.truncated:
+            yield [{"truncated": True}]
+    finally:
+        comparison.cancel()
+
+
+def _parser():
+    parser = argparse.ArgumentParser(prog="explorer", description="Explorateur sans interface (sortie NDJSON).")
+    command = parser.add_mutually_exclusive_group(required=True)
+    command.add_argument("--list", metavar="DOSSIER", help="contenu d'un dossier (ou d'une archive)")
+    command.add_argument("--du", metavar="DOSSIER", help="taille récursive des sous-dossiers")
+    command.add_argument("--search", metavar="TEXTE", help="recherche dans l'index des noms")
+    command.add_argument("--grep", nargs=2, metavar=("TEXTE", "DOSSIER"), help="recherche dans le contenu")
+    command.add_argument("--compare", nargs=2, metavar=("GAUCHE", "DROITE"), help="différences entre deux dossiers")
+    parser.add_argument("--sort", choices=("none", "name", "size", "mtime"), default="none")
+    parser.add_argument("--reverse", action="store_true", help="ordre décroissant")
+    parser.add_argument("--filter", metavar="MOTIF", help="motif à jokers sur les noms (*.txt)")
+    parser.add_argument("--cached", action="store_true",
+                        help="liste en cache si le dossier n'a pas changé, sans le relire")
+    parser.add_argument("--no-cache", action="store_true", help="ni lecture ni écriture du cache des dossiers")
+    parser.add_argument("--regex", action="store_true", help="TEXTE de --grep est une expression régulière")
+    parser.add_argument("--contents", action="store_true",
+                        help="--compare relit les fichiers de même taille dont seule la date diffère")
+    parser.add_argument("--limit", type=int, default=50, help="résultats de --search")
+    return parser
+
+
+def _line(record):
+    """
+    @return : record en une ligne JSON, en octets UTF-8
+    """
+    try:
+        return (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+    except UnicodeEncodeError:
+        return (json.dumps(record) + "\n").encode("ascii")  # nom non décodable : échappé
+
+
+def _write(batches, out):
+    """
+    @param out : sortie binaire
+    """
+    for batch in batches:
+        out.write(b"".join(_line(record) for record in batch))
+        out.flush()
+
+
+def main(argv=None):
+    """
+    @return : code de sortie
+    """
+    args = _parser().parse_args(argv)
+    if args.list is not None:
+        cache = None
+        if not args.no_cache:
+            from explorer.dircache import DirectoryCache
+            cache = DirectoryCache()
+        batches = list_folder(os.path.abspath(args.list), args.sort, args.reverse, args.filter, args.cached, cache)
+    elif args.du is not None:
+        batches = disk_usage(os.path.abspath(args.du))
+    elif args.search is not None:
+        batches = search_names(args.search, args.limit)
+    elif args.compare is not None:
+        batches = compare_folders(os.path.abspath(args.compare[0]), os.path.abspath(args.compare[1]), args.contents)
+    else:
+        batches = search_contents(args.grep[0], os.path.abspath(args.grep[1]), args.regex)
+    try:
+        _write(batches, sys.stdout.buffer)
+    except BrokenPipeError:
+        # lecteur parti (| head) : pas de message d'erreur à la fermeture de la sortie
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+    except OSError as e:
+        sys.stderr.write("{0}\n".format(e))
+        return 1
+    finally:
+        batches.close()
+    return 0
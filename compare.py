@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Comparaison de deux arborescences (un dossier et son miroir, par exemple).
+
+Les deux arbres sont parcourus ensemble, dossier relatif par dossier
+relatif : chaque paire de dossiers est lue (scandir des deux côtés) par un
+thread du pool, et ses entrées sont comparées par nom, type, taille et date
+de modification. Un dossier présent d'un seul côté est signalé une fois,
+sans être parcouru.
+
+Deux fichiers de même taille dont seule la date diffère peuvent être
+départagés par leur contenu : ils sont relus ensemble par morceaux de
+READ_CHUNK octets, et la lecture s'arrête au premier morceau différent.
+
+La mémoire ne dépend pas de la taille des arbres : les tâches en cours sont
+bornées (MAX_PENDING), les vérifications de contenu passent avant les
+dossiers suivants, et seules les différences sont remontées, au plus
+MAX_DIFFS ; au-delà, la comparaison s'arrête et se signale incomplète.
+
+Aucune dépendance Qt.
+"""
+import os
+import stat
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+WORKERS = min(16, (os.cpu_count() or 1) * 2)
+MAX_PENDING = WORKERS * 4  # dossiers et vérifications soumis et pas encore terminés
+READ_CHUNK = 1024 * 1024
+MTIME_SLACK = 2.0  # secondes : précision des dates sur FAT
+PROGRESS_INTERVAL = 0.1
+MAX_DIFFS = 200000
+LEFT_ONLY, RIGHT_ONLY = "seulement à gauche", "seulement à droite"
+FOLDER = "dossier"  # détail d'un dossier présent d'un seul côté
+KIND, SIZE, CONTENTS, DATE = "type différent", "taille différente", "contenu différent", "date différente"
+
+
+def same_contents(left, right, cancelled=None):
+    """
+    @return : True si les deux fichiers ont le même contenu, None si la
+              lecture a été annulée
+    """
+    with open(left, "rb") as a, open(right, "rb") as b:
+        while True:
+            if cancelled is not None and cancelled.is_set():
+                return None
+            chunk = a.read(READ_CHUNK)
+            if chunk != b.read(READ_CHUNK):
+                return False
+            if not chunk:
+                return True
+
+
+def _entries(path):
+    """
+    @return : {nom : stat sans suivre les liens} du dossier path, et le
+              nombre d'entrées illisibles
+    """
+    found = {}
+    errors = 0
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    found[entry.name] = entry.stat(follow_symlinks=False)
+                except OSError:
+                    errors += 1
+    except OSError:
+        errors += 1
+    return found, errors
+
+
+class TreeComparison(object):
+    """
+    Une comparaison de left et right, dans un thread.
+    on_diffs(comparaison, [(chemin relatif, état, détail)]), on_progress(comparaison)
+    et on_finished(comparaison) sont appelés depuis ce thread.
+
+    @param check_contents : relire les fichiers de même taille dont la date diffère
+    """
+
+    def __init__(self, left, right, check_contents=False, workers=WORKERS,
+                 on_diffs=None, on_progress=None, on_finished=None):
+        self.left = left
+        self.right = right
+        self.check_contents = check_contents
+        self.workers = workers
+        self.on_diffs = on_diffs
+        self.on_progress = on_progress
+        self.on_finished = on_finished
+        self.folders = 0  # paires de dossiers comparées
+        self.files = 0  # fichiers comparés
+        self.checked = 0  # fichiers relus pour comparer leur contenu
+        self.differences = 0
+        self.errors = 0
+        self.truncated = False  # MAX_DIFFS atteint : résultats incomplets
+        self.done = False
+        self._cancelled = threading.Event()
+        self._last_progress = 0.0
+
+    def start(self):
+        threading.Thread(target=self._run, name="compare", daemon=True).start()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def _progress(self, force=False):
+        now = time.monotonic()
+        if self.on_progress is not None and (force or now - self._last_progress >= PROGRESS_INTERVAL):
+            self._last_progress = now
+            self.on_progress(self)
+
+    def _run(self):
+        try:
+            self._compare()
+        finally:
+            self.done = True
+            if self.on_finished is not None:
+                self.on_finished(self)
+
+    def _compare(self):
+        folders = [""]  # dossiers relatifs à comparer, en profondeur d'abord
+        suspects = []  # (chemin relatif, détail) à relire
+        pending = set()
+        with ThreadPoolExecutor(self.workers) as executor:
+            while (folders or suspects or pending) and not self._cancelled.is_set():
+                while len(pending) < MAX_PENDING and (suspects or folders):
+                    if suspects:
+                        pending.add(executor.submit(self._check, *suspects.pop()))
+                    else:
+                        pending.add(executor.submit(self._folder, folders.pop()))
+                done, pending = wait(pending, PROGRESS_INTERVAL, FIRST_COMPLETED)
+                diffs = []
+                for future in done:
+                    subfolders, found, unsure, counts = future.result()
+                    self.folders += counts[0]
+                    self.files += counts[1]
+                    self.checked += counts[2]
+                    self.errors += counts[3]
+                    folders.extend(subfolders)
+                    suspects.extend(unsure)
+                    diffs.extend(found)
+                self._report(diffs)
+                self._progress()
+            for future in pending:
+                future.cancel()
+        self._progress(force=True)
+
+    def _report(self, diffs):
+        if not diffs or self.truncated:
+            return
+        if self.differences + len(diffs) > MAX_DIFFS:
+            diffs = diffs[:MAX_DIFFS - self.differences]
+            self.truncated = True
+            self._cancelled.set()
+        self.differences += len(diffs)
+        if diffs and self.on_diffs is not None:
+            self.on_diffs(self, diffs)
+
+    def _folder(self, relative):
+        """
+        Exécuté dans un thread du pool.
+        @return : (sous-dossiers communs, différences, fichiers à relire,
+                  (dossiers, fichiers, fichiers relus, erreurs))
+        """
+        left, errors = _entries(os.path.join(self.left, relative))
+        right, more = _entries(os.path.join(self.right, relative))
+        subfolders, diffs, unsure = [], [], []
+        files = 0
+        for name in sorted(left.keys() | right.keys()):
+            path = os.path.join(relative, name)
+            a, b = left.get(name), right.get(name)
+            if b is None or a is None:
+                st = a or b
+                detail = FOLDER if stat.S_ISDIR(st.st_mode) else "{0} octets".format(st.st_size)
+                diffs.append((path, LEFT_ONLY if b is None else RIGHT_ONLY, detail))
+                continue
+            if stat.S_ISDIR(a.st_mode) and stat.S_ISDIR(b.st_mode):
+                subfolders.append(path)
+                continue
+            files += 1
+            if stat.S_IFMT(a.st_mode) != stat.S_IFMT(b.st_mode):
+                diffs.append((path, KIND, ""))
+            elif a.st_size != b.st_size:
+                diffs.append((path, SIZE, "{0} / {1} octets".format(a.st_size, b.st_size)))
+            elif abs(a.st_mtime - b.st_mtime) > MTIME_SLACK:
+                detail = "{0} / {1}".format(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(a.st_mtime)),
+                                            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(b.st_mtime)))
+                if self.check_contents and stat.S_ISREG(a.st_mode) and a.st_size:
+                    unsure.append((path, detail))
+                else:
+                    diffs.append((path, DATE, detail))
+        return subfolders, diffs, unsure, (1, files, 0, errors + more)
+
+    def _check(self, relative, detail):
+        """
+        Exécuté dans un thread du pool.
+        @return : comme _folder
+        """
+        try:
+            same = same_contents(os.path.join(self.left, relative), os.path.join(self.right, relative),
+                                 self._cancelled)
+        except OSError:
+            return [], [(relative, DATE, detail + " (illisible)")], [], (0, 0, 0, 1)
+        if same is None or same:
+            return [], [], [], (0, 0, 1, 0)
+        return [], [(relative, CONTENTS, detail)], [], (0, 0, 1, 0)
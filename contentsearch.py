@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Recherche d'un texte dans le contenu des fichiers d'un dossier et de ses
+sous-dossiers.
+
+Un thread parcourt l'arborescence (scandir) et envoie les fichiers par lots
+à un pool de processus. Chaque processus projette le fichier en mémoire
+(mmap) et y cherche le motif avec re, directement sur les octets : ni
+décodage ni lecture ligne par ligne. Les fichiers binaires sont écartés
+d'après leurs premiers octets (signatures connues, octets nuls).
+
+Les lots en attente sont bornés (MAX_PENDING) : le parcours attend les
+processus, et la mémoire occupée ne dépend pas de la taille de
+l'arborescence. Les résultats gardés sont bornés par un budget en octets ;
+une fois le budget atteint, la recherche s'arrête et se signale incomplète.
+
+Aucune dépendance Qt.
+"""
+import mmap
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from explorer.preview import SNIFF_BYTES, is_binary
+
+WORKERS = max(1, min(8, (os.cpu_count() or 1) - 1))
+BATCH_FILES = 64
+BATCH_BYTES = 32 * 1024 * 1024  # un lot part dès qu'il atteint ce volume
+MAX_PENDING = WORKERS * 4  # lots soumis et pas encore terminés
+MAX_FILE_BYTES = 1024 * 1024 * 1024  # au-delà, le fichier est ignoré
+MAX_HITS_PER_FILE = 20
+LINE_CHARS = 200  # contexte gardé de part et d'autre d'une occurrence
+COUNT_CHUNK = 1024 * 1024
+MEMORY_BUDGET = 64 * 1024 * 1024  # octets de résultats gardés au plus
+MAGIC = (b"\x89PNG", b"\xff\xd8\xff", b"GIF8", b"%PDF", b"PK\x03\x04", b"\x1f\x8b", b"BZh", b"\xfd7zXZ",
+         b"\x28\xb5\x2f\xfd", b"7z\xbc\xaf", b"Rar!", b"\x7fELF", b"MZ", b"\xca\xfe\xba\xbe", b"\xcf\xfa\xed\xfe",
+         b"OggS", b"ID3", b"fLaC", b"RIFF", b"\x00\x00\x01\xba", b"\x1aE\xdf\xa3", b"SQLite format 3",
+         b"\xd0\xcf\x11\xe0")  # images, archives, exécutables, médias, bases
+
+_patterns = {}  # motifs compilés d'un processus du pool
+
+
+def _count_newlines(buffer, start, stop):
+    count = 0
+    for chunk in range(start, stop, COUNT_CHUNK):
+        count += buffer[chunk:min(stop, chunk + COUNT_CHUNK)].count(b"\n")
+    return count
+
+
+def _search_file(path, regex):
+    """
+    @return : [(numéro de ligne, texte de la ligne)] des occurrences de regex
+              dans path, ou None (aucune, fichier vide ou binaire)
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size or size > MAX_FILE_BYTES:
+            return None
+        head = f.read(SNIFF_BYTES)
+        if head.startswith(MAGIC) or is_binary(head):
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            hits = []
+            line, counted = 1, 0
+            for match in regex.finditer(buffer):
+                start = match.start()
+                line += _count_newlines(buffer, counted, start)
+                counted = start
+                if hits and hits[-1][0] == line:
+                    continue  # une ligne par occurrence
+                floor = max(0, start - LINE_CHARS)
+                begin = buffer.rfind(b"\n", floor, start)
+                begin = begin + 1 if begin >= 0 else floor
+                end = buffer.find(b"\n", start, start + LINE_CHARS)
+                if end < 0:
+                    end = min(size, start + LINE_CHARS)
+                hits.append((line, buffer[begin:end].decode("utf-8", "replace").strip()))
+                if len(hits) >= MAX_HITS_PER_FILE:
+                    break
+    return hits or None
+
+
+def _search_batch(paths, pattern, flags):
+    """
+    Exécuté dans un processus du pool.
+    @return : [(chemin, occurrences)] des fichiers de paths qui contiennent pattern
+    """
+    regex = _patterns.get((pattern, flags))
+    if regex is None:
+        regex = _patterns[pattern, flags] = re.compile(pattern, flags)
+    results = []
+    for path in paths:
+        try:
+            hits = _search_file(path, regex)
+        except (OSError, ValueError):
+            continue
+        if hits:
+            results.append((path, hits))
+    return results
+
+
+class ContentSearch(object):
+    """
+    Une recherche dans le contenu des fichiers de root.
+    on_hits(recherche, [(chemin, [(ligne, texte)])]) et on_finished(recherche)
+    sont appelés depuis des threads de travail.
+
+    @param regex : pattern est une expression régulière, sinon un texte
+    @raise re.error : expression régulière invalide
+    """
+
+    def __init__(self, root, pattern, regex=False, ignore_case=True, on_hits=None, on_finished=None,
+                 workers=WORKERS, budget=MEMORY_BUDGET):
+        self.root = root
+        self.pattern = (pattern if regex else re.escape(pattern)).encode("utf-8")
+        self.flags = re.IGNORECASE if ignore_case else 0
+        re.compile(self.pattern, self.flags)
+        self.on_hits = on_hits
+        self.on_finished = on_finished
+        self.workers = workers
+        self.budget = budget
+        self.files = 0  # fichiers envoyés au pool
+        self.matched = 0  # fichiers où le motif a été trouvé
+        self.used = 0  # octets de résultats gardés
+        self.truncated = False  # budget atteint : résultats incomplets
+        self.done = False
+        self._cancelled = threading.Event()
+        self._slots = threading.Semaphore(MAX_PENDING)
+        self._futures = set()
+        self._lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self._walk, name="content-search", daemon=True).start()
+
+    def cancel(self):
+        self._cancelled.set()
+        with self._lock:
+            futures = list(self._futures)
+        for future in futures:
+            future.cancel()
+
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def _walk(self):
+        # spawn : un fork du processus graphique (et de ses threads) n'est pas sûr
+        context = multiprocessing.get_context("spawn")
+        executor = ProcessPoolExecutor(self.workers, mp_context=context)
+        try:
+            stack = [self.root]
+            batch, batch_bytes = [], 0
+            while stack and not self._cancelled.is_set():
+                try:
+                    with os.scandir(stack.pop()) as it:
+                        entries = list(it)
+                except OSError:
+                    continue
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                            continue
+                        if not entry.is_file(follow_symlinks=False):
+                            continue
+                        size = entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        continue
+                    if not size or size > MAX_FILE_BYTES:
+                        continue
+                    batch.append(entry.path)
+                    batch_bytes += size
+                    if len(batch) >= BATCH_FILES or batch_bytes >= BATCH_BYTES:
+                        self._submit(executor, batch)
+                        batch, batch_bytes = [], 0
+            if batch:
+                self._submit(executor, batch)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=self._cancelled.is_set())
+            self.done = True
+            if self.on_finished is not None:
+                self.on_finished(self)
+
+    def _submit(self, executor, batch):
+        while not self._slots.acquire(timeout=0.1):
+            if self._cancelled.is_set():
+                return
+        if self._cancelled.is_set():
+            self._slots.release()
+            return
+        future = executor.submit(_search_batch, batch, self.pattern, self.flags)
+        self.files += len(batch)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        self._slots.release()
+        with self._lock:
+            self._futures.discard(future)
+        if future.cancelled() or self._cancelled.is_set():
+            return
+        try:
+            results = future.result()
+        except Exception:
+            return  # processus disparu : ce lot est perdu
+        kept = []
+        with self._lock:
+            for path, hits in results:
+                cost = len(path) + sum(len(text) + 32 for _, text in hits) + 64
+                if self.used + cost > self.budget:
+                    self.truncated = True
+                    break
+                self.used += cost
+                kept.append((path, hits))
+            self.matched += len(kept)
+        if kept and self.on_hits is not None:
+            self.on_hits(self, kept)
+        if self.truncated:
+            self.cancel()
@@ -0,0 +1,614 @@
+# -*- coding: utf-8 -*-
+"""
+Page de détails (page1 du stackedWidget).
+
+Le cadre du haut (frame_3) affiche la taille récursive et le nombre de
+fichiers du dossier sélectionné. Le calcul (foldersize) tourne en
+arrière-plan, affiche ses totaux partiels et s'annule dès que la sélection
+change. Sous les totaux, la carte de l'occupation du disque (treemap) se
+remplit au fil du calcul ; un clic sur un dossier de la carte y va, un clic
+droit remonte au dossier parent.
+
+Le cadre central (frame) est l'aperçu du fichier sélectionné : seules les
+lignes visibles sont lues (voir preview), en texte ou en hexadécimal.
+
+Le cadre du bas (frame_2) affiche les fichiers en double trouvés sous un
+dossier (duplicates), groupe par groupe, les plus coûteux en premier.
+"""
+import os
+import threading
+import zlib
+from collections import deque
+
+from PyQt5.QtCore import QEvent, QObject, QRunnable, Qt, QThreadPool, QTimer, pyqtSignal
+from PyQt5.QtGui import QColor, QFontDatabase, QPainter
+from PyQt5.QtWidgets import (QWIDGETSIZE_MAX, QAbstractScrollArea, QCheckBox, QHBoxLayout, QLabel, QToolButton,
+                             QToolTip, QTreeWidget, QTreeWidgetItem, QVBoxLayout, QWidget)
+
+from explorer.duplicates import SCAN, DuplicateFinder, HashCache
+from explorer.foldersize import FolderSizeWalker, SubtreeCache
+from explorer.preview import HEX_WIDTH, FileWindow, LineIndex
+from explorer.treemap import OWN, Node, Treemap
+
+SCROLL_RANGE = 1 << 30  # pas de la barre de défilement, quelle que soit la taille du fichier
+INDEX_POLL_MS = 200
+MAX_GROUPS_SHOWN = 1000  # groupes de doublons affichés au plus
+TREEMAP_REFRESH_MS = 100
+TREEMAP_MIN_PIXELS = 3  # rectangles plus petits non dessinés
+TREEMAP_HEADER = 14  # bandeau du nom d'un dossier (au moins la hauteur de la police), au-dessus de son contenu
+TREEMAP_HEIGHT = 220
+TREEMAP_MAX_TILES = 1200  # rectangles dessinés au plus par image
+TREEMAP_BACKGROUND, TREEMAP_BORDER = QColor(240, 240, 240), QColor(90, 90, 90)
+TREEMAP_FILES, TREEMAP_OTHERS = QColor(200, 200, 200), QColor(170, 170, 170)
+
+
+def format_size(size):
+    """
+    @return : taille lisible, en unités binaires à la française (o, Ko, Mo...)
+    """
+    for unit in ("o", "Ko", "Mo", "Go", "To"):
+        if size < 1024 or unit == "To":
+            break
+        size /= 1024.0
+    if unit == "o":
+        return "{0} {1}".format(int(size), unit)
+    return "{0:.1f} {1}".format(size, unit)
+
+
+class _SizeSignals(QObject):
+    progress = pyqtSignal(int, object, object, object)
+    finished = pyqtSignal(int, object, object, object)
+
+
+class _SizeTask(QRunnable):
+
+    def __init__(self, path, generation, cancelled, cache, treemap, signals):
+        QRunnable.__init__(self)
+        self.path = path
+        self.generation = generation
+        self.cancelled = cancelled
+        self.cache = cache
+        self.treemap = treemap
+        self.signals = signals
+
+    def run(self):
+        self.treemap.begin()
+        walker = FolderSizeWalker(self.path, cache=self.cache, cancelled=self.cancelled,
+                                  on_progress=self._progress,
+                                  on_subtree=lambda path, nbytes, files, dirs: self.treemap.add(path, nbytes),
+                                  on_cached=lambda path, nbytes, files, dirs: self.treemap.add(path, nbytes, True))
+        result = walker.run()
+        if result is not None:
+            self.signals.finished.emit(self.generation, *result)
+
+    def _progress(self, nbytes, files, dirs):
+        if not self.cancelled.is_set():
+            self.signals.progress.emit(self.generation, nbytes, files, dirs)
+
+
+class TreemapView(QWidget):
+    """
+    Dessin d'un dossier du Treemap : un rectangle par sous-dossier, en
+    proportion de sa taille, et ainsi de suite tant que les rectangles
+    restent visibles.
+    folderActivated(chemin) : clic sur un dossier, ou clic droit (dossier parent).
+    """
+    folderActivated = pyqtSignal(str)
+
+    def __init__(self, treemap, parent=None):
+        QWidget.__init__(self, parent)
+        self.treemap = treemap
+        self._path = None
+        self._version = -1
+        self._tiles = []  # (x, y, largeur, hauteur, élément) dessinés, les plus profonds en dernier
+        self._colors = {}  # (teinte, profondeur) -> QColor
+        self.setMinimumHeight(TREEMAP_HEIGHT // 2)
+
+    def setPath(self, path):
+        self._path = path
+        self._version = -1
+        self.update()
+
+    def refresh(self):
+        """
+        Redessine si l'arbre a changé depuis le dernier dessin.
+        """
+        if self.treemap.version != self._version:
+            self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), TREEMAP_BACKGROUND)
+        self._tiles = []
+        if self._path is None:
+            return
+        with self.treemap.lock:
+            self._version = self.treemap.version
+            node = self.treemap.node(self._path, create=False)
+            if node is not None and node.size:
+                self._paint(painter, node)
+
+    def _color(self, hue, depth):
+        color = self._colors.get((hue, depth))
+        if color is None:
+            color = self._colors[hue, depth] = QColor.fromHsv(hue, max(40, 160 - depth * 30), 230)
+        return color
+
+    def _paint(self, painter, root):
+        """
+        Dessine root niveau par niveau, dans la limite de TREEMAP_MAX_TILES
+        rectangles : sur un très grand arbre, ce sont les niveaux profonds
+        qui manquent.
+        """
+        metrics = painter.fontMetrics()
+        header = max(TREEMAP_HEADER, metrics.height())
+        pending = deque([(root, 0.0, 0.0, float(self.width()), float(self.height()), None, 0)])
+        tiles = self._tiles
+        while pending and len(tiles) < TREEMAP_MAX_TILES:
+            node, x, y, width, height, hue, depth = pending.popleft()
+            min_area = TREEMAP_MIN_PIXELS * TREEMAP_MIN_PIXELS / (width * height)
+            for item, ix, iy, iw, ih in self.treemap.layout(node, width / height):
+                if iw * ih < min_area or len(tiles) >= TREEMAP_MAX_TILES:
+                    break  # éléments par taille décroissante : les suivants sont plus petits encore
+                w, h = iw * width, ih * height
+                if w < TREEMAP_MIN_PIXELS or h < TREEMAP_MIN_PIXELS:
+                    continue
+                left, top = x + ix * width, y + iy * height
+                tiles.append((left, top, w, h, item))
+                ileft, itop, iw, ih = int(left), int(top), int(left + w) - int(left), int(top + h) - int(top)
+                if not isinstance(item, Node):
+                    painter.fillRect(ileft, itop, iw, ih, TREEMAP_BORDER)
+                    painter.fillRect(ileft + 1, itop + 1, iw - 2, ih - 2,
+                                     TREEMAP_FILES if item[0] == OWN else TREEMAP_OTHERS)
+                    continue
+                tile_hue = hue if hue is not None else zlib.crc32(item.name.encode("utf-8", "surrogateescape")) % 360
+                painter.fillRect(ileft, itop, iw, ih, TREEMAP_BORDER)
+                painter.fillRect(ileft + 1, itop + 1, iw - 2, ih - 2, self._color(tile_hue, depth))
+                if w > 40 and h > header:
+                    text = "{0}  {1}".format(item.name, format_size(item.size))
+                    painter.drawText(ileft + 3, itop, iw - 6, header, Qt.AlignLeft | Qt.AlignTop,
+                                     metrics.elidedText(text, Qt.ElideRight, iw - 6))
+                if item.size and w >= TREEMAP_MIN_PIXELS * 4 + 4 and h >= TREEMAP_MIN_PIXELS * 4 + header + 2:
+                    pending.append((item, left + 2, top + header, w - 4, h - header - 2,
+                                    tile_hue, depth + 1))
+
+    def _tile_at(self, pos, folders=False):
+        """
+        @param folders : seulement les dossiers, pas les fichiers regroupés
+        @return : l'élément le plus profond dessiné sous pos, ou None
+        """
+        px, py = pos.x(), pos.y()
+        for x, y, width, height, item in reversed(self._tiles):
+            if x <= px < x + width and y <= py < y + height and (not folders or isinstance(item, Node)):
+                return item
+        return None
+
+    def mousePressEvent(self, event):
+        if self._path is None:
+            return
+        if event.button() == Qt.RightButton:
+            parent = os.path.dirname(self._path)
+            if parent != self._path:
+                self.folderActivated.emit(parent)
+            return
+        if event.button() == Qt.LeftButton:
+            with self.treemap.lock:
+                item = self._tile_at(event.localPos(), folders=True)
+                path = item.path() if item is not None else None
+            if path:
+                self.folderActivated.emit(path)
+
+    def event(self, event):
+        if event.type() == QEvent.ToolTip:
+            with self.treemap.lock:
+                item = self._tile_at(event.pos())
+                if isinstance(item, Node):
+                    text = "{0}\n{1}".format(item.path(), format_size(item.size))
+                elif item is not None:
+                    text = "{0} : {1} ({2})".format(item[0], format_size(item[1]), item[2])
+                else:
+                    text = None
+            if text:
+                QToolTip.showText(event.globalPos(), text, self)
+            else:
+                QToolTip.hideText()
+            return True
+        return QWidget.event(self, event)
+
+
+class FolderSizePanel(QObject):
+    """
+    Affichage de la taille d'un dossier, et de sa carte, dans un cadre de
+    la page de détails.
+    folderActivated(chemin) : dossier choisi sur la carte.
+    """
+    folderActivated = pyqtSignal(str)
+
+    def __init__(self, frame, parent=None):
+        QObject.__init__(self, parent)
+        self.cache = SubtreeCache()
+        self.treemap = Treemap()
+        self._path = None
+        self._generation = 0
+        self._cancelled = threading.Event()
+
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(1)
+        self._signals = _SizeSignals(self)
+        self._signals.progress.connect(self._on_progress)
+        self._signals.finished.connect(self._on_finished)
+
+        # le cadre, prévu pour les seuls totaux, s'agrandit pour la carte
+        frame.setMinimumHeight(TREEMAP_HEIGHT)
+        frame.setMaximumHeight(QWIDGETSIZE_MAX)
+        layout = QVBoxLayout(frame)
+        self.label = QLabel(frame)
+        self.label.setWordWrap(True)
+        layout.addWidget(self.label)
+        self.view = TreemapView(self.treemap, frame)
+        self.view.folderActivated.connect(self.folderActivated)
+        layout.addWidget(self.view, 1)
+        self._refresh = QTimer(self)
+        self._refresh.setInterval(TREEMAP_REFRESH_MS)
+        self._refresh.timeout.connect(self.view.refresh)
+
+    def show_folder(self, path):
+        """
+        Lance le calcul pour path ; le calcul précédent est annulé.
+        """
+        if path == self._path:
+            return
+        self.cancel()
+        self._path = path
+        self._generation += 1
+        self._cancelled = threading.Event()
+        self.label.setText("{0}\nCalcul en cours…".format(path))
+        self.view.setPath(path)
+        self._refresh.start()
+        self._pool.start(_SizeTask(path, self._generation, self._cancelled, self.cache, self.treemap,
+                                   self._signals))
+
+    def cancel(self):
+        self._cancelled.set()
+        self._path = None
+        self._refresh.stop()
+
+    def _show(self, nbytes, files, dirs, suffix=""):
+        self.label.setText("{0}\n{1} — {2} fichiers, {3} dossiers{4}".format(
+            self._path, format_size(nbytes), files, dirs, suffix))
+
+    def _on_progress(self, generation, nbytes, files, dirs):
+        if generation == self._generation and self._path is not None:
+            self._show(nbytes, files, dirs, " (en cours…)")
+
+    def _on_finished(self, generation, nbytes, files, dirs):
+        if generation == self._generation and self._path is not None:
+            self._show(nbytes, files, dirs)
+            self._refresh.stop()
+            self.view.refresh()
+
+
+class PreviewView(QAbstractScrollArea):
+    """
+    Affiche les lignes visibles d'un FileWindow. La barre de défilement
+    parcourt les octets du fichier : aller à la fin ou au milieu ne lit
+    que la fenêtre affichée.
+    """
+
+    def __init__(self, parent=None):
+        QAbstractScrollArea.__init__(self, parent)
+        self.window = None
+        self.index = None
+        self.hex = False
+        self.top = 0  # décalage de la première ligne affichée
+        self.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.setFocusPolicy(Qt.StrongFocus)
+        self.verticalScrollBar().valueChanged.connect(self._on_scrolled)
+
+    def setFile(self, window, index=None):
+        self.window = window
+        self.index = index
+        self.hex = window is not None and window.binary
+        self.top = 0
+        self._sync_scrollbar()
+        self.viewport().update()
+
+    def setHex(self, hex):
+        self.hex = hex
+        self.top = self._align(self.top)
+        self.viewport().update()
+
+    def visibleRows(self):
+        return max(1, self.viewport().height() // self.fontMetrics().lineSpacing())
+
+    def _align(self, offset):
+        if self.window is None:
+            return 0
+        if self.hex:
+            return min(offset, max(0, self.window.size - 1)) // HEX_WIDTH * HEX_WIDTH
+        return self.window.line_start(offset)
+
+    def _sync_scrollbar(self):
+        bar = self.verticalScrollBar()
+        size = self.window.size if self.window is not None else 0
+        bar.blockSignals(True)
+        bar.setRange(0, min(size, SCROLL_RANGE))
+        bar.setPageStep(max(1, bar.maximum() // 50))
+        bar.setValue(self.top * bar.maximum() // size if size else 0)
+        bar.blockSignals(False)
+
+    def _on_scrolled(self, value):
+        if self.window is None:
+            return
+        bar = self.verticalScrollBar()
+        if value >= bar.maximum():
+            self.scrollToEnd()
+            return
+        self.top = self._align(value * self.window.size // max(1, bar.maximum()))
+        self.viewport().update()
+
+    def scrollRows(self, count):
+        """
+        Fait défiler de count lignes (vers le haut si count est négatif).
+        """
+        if self.window is None:
+            return
+        if self.hex:
+            self.top = self._align(max(0, self.top + count * HEX_WIDTH))
+        else:
+            for _ in range(abs(count)):
+                self.top = self.window.next_line(self.top) if count > 0 else self.window.previous_line(self.top)
+            if self.top >= self.window.size:
+                self.top = self.window.last_lines(1)
+        self._sync_scrollbar()
+        self.viewport().update()
+
+    def scrollToStart(self):
+        self.top = 0
+        self._sync_scrollbar()
+        self.viewport().update()
+
+    def scrollToEnd(self):
+        if self.window is None:
+            return
+        rows = self.visibleRows()
+        if self.hex:
+            self.top = self._align(max(0, self.window.size - rows * HEX_WIDTH + HEX_WIDTH - 1))
+        else:
+            self.top = self.window.last_lines(rows)
+        self._sync_scrollbar()
+        self.viewport().update()
+
+    def keyPressEvent(self, event):
+        key = event.key()
+        if key == Qt.Key_Up:
+            self.scrollRows(-1)
+        elif key == Qt.Key_Down:
+            self.scrollRows(1)
+        elif key == Qt.Key_PageUp:
+            self.scrollRows(1 - self.visibleRows())
+        elif key == Qt.Key_PageDown:
+            self.scrollRows(self.visibleRows() - 1)
+        elif key == Qt.Key_Home:
+            self.scrollToStart()
+        elif key == Qt.Key_End:
+            self.scrollToEnd()
+        else:
+            QAbstractScrollArea.keyPressEvent(self, event)
+
+    def wheelEvent(self, event):
+        self.scrollRows(-event.angleDelta().y() // 40)
+
+    def resizeEvent(self, event):
+        QAbstractScrollArea.resizeEvent(self, event)
+        self.viewport().update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self.viewport())
+        if self.window is None:
+            return
+        metrics = self.fontMetrics()
+        height = metrics.lineSpacing()
+        rows = self.visibleRows() + 1
+        if self.hex:
+            rows, first, gutter = self.window.hex_rows(self.top, rows), None, 4
+        else:
+            rows = self.window.lines(self.top, rows)
+            first = self.index.line_of(self.top) if self.index is not None else None
+            gutter = metrics.horizontalAdvance("0" * max(6, len(str((first or 0) + len(rows))))) + 12
+        for row, (_, text) in enumerate(rows):
+            y = row * height + metrics.ascent()
+            if first is not None:
+                painter.setPen(Qt.gray)
+                painter.drawText(4, y, str(first + row + 1))
+                painter.setPen(Qt.black)
+            painter.drawText(gutter, y, text)
+
+
+class PreviewPanel(QObject):
+    """
+    Aperçu d'un fichier dans un cadre de la page de détails : en-tête (nom,
+    taille, lignes) et PreviewView. L'index des lignes est construit en
+    arrière-plan ; le fichier n'est jamais lu en entier.
+    """
+
+    def __init__(self, frame, parent=None):
+        QObject.__init__(self, parent)
+        self.window = None
+        self.index = None
+
+        layout = QVBoxLayout(frame)
+        header = QHBoxLayout()
+        self.label = QLabel(frame)
+        self.hexBox = QCheckBox("Hexadécimal", frame)
+        self.hexBox.toggled.connect(self._on_hex_toggled)
+        header.addWidget(self.label, 1)
+        header.addWidget(self.hexBox)
+        layout.addLayout(header)
+        self.view = PreviewView(frame)
+        layout.addWidget(self.view, 1)
+
+        self._timer = QTimer(self)
+        self._timer.setInterval(INDEX_POLL_MS)
+        self._timer.timeout.connect(self._on_index_progress)
+
+    def path(self):
+        """
+        @return : chemin du fichier affiché, ou None
+        """
+        return self.window.path if self.window is not None else None
+
+    def show_file(self, path):
+        """
+        Affiche path (None ou un dossier : aperçu vide).
+        """
+        if path is not None and path == self.path():
+            return
+        self.clear()
+        if path is None:
+            return
+        try:
+            self.window = FileWindow(path)
+        except (OSError, ValueError) as e:
+            self.label.setText("{0}\n{1}".format(os.path.basename(path), e))
+            return
+        self.index = LineIndex(self.window)
+        self.index.start()
+        self.view.setFile(self.window, self.index)
+        self.hexBox.blockSignals(True)
+        self.hexBox.setChecked(self.view.hex)
+        self.hexBox.blockSignals(False)
+        self._show_header()
+        self._timer.start()
+
+    def clear(self):
+        """
+        Ferme le fichier affiché.
+        """
+        self._timer.stop()
+        if self.index is not None:
+            self.index.cancel()
+        self.view.setFile(None)
+        if self.window is not None:
+            self.window.close()
+        self.window = self.index = None
+        self.label.setText("")
+
+    def _show_header(self):
+        window = self.window
+        text = "{0} — {1}".format(os.path.basename(window.path), format_size(window.size))
+        if window.truncated:
+            text += " (début seulement)"
+        lines = self.index.line_count()
+        if lines is not None:
+            text += " — {0} ligne{1}".format(lines, "s" if lines > 1 else "")
+        else:
+            text += " — indexation des lignes : {0} %".format(int(self.index.progress() * 100))
+        self.label.setText(text)
+
+    def _on_index_progress(self):
+        if self.index is None:
+            return
+        if self.index.complete:
+            self._timer.stop()
+        self._show_header()
+        self.view.viewport().update()  # numéros de ligne devenus connus
+
+    def _on_hex_toggled(self, checked):
+        self.view.setHex(checked)
+
+
+class _DuplicateSignals(QObject):
+    progress = pyqtSignal(object)
+    finished = pyqtSignal(object)
+
+
+class DuplicatePanel(QObject):
+    """
+    Recherche de doublons dans un cadre de la page de détails.
+    fileActivated(chemin) : double-clic sur un fichier d'un groupe.
+    """
+    fileActivated = pyqtSignal(str)
+
+    def __init__(self, frame, parent=None):
+        QObject.__init__(self, parent)
+        self.cache = None  # ouvert à la première recherche
+        self.finder = None
+        self._signals = _DuplicateSignals(self)
+        self._signals.progress.connect(self._on_progress)
+        self._signals.finished.connect(self._on_finished)
+
+        layout = QVBoxLayout(frame)
+        header = QHBoxLayout()
+        self.label = QLabel(frame)
+        self.cancel_button = QToolButton(frame)
+        self.cancel_button.setText("Annuler")
+        self.cancel_button.clicked.connect(self.cancel)
+        self.cancel_button.hide()
+        header.addWidget(self.label, 1)
+        header.addWidget(self.cancel_button)
+        layout.addLayout(header)
+        self.tree = QTreeWidget(frame)
+        self.tree.setHeaderHidden(True)
+        self.tree.itemDoubleClicked.connect(self._on_item_activated)
+        layout.addWidget(self.tree, 1)
+
+    def start(self, root):
+        """
+        Lance la recherche sous root ; la précédente est annulée.
+        """
+        self.cancel()
+        if self.cache is None:
+            self.cache = HashCache()
+        self.finder = DuplicateFinder(root, self.cache, on_progress=self._signals.progress.emit,
+                                      on_finished=self._signals.finished.emit)
+        self.tree.clear()
+        self.cancel_button.show()
+        self.label.setText("Doublons dans {0} : parcours…".format(root))
+        self.finder.start()
+
+    def cancel(self):
+        if self.finder is not None:
+            self.finder.cancel()
+
+    def shutdown(self):
+        self.cancel()
+        self.finder = None
+        if self.cache is not None:
+            self.cache.close()
+
+    def _on_progress(self, finder):
+        if finder is not self.finder:
+            return
+        if finder.stage == SCAN:
+            detail = "{0} fichiers parcourus".format(finder.done_count)
+        else:
+            detail = "{0} / {1} fichiers".format(finder.done_count, finder.total)
+        self.label.setText("Doublons dans {0} : {1}, {2}…".format(finder.root, finder.stage, detail))
+
+    def _on_finished(self, finder):
+        if finder is not self.finder:
+            return
+        self.cancel_button.hide()
+        if finder.cancelled():
+            self.label.setText("Doublons dans {0} : recherche annulée".format(finder.root))
+            return
+        groups = finder.groups
+        text = "Doublons dans {0} : {1} groupe{2}, {3} récupérables".format(
+            finder.root, len(groups), "s" if len(groups) > 1 else "", format_size(finder.wasted()))
+        if len(groups) > MAX_GROUPS_SHOWN:
+            text += " ({0} plus gros affichés)".format(MAX_GROUPS_SHOWN)
+        self.label.setText(text)
+        items = []
+        for size, paths in groups[:MAX_GROUPS_SHOWN]:
+            item = QTreeWidgetItem(["{0} × {1}".format(len(paths), format_size(size))])
+            for path in paths:
+                child = QTreeWidgetItem(item, [path])
+                child.setData(0, Qt.UserRole, path)
+            items.append(item)
+        self.tree.addTopLevelItems(items)
+
+    def _on_item_activated(self, item, column):
+        path = item.data(0, Qt.UserRole)
+        if path:
+            self.fileActivated.emit(path)
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Cache persistant des listes de dossiers (SQLite).
+
+Chaque dossier est enregistré avec sa date de modification et les colonnes
+de son EntryStore. Un dossier déjà visité s'affiche depuis le cache, puis
+est revalidé en arrière-plan, sans être relu si sa date n'a pas changé. La
+taille totale est plafonnée : les dossiers les moins récemment consultés
+sont évincés en premier.
+
+Une lecture n'écrit rien : les dates de consultation restent en mémoire
+jusqu'à la prochaine écriture (put, discard) ou jusqu'à flush.
+
+Le cache se désactive avec la variable d'environnement EXPLORER_DIRCACHE=0
+ou en construisant DirectoryCache(enabled=False).
+"""
+import os
+import sqlite3
+import threading
+import time
+
+from explorer.entrystore import EntryStore
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+MTIME_SETTLE = 2.0  # secondes : une date de dossier plus récente peut encore changer sans bouger
+
+
+def default_cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "explorateur")
+
+
+class DirectoryCache(object):
+    """
+    Accès au cache, utilisable depuis plusieurs threads.
+    """
+
+    def __init__(self, path=None, max_bytes=DEFAULT_MAX_BYTES, enabled=None):
+        if enabled is None:
+            enabled = os.environ.get("EXPLORER_DIRCACHE", "1") != "0"
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = None
+        self._total = 0
+        self._touched = {}  # dossier -> date de consultation pas encore écrite
+        if not enabled:
+            return
+        if path is None:
+            path = os.path.join(default_cache_dir(), "dircache.sqlite3")
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS listings ("
+                             "path TEXT PRIMARY KEY, mtime REAL, "
+                             "names BLOB, offsets BLOB, sizes BLOB, mtimes BLOB, modes BLOB, "
+                             "nbytes INTEGER, atime REAL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS listings_atime ON listings (atime)")
+            self._total = self._db.execute("SELECT COALESCE(SUM(nbytes), 0) FROM listings").fetchone()[0]
+        except (OSError, sqlite3.Error) as e:
+            print("dircache désactivé : {0}".format(e))
+            self.enabled = False
+            self._db = None
+
+    def get(self, dirpath):
+        """
+        @return : (mtime du dossier, EntryStore) ou None si le dossier n'est pas en
+                  cache ; mtime vaut 0 si la liste a été lue trop tôt pour s'y fier
+        """
+        if self._db is None:
+            return None
+        with self._lock:
+            row = self._db.execute("SELECT mtime, names, offsets, sizes, mtimes, modes "
+                                   "FROM listings WHERE path = ?", (dirpath,)).fetchone()
+            if row is None:
+                return None
+            self._touched[dirpath] = time.time()
+        return row[0], EntryStore.from_columns(*row[1:])
+
+    def put(self, dirpath, mtime, columns):
+        """
+        Enregistre la liste d'un dossier.
+        @param columns : résultat de EntryStore.to_columns()
+        """
+        if self._db is None:
+            return
+        nbytes = sum(len(c) for c in columns)
+        if nbytes > self.max_bytes // 4:
+            return  # un seul dossier ne doit pas vider tout le cache
+        if time.time() - mtime < MTIME_SETTLE:
+            mtime = 0.0  # un changement dans la même seconde passerait inaperçu : relu à la prochaine visite
+        with self._lock:
+            self._touched.pop(dirpath, None)
+            self._write_atimes()
+            old = self._db.execute("SELECT nbytes FROM listings WHERE path = ?", (dirpath,)).fetchone()
+            if old is not None:
+                self._total -= old[0]
+            self._db.execute("INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             (dirpath, mtime) + tuple(columns) + (nbytes, time.time()))
+            self._total += nbytes
+            self._evict()
+            self._db.commit()
+
+    def discard(self, dirpath):
+        if self._db is None:
+            return
+        with self._lock:
+            self._touched.pop(dirpath, None)
+            self._write_atimes()
+            old = self._db.execute("SELECT nbytes FROM listings WHERE path = ?", (dirpath,)).fetchone()
+            if old is not None:
+                self._total -= old[0]
+                self._db.execute("DELETE FROM listings WHERE path = ?", (dirpath,))
+            self._db.commit()
+
+    def clear(self):
+        if self._db is None:
+            return
+        with self._lock:
+            self._touched.clear()
+            self._db.execute("DELETE FROM listings")
+            self._db.commit()
+            self._total = 0
+
+    def flush(self):
+        """
+        Écrit les dates de consultation en attente.
+        """
+        if self._db is None:
+            return
+        with self._lock:
+            if self._touched:
+                self._write_atimes()
+                self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            self.flush()
+            with self._lock:
+                self._db.close()
+                self._db = None
+
+    def _write_atimes(self):
+        # verrou pris ; validé avec l'écriture qui suit
+        if self._touched:
+            self._db.executemany("UPDATE listings SET atime = ? WHERE path = ?",
+                                 [(atime, path) for path, atime in self._touched.items()])
+            self._touched.clear()
+
+    def _evict(self):
+        # LRU : on retire les dossiers les plus anciennement consultés
+        while self._total > self.max_bytes:
+            row = self._db.execute("SELECT path, nbytes FROM listings ORDER BY atime LIMIT 1").fetchone()
+            if row is None:
+                self._total = 0
+                return
+            self._db.execute("DELETE FROM listings WHERE path = ?", (row[0],))
+            self._total -= row[1]
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+Recherche des fichiers en double sous un dossier.
+
+Les fichiers sont d'abord regroupés par taille : une taille unique ne peut
+pas avoir de double et n'est jamais lue. Dans chaque groupe restant, on
+hache le premier et le dernier bloc (BLOCK octets) de chaque fichier ; seuls
+les fichiers encore semblables sont hachés en entier. Un fichier de moins
+de deux blocs est entièrement couvert par la première étape.
+
+Les hachages tournent dans un pool de threads (la lecture et hashlib
+libèrent le GIL) et sont gardés dans un cache SQLite sous la clé
+(st_dev, st_ino), avec la taille et la date de modification : relancer la
+recherche sur des fichiers inchangés ne relit rien. Les liens physiques
+vers un même fichier ne comptent qu'une fois.
+
+Aucune dépendance Qt.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from explorer.dircache import default_cache_dir
+
+BLOCK = 64 * 1024  # octets hachés au début et à la fin d'un fichier
+READ_CHUNK = 1024 * 1024
+WORKERS = min(16, (os.cpu_count() or 1) * 2)
+PROGRESS_INTERVAL = 0.1
+CACHE_MAX_ROWS = 2000000
+QUERY_CHUNK = 500  # clés par requête sur le cache
+SCAN, HEADS, CONTENTS = "parcours", "début et fin", "contenu"
+
+
+def hash_file(path, size, partial, cancelled=None):
+    """
+    @param partial : seulement le premier et le dernier bloc
+    @return : empreinte (octets), ou None si la lecture a été annulée
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        if partial:
+            digest.update(f.read(BLOCK))
+            if size > BLOCK:
+                f.seek(max(BLOCK, size - BLOCK))
+                digest.update(f.read(BLOCK))
+            return digest.digest()
+        while True:
+            if cancelled is not None and cancelled.is_set():
+                return None
+            chunk = f.read(READ_CHUNK)
+            if not chunk:
+                return digest.digest()
+            digest.update(chunk)
+
+
+class HashCache(object):
+    """
+    Empreintes des fichiers déjà hachés, utilisable depuis plusieurs threads.
+    """
+
+    def __init__(self, path=None):
+        self._lock = threading.Lock()
+        self._db = None
+        if path is None:
+            path = os.path.join(default_cache_dir(), "hashes.sqlite3")
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS hashes ("
+                             "dev INTEGER, ino INTEGER, size INTEGER, mtime REAL, head BLOB, full BLOB, "
+                             "PRIMARY KEY (dev, ino))")
+        except (OSError, sqlite3.Error) as e:
+            print("cache des empreintes désactivé : {0}".format(e))
+            self._db = None
+
+    def get(self, files):
+        """
+        @param files : [(chemin, (st_dev, st_ino), taille, mtime)]
+        @return : {(st_dev, st_ino) : [début et fin, contenu]} des fichiers
+                  dont l'empreinte enregistrée est encore valable
+        """
+        if self._db is None:
+            return {}
+        wanted = {key: (size, mtime) for _, key, size, mtime in files}
+        by_dev = {}
+        for dev, ino in wanted:
+            by_dev.setdefault(dev, []).append(ino)
+        found = {}
+        with self._lock:
+            # dev = ? en tête : chaque requête suit la clé primaire (dev, ino)
+            for dev, inodes in by_dev.items():
+                inodes.sort()
+                for start in range(0, len(inodes), QUERY_CHUNK):
+                    chunk = inodes[start:start + QUERY_CHUNK]
+                    rows = self._db.execute("SELECT dev, ino, size, mtime, head, full FROM hashes "
+                                            "WHERE dev = ? AND ino IN ({0})".format(",".join("?" * len(chunk))),
+                                            [dev] + chunk)
+                    for dev_, ino, size, mtime, head, full in rows:
+                        if wanted.get((dev_, ino)) == (size, mtime):
+                            found[dev_, ino] = [head, full]
+        return found
+
+    def put(self, rows):
+        """
+        @param rows : [(st_dev, st_ino, taille, mtime, début et fin, contenu)]
+        """
+        if self._db is None or not rows:
+            return
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?)", rows)
+            count = self._db.execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
+            if count > CACHE_MAX_ROWS:
+                # les lignes remplacées le plus anciennement ont les plus petits rowid
+                self._db.execute("DELETE FROM hashes WHERE rowid IN "
+                                 "(SELECT rowid FROM hashes ORDER BY rowid LIMIT ?)", (count - CACHE_MAX_ROWS,))
+            self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+                self._db = None
+
+
+class DuplicateFinder(object):
+    """
+    Une recherche de doublons sous root, dans un thread.
+    on_progress(finder) et on_finished(finder) sont appelés depuis ce thread.
+    A la fin, groups contient [(taille, [chemins])], par place perdue décroissante.
+    """
+
+    def __init__(self, root, cache=None, workers=WORKERS, on_progress=None, on_finished=None):
+        self.root = root
+        self.cache = cache
+        self.workers = workers
+        self.on_progress = on_progress
+        self.on_finished = on_finished
+        self.stage = SCAN
+        self.done_count = 0  # fichiers parcourus ou hachés dans l'étape en cours
+        self.total = 0  # fichiers à hacher dans l'étape en cours
+        self.groups = []
+        self.done = False
+        self._cancelled = threading.Event()
+        self._last_progress = 0.0
+        self._hashes = {}  # (st_dev, st_ino) -> [début et fin, contenu]
+        self._new = set()  # clés hachées pendant cette recherche
+
+    def start(self):
+        threading.Thread(target=self._run, name="duplicates", daemon=True).start()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def wasted(self):
+        """
+        @return : octets récupérables en ne gardant qu'un fichier par groupe
+        """
+        return sum(size * (len(paths) - 1) for size, paths in self.groups)
+
+    def _progress(self, force=False):
+        now = time.monotonic()
+        if self.on_progress is not None and (force or now - self._last_progress >= PROGRESS_INTERVAL):
+            self._last_progress = now
+            self.on_progress(self)
+
+    def _run(self):
+        try:
+            groups = self._find()
+            if not self._cancelled.is_set():
+                groups.sort(key=lambda files: files[0][2] * (len(files) - 1), reverse=True)
+                self.groups = [(files[0][2], [f[0] for f in files]) for files in groups]
+        finally:
+            if self.cache is not None:
+                self.cache.put([key + (size, mtime) + tuple(self._hashes[key])
+                                for key, size, mtime in self._new])
+            self.done = True
+            if self.on_finished is not None:
+                self.on_finished(self)
+
+    def _find(self):
+        by_size = {}  # taille -> [(chemin, (st_dev, st_ino), taille, mtime)]
+        seen = set()
+        stack = [self.root]
+        while stack and not self._cancelled.is_set():
+            try:
+                with os.scandir(stack.pop()) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                        continue
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                key = (st.st_dev, st.st_ino)
+                if not st.st_size or key in seen:
+                    continue  # fichier vide, ou lien physique déjà compté
+                seen.add(key)
+                by_size.setdefault(st.st_size, []).append((entry.path, key, st.st_size, st.st_mtime))
+            self.done_count = len(seen)
+            self._progress()
+        del seen
+        groups = [files for files in by_size.values() if len(files) > 1]
+        del by_size
+        if self.cache is not None:
+            self._hashes = self.cache.get([f for files in groups for f in files])
+
+        groups = self._split(groups, HEADS)
+        small = [files for files in groups if files[0][2] <= 2 * BLOCK]  # déjà hachés en entier
+        large = [files for files in groups if files[0][2] > 2 * BLOCK]
+        return small + self._split(large, CONTENTS)
+
+    def _split(self, groups, stage):
+        """
+        Hache les fichiers de groups et les regroupe par empreinte.
+        @return : les groupes d'au moins deux fichiers identiques
+        """
+        self.stage = stage
+        column = 0 if stage == HEADS else 1
+        todo = [f for files in groups for f in files if not self._hashes.get(f[1], (None, None))[column]]
+        self.done_count, self.total = 0, len(todo)
+        self._progress(force=True)
+        failed = set()
+        with ThreadPoolExecutor(self.workers) as executor:
+            futures = {executor.submit(hash_file, f[0], f[2], stage == HEADS, self._cancelled): f for f in todo}
+            for future in as_completed(futures):
+                if self._cancelled.is_set():
+                    for pending in futures:
+                        pending.cancel()
+                    return []
+                path, key, size, mtime = futures[future]
+                try:
+                    digest = future.result()
+                except OSError:
+                    failed.add(key)
+                    continue
+                hashes = self._hashes.setdefault(key, [None, None])
+                hashes[column] = digest
+                if stage == HEADS and size <= 2 * BLOCK:
+                    hashes[1] = digest  # le fichier entier est couvert
+                self._new.add((key, size, mtime))
+                self.done_count += 1
+                self._progress()
+        split = []
+        for files in groups:
+            by_digest = {}
+            for f in files:
+                if f[1] not in failed:
+                    by_digest.setdefault(self._hashes[f[1]][column], []).append(f)
+            split.extend(same for same in by_digest.values() if len(same) > 1)
+        return split
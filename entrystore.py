@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+Stockage en colonnes des entrées d'un dossier.
+
+Un dossier de plusieurs millions de fichiers ne peut pas garder un objet
+Python (ou un QFileInfo) par ligne. Les noms sont concaténés dans un seul
+tampon d'octets, repérés par un tableau d'offsets, et les métadonnées sont
+rangées dans des tableaux typés du module array.
+"""
+import bisect
+import os
+from array import array
+
+FIND_MANY_DIRECT = 8  # en dessous, chaque nom est cherché directement dans le tampon des noms
+
+
+class EntryStore(object):
+    """
+    Entrées d'un dossier : nom, taille, date de modification et mode.
+    Les lignes sont ajoutées à la fin ; l'accès par index est direct.
+    """
+
+    def __init__(self):
+        self._names = bytearray()
+        self._offsets = array('Q', [0])
+        self.sizes = array('q')
+        self.mtimes = array('d')
+        self.modes = array('I')
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def append(self, name, size, mtime, mode):
+        self._names += os.fsencode(name)
+        self._offsets.append(len(self._names))
+        self.sizes.append(size)
+        self.mtimes.append(mtime)
+        self.modes.append(mode)
+
+    def extend(self, entries):
+        """
+        Ajoute une suite de tuples (nom, taille, mtime, mode), tels que produits
+        par scanner.iter_batches.
+        """
+        for name, size, mtime, mode in entries:
+            self.append(name, size, mtime, mode)
+
+    def name(self, i):
+        return os.fsdecode(bytes(self._names[self._offsets[i]:self._offsets[i + 1]]))
+
+    def name_columns(self):
+        """
+        @return : (tampon des noms, offsets), à lire sans les modifier
+        """
+        return self._names, self._offsets
+
+    def entry(self, i):
+        return self.name(i), self.sizes[i], self.mtimes[i], self.modes[i]
+
+    def find(self, name, first=0):
+        """
+        Recherche une entrée par son nom directement dans le tampon des noms.
+        @param first : première ligne examinée
+        @return : index de la ligne, ou -1
+        """
+        key = os.fsencode(name)
+        start = self._offsets[min(first, len(self))]
+        while True:
+            pos = self._names.find(key, start)
+            if pos < 0:
+                return -1
+            row = bisect.bisect_left(self._offsets, pos)
+            if (row < len(self) and self._offsets[row] == pos and
+                    self._offsets[row + 1] == pos + len(key)):
+                return row
+            start = pos + 1
+
+    def find_many(self, names, hints=None, first=0):
+        """
+        Recherche de plusieurs noms en un seul parcours des lignes.
+        @param hints : {nom : ligne} probables (état précédent du dossier),
+                       vérifiées d'abord, où qu'elles soient
+        @param first : première ligne parcourue pour les autres noms
+        @return : {nom : ligne} des noms trouvés
+        """
+        buffer, offsets = self._names, self._offsets
+        count = len(self)
+        found = {}
+        wanted = {}
+        for name in names:
+            key = os.fsencode(name)
+            row = hints.get(name, -1) if hints else -1
+            if 0 <= row < count and buffer[offsets[row]:offsets[row + 1]] == key:
+                found[name] = row
+            else:
+                wanted[key] = name
+        if len(wanted) <= FIND_MANY_DIRECT:
+            for name in wanted.values():
+                row = self.find(name, first)
+                if row >= 0:
+                    found[name] = row
+            return found
+        buffer = bytes(buffer)  # tranches hachables
+        for row in range(first, count):
+            name = wanted.pop(buffer[offsets[row]:offsets[row + 1]], None)
+            if name is not None:
+                found[name] = row
+                if not wanted:
+                    break
+        return found
+
+    def update(self, i, size, mtime, mode):
+        self.sizes[i] = size
+        self.mtimes[i] = mtime
+        self.modes[i] = mode
+
+    def remove(self, rows):
+        """
+        Supprime les lignes rows ; les colonnes sont recopiées par tranches contiguës.
+        """
+        dropped = sorted(set(rows))
+        names = bytearray()
+        offsets = array('Q', [0])
+        sizes, mtimes, modes = array('q'), array('d'), array('I')
+        start = 0
+        for stop in dropped + [len(self)]:
+            if stop > start:
+                first, last = self._offsets[start], self._offsets[stop]
+                shift = len(names) - first
+                names += self._names[first:last]
+                offsets.extend(o + shift for o in self._offsets[start + 1:stop + 1])
+                sizes += self.sizes[start:stop]
+                mtimes += self.mtimes[start:stop]
+                modes += self.modes[start:stop]
+            start = stop + 1
+        self._names, self._offsets = names, offsets
+        self.sizes, self.mtimes, self.modes = sizes, mtimes, modes
+
+    def to_columns(self):
+        """
+        @return : copie des colonnes sous forme d'octets (names, offsets, sizes, mtimes, modes)
+        """
+        return (bytes(self._names), self._offsets.tobytes(), self.sizes.tobytes(),
+                self.mtimes.tobytes(), self.modes.tobytes())
+
+    @classmethod
+    def from_columns(cls, names, offsets, sizes, mtimes, modes):
+        store = cls()
+        store._names = bytearray(names)
+        store._offsets = array('Q')
+        store._offsets.frombytes(offsets)
+        store.sizes.frombytes(sizes)
+        store.mtimes.frombytes(mtimes)
+        store.modes.frombytes(modes)
+        return store
+
+    def view(self):
+        """
+        @return : EntryStore partageant les colonnes actuelles, sans copie. Les
+                  lignes existantes n'y bougent plus : remove() remplace les
+                  colonnes de l'original au lieu de les modifier.
+        """
+        store = EntryStore.__new__(EntryStore)
+        store._names, store._offsets = self._names, self._offsets
+        store.sizes, store.mtimes, store.modes = self.sizes, self.mtimes, self.modes
+        return store
+
+    def names(self):
+        for i in range(len(self)):
+            yield self.name(i)
+
+    def nbytes(self):
+        """
+        @return : mémoire occupée par les tampons (hors en-têtes des objets)
+        """
+        return (len(self._names) + self._offsets.itemsize * len(self._offsets) +
+                self.sizes.itemsize * len(self.sizes) +
+                self.mtimes.itemsize * len(self.mtimes) +
+                self.modes.itemsize * len(self.modes))
+
+
+class RowSelection(object):
+    """
+    Chemins d'un ensemble de lignes d'un EntryStore, gardés sous forme de
+    plages (première, dernière ligne) : une sélection contiguë de cent mille
+    fichiers tient en deux entiers. Les chemins ne sont construits qu'au
+    parcours.
+    """
+
+    def __init__(self, base, store, rows):
+        """
+        @param rows : numéros de lignes croissants
+        """
+        self.base = base
+        self.store = store
+        self.ranges = array('I')
+        for row in rows:
+            if self.ranges and self.ranges[-1] + 1 == row:
+                self.ranges[-1] = row
+            else:
+                self.ranges.extend((row, row))
+
+    def __len__(self):
+        ranges = self.ranges
+        return sum(ranges[i + 1] - ranges[i] + 1 for i in range(0, len(ranges), 2))
+
+    def __iter__(self):
+        ranges = self.ranges
+        for i in range(0, len(ranges), 2):
+            for row in range(ranges[i], ranges[i + 1] + 1):
+                yield os.path.join(self.base, self.store.name(row))
+
+
+def diff_entries(old, new):
+    """
+    Compare deux états d'un même dossier.
+    @return : (lignes de old supprimées, [(ligne de old, taille, mtime, mode)] modifiées,
+              [entrées de new absentes de old])
+    """
+    rows = {}
+    for i in range(len(old)):
+        rows[old.name(i)] = i
+    changed = []
+    added = []
+    for i in range(len(new)):
+        name, size, mtime, mode = new.entry(i)
+        row = rows.pop(name, None)
+        if row is None:
+            added.append((name, size, mtime, mode))
+        elif (old.sizes[row], old.mtimes[row], old.modes[row]) != (size, mtime, mode):
+            changed.append((row, size, mtime, mode))
+    return sorted(rows.values()), changed, added
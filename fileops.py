@@ -0,0 +1,501 @@
+# -*- coding: utf-8 -*-
+"""
+Moteur de copie, déplacement et suppression en arrière-plan.
+
+Les opérations passent par une file : une seule s'exécute à la fois, pour
+ne pas faire travailler le même disque sur plusieurs fronts. Dans une
+opération, les petits fichiers sont copiés en parallèle par un pool de
+threads ; les gros sont copiés l'un après l'autre, par blocs, avec
+copy_file_range (copie dans le noyau, voire clonage sur les systèmes de
+fichiers qui le permettent), à défaut sendfile, à défaut read/write.
+
+L'extraction d'une entrée d'archive (pour l'ouvrir avec une application
+externe) passe par la même file : lire l'index puis décompresser l'entrée
+peut être long.
+
+Une opération peut être mise en pause, reprise ou annulée entre deux blocs ;
+un fichier interrompu par l'annulation est supprimé. La progression
+(octets, fichiers, débit) est remontée au plus tous les PROGRESS_INTERVAL
+secondes.
+
+Aucune dépendance Qt.
+"""
+import errno
+import os
+import queue
+import shutil
+import stat
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from explorer.backends import backend_for
+
+COPY, MOVE, DELETE, EXTRACT = "copy", "move", "delete", "extract"
+SMALL_FILE = 1024 * 1024  # en dessous, copié par le pool
+CHUNK = 8 * 1024 * 1024
+WORKERS = 8
+PROGRESS_INTERVAL = 0.1
+THROUGHPUT_WINDOW = 2.0  # secondes prises en compte pour le débit
+
+
+class Cancelled(Exception):
+    pass
+
+
+class Operation(object):
+    """
+    Une demande de l'utilisateur : sources (chemins) vers un dossier destination.
+    Les compteurs sont lus par l'interface pendant l'exécution.
+    """
+
+    def __init__(self, kind, sources, destination=None):
+        self.kind = kind
+        self.sources = list(sources)
+        self.destination = destination
+        self.total_bytes = 0
+        self.total_files = 0
+        self.done_bytes = 0
+        self.done_files = 0
+        self.errors = []  # (chemin, message)
+        self.targets = []  # fichiers créés par une extraction
+        self.state = "queued"  # queued, running, paused, cancelled, done
+        self.started = False
+        self._running = threading.Event()
+        self._running.set()
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._samples = deque()  # (instant, octets faits), pour le débit
+
+    def pause(self):
+        if self.state in ("queued", "running"):
+            self._running.clear()
+            self.state = "paused"
+
+    def resume(self):
+        if self.state == "paused":
+            self.state = "running" if self.started else "queued"
+            self._running.set()
+
+    def cancel(self):
+        self._cancelled.set()
+        self._running.set()  # une opération en pause doit pouvoir s'arrêter
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def checkpoint(self):
+        """
+        Appelé entre deux blocs : attend pendant la pause, lève Cancelled.
+        """
+        self._running.wait()
+        if self._cancelled.is_set():
+            raise Cancelled()
+
+    def add_progress(self, nbytes, files=0):
+        with self._lock:
+            self.done_bytes += nbytes
+            self.done_files += files
+
+    def throughput(self):
+        """
+        @return : octets par seconde sur les dernières THROUGHPUT_WINDOW secondes
+        """
+        now = time.monotonic()
+        with self._lock:
+            samples = self._samples
+            samples.append((now, self.done_bytes))
+            while len(samples) > 2 and now - samples[0][0] > THROUGHPUT_WINDOW:
+                samples.popleft()
+            elapsed = now - samples[0][0]
+            return (self.done_bytes - samples[0][1]) / elapsed if elapsed > 0 else 0.0
+
+    def error(self, path, e):
+        with self._lock:
+            self.errors.append((path, getattr(e, "strerror", None) or str(e)))
+
+
+def unique_destination(path):
+    """
+    @return : path, ou "nom (2).ext", "nom (3).ext"... si path existe déjà
+    """
+    if not os.path.lexists(path):
+        return path
+    base, ext = os.path.splitext(path)
+    if os.path.isdir(path):
+        base, ext = path, ""
+    n = 2
+    while os.path.lexists("{0} ({1}){2}".format(base, n, ext)):
+        n += 1
+    return "{0} ({1}){2}".format(base, n, ext)
+
+
+def _copy_data(src_fd, dst_fd, size, op):
+    """
+    Copie size octets par blocs, par le moyen le plus direct disponible.
+    copy_file_range et sendfile peuvent renvoyer 0 avant la fin sans que le
+    fichier ait raccourci (procfs, certains FUSE, autre système de fichiers
+    sur un noyau ancien) : le bloc est alors repris par le moyen suivant ;
+    seul read permet de conclure à un fichier raccourci.
+    @return : octets copiés
+    """
+    copy_range = getattr(os, "copy_file_range", None)
+    sendfile = getattr(os, "sendfile", None)
+    done = 0
+    while done < size:
+        op.checkpoint()
+        count = min(CHUNK, size - done)
+        if copy_range is not None:
+            try:
+                n = copy_range(src_fd, dst_fd, count)
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                    raise
+                n = 0
+            if not n:
+                copy_range = None
+                continue
+        elif sendfile is not None:
+            try:
+                n = sendfile(dst_fd, src_fd, None, count)
+            except OSError as e:
+                if e.errno not in (errno.ENOSYS, errno.EINVAL):
+                    raise
+                n = 0
+            if not n:
+                sendfile = None
+                continue
+        else:
+            data = os.read(src_fd, count)
+            if not data:
+                break  # fichier raccourci pendant la copie
+            n = len(data)
+            view = memoryview(data)
+            while view:
+                view = view[os.write(dst_fd, view):]
+        done += n
+        op.add_progress(n)
+    return done
+
+
+def copy_file(src, dst, op, st=None):
+    """
+    Copie un fichier (contenu, droits, dates) ; dst est supprimé si la copie
+    est annulée ou échoue. La taille de dst est vérifiée avant de compter le
+    fichier comme copié : un déplacement ne supprime la source qu'ensuite.
+    """
+    st = st or os.stat(src)
+    src_fd = os.open(src, os.O_RDONLY)
+    try:
+        dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, stat.S_IMODE(st.st_mode))
+        try:
+            copied = _copy_data(src_fd, dst_fd, st.st_size, op)
+            if os.fstat(dst_fd).st_size != copied:
+                raise OSError(errno.EIO, "copie incomplète")
+        except BaseException:
+            os.close(dst_fd)
+            os.unlink(dst)
+            raise
+        os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+    shutil.copystat(src, dst)
+    op.add_progress(0, 1)
+
+
+class _Plan(object):
+    """
+    Ce qu'il faut faire, calculé avant de commencer : dossiers à créer (du
+    haut vers le bas), fichiers à copier, liens à recréer.
+    """
+
+    def __init__(self):
+        self.dirs = []  # (source, destination)
+        self.small = []  # (source, destination, stat)
+        self.large = []
+        self.links = []
+
+    def add_tree(self, src, dst, op):
+        stack = [(src, dst)]  # pile explicite : pas de limite de profondeur
+        while stack:
+            op.checkpoint()
+            src, dst = stack.pop()
+            try:
+                st = os.lstat(src)
+            except OSError as e:
+                op.error(src, e)
+                continue
+            if stat.S_ISLNK(st.st_mode):
+                self.links.append((src, dst))
+                op.total_files += 1
+            elif stat.S_ISDIR(st.st_mode):
+                self.dirs.append((src, dst))
+                try:
+                    with os.scandir(src) as it:
+                        names = [entry.name for entry in it]
+                except OSError as e:
+                    op.error(src, e)
+                    continue
+                # empilés à l'envers : parcourus dans l'ordre de l'énumération
+                stack.extend((os.path.join(src, name), os.path.join(dst, name)) for name in reversed(names))
+            else:
+                (self.small if st.st_size < SMALL_FILE else self.large).append((src, dst, st))
+                op.total_files += 1
+                op.total_bytes += st.st_size
+
+
+class FileOperationQueue(object):
+    """
+    File d'opérations exécutées une par une dans un thread dédié.
+    @param on_progress : fonction(opération) appelée pendant l'exécution,
+                         depuis un thread du moteur
+    @param on_finished : fonction(opération) appelée à la fin (terminée,
+                         annulée ou en erreur), depuis un thread du moteur
+    """
+
+    def __init__(self, workers=WORKERS, on_progress=None, on_finished=None):
+        self.workers = workers
+        self.on_progress = on_progress
+        self.on_finished = on_finished
+        self.current = None
+        self._queue = queue.Queue()
+        self._pending = []
+        self._lock = threading.Lock()
+        self._last_progress = 0.0
+        self._thread = threading.Thread(target=self._run, name="file-operations", daemon=True)
+        self._thread.start()
+
+    def submit(self, op):
+        with self._lock:
+            self._pending.append(op)
+        self._queue.put(op)
+        return op
+
+    def pending(self):
+        """
+        @return : opérations en attente, dans l'ordre
+        """
+        with self._lock:
+            return list(self._pending)
+
+    def copy(self, sources, destination):
+        return self.submit(Operation(COPY, sources, destination))
+
+    def move(self, sources, destination):
+        return self.submit(Operation(MOVE, sources, destination))
+
+    def delete(self, sources):
+        return self.submit(Operation(DELETE, sources))
+
+    def extract(self, sources, destination):
+        return self.submit(Operation(EXTRACT, sources, destination))
+
+    def shutdown(self, cancel=True):
+        if cancel:
+            for op in self.pending() + [self.current]:
+                if op is not None:
+                    op.cancel()
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            op = self._queue.get()
+            if op is None:
+                return
+            with self._lock:
+                self._pending.remove(op)
+            self.current = op
+            try:
+                op.checkpoint()  # mise en pause ou annulée pendant l'attente
+                op.started = True
+                op.state = "running"
+                op.throughput()
+                if op.kind == DELETE:
+                    self._delete(op)
+                elif op.kind == EXTRACT:
+                    self._extract(op)
+                else:
+                    self._transfer(op)
+                op.state = "done"
+            except Cancelled:
+                op.state = "cancelled"
+            except OSError as e:
+                op.error(op.destination or "", e)
+                op.state = "done"
+            except Exception as e:
+                # erreur imprévue : l'opération échoue, la file continue
+                op.error(op.destination or "", e)
+                op.state = "done"
+            self.current = None
+            self._report(op, force=True)
+            if self.on_finished is not None:
+                self.on_finished(op)
+
+    def _report(self, op, force=False):
+        if self.on_progress is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_progress < PROGRESS_INTERVAL:
+                return
+            self._last_progress = now
+        self.on_progress(op)
+
+    def _transfer(self, op):
+        plan = _Plan()
+        moved = []
+        for src in op.sources:
+            op.checkpoint()
+            dst = unique_destination(os.path.join(op.destination, os.path.basename(src.rstrip(os.sep))))
+            if op.kind == MOVE:
+                if os.path.dirname(src.rstrip(os.sep)) == op.destination.rstrip(os.sep):
+                    continue  # déjà là
+                op.total_files += 1
+                try:
+                    os.rename(src, dst)  # même système de fichiers : immédiat
+                    op.add_progress(0, 1)
+                    continue
+                except OSError as e:
+                    if e.errno != errno.EXDEV:
+                        op.error(src, e)
+                        op.add_progress(0, 1)
+                        continue
+                op.total_files -= 1  # compté avec son contenu par le plan
+                moved.append(src)
+            if os.path.isdir(src) and not os.path.islink(src) and \
+                    os.path.commonpath([os.path.abspath(src), os.path.abspath(dst)]) == os.path.abspath(src):
+                op.error(src, OSError(errno.EINVAL, "destination à l'intérieur de la source"))
+                continue
+            plan.add_tree(src, dst, op)
+            self._report(op)
+
+        for src, dst in plan.dirs:
+            op.checkpoint()
+            try:
+                os.makedirs(dst, exist_ok=True)
+            except OSError as e:
+                op.error(dst, e)
+        for src, dst in plan.links:
+            try:
+                os.symlink(os.readlink(src), dst)
+                op.add_progress(0, 1)
+            except OSError as e:
+                op.error(src, e)
+
+        # petits fichiers en parallèle : le coût est dans les métadonnées, pas le débit
+        if plan.small:
+            with ThreadPoolExecutor(self.workers) as executor:
+                futures = [executor.submit(self._copy_one, op, src, dst, st) for src, dst, st in plan.small]
+                for future in futures:
+                    if op.cancelled:
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        break
+                    future.result()
+                    self._report(op)
+        # gros fichiers l'un après l'autre : une seule lecture séquentielle à la fois
+        for src, dst, st in plan.large:
+            self._copy_one(op, src, dst, st)
+            self._report(op)
+        op.checkpoint()
+
+        if moved and not op.errors:
+            self._remove_trees(op, moved, count=False)
+
+    def _copy_one(self, op, src, dst, st):
+        try:
+            copy_file(src, dst, op, st)
+        except Cancelled:
+            pass  # l'arrêt est constaté par l'appelant
+        except OSError as e:
+            op.error(src, e)
+            op.add_progress(0, 1)
+        if not op.cancelled:
+            self._report(op)
+
+    def _extract(self, op):
+        members = []
+        for src in op.sources:
+            backend = backend_for(src)
+            info = backend.stat(src)
+            if info is None:
+                op.error(src, OSError(errno.ENOENT, os.strerror(errno.ENOENT)))
+                continue
+            members.append((backend, src))
+            op.total_files += 1
+            op.total_bytes += info[1]
+        self._report(op, force=True)
+        for backend, src in members:
+            dst = unique_destination(os.path.join(op.destination, os.path.basename(src)))
+            try:
+                with backend.open(src) as source, open(dst, "wb") as f:
+                    while True:
+                        op.checkpoint()
+                        chunk = source.read(CHUNK)
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                        op.add_progress(len(chunk))
+                        self._report(op)
+            except BaseException as e:
+                if os.path.exists(dst):
+                    os.unlink(dst)
+                if not isinstance(e, OSError):
+                    raise
+                op.error(src, e)
+                continue
+            op.targets.append(dst)
+            op.add_progress(0, 1)
+
+    def _delete(self, op):
+        for src in op.sources:
+            try:
+                st = os.lstat(src)
+            except OSError as e:
+                op.error(src, e)
+                continue
+            op.total_files += 1
+            if stat.S_ISDIR(st.st_mode):
+                for _, dirs, files in os.walk(src):
+                    op.total_files += len(dirs) + len(files)
+        self._report(op, force=True)
+        self._remove_trees(op, op.sources, count=True)
+
+    def _remove_trees(self, op, paths, count):
+        def unlink(path):
+            try:
+                os.unlink(path)
+            except OSError as e:
+                op.error(path, e)
+            if count:
+                op.add_progress(0, 1)
+
+        with ThreadPoolExecutor(self.workers) as executor:
+            for path in paths:
+                op.checkpoint()
+                if os.path.isdir(path) and not os.path.islink(path):
+                    # du bas vers le haut : un dossier est vidé avant d'être supprimé
+                    for root, dirs, files in os.walk(path, topdown=False):
+                        op.checkpoint()
+                        list(executor.map(unlink, [os.path.join(root, name) for name in files]))
+                        for name in dirs:
+                            sub = os.path.join(root, name)
+                            if os.path.islink(sub):
+                                unlink(sub)
+                            else:
+                                self._rmdir(op, sub, count)
+                        self._report(op)
+                    self._rmdir(op, path, count)
+                else:
+                    unlink(path)
+                self._report(op)
+
+    def _rmdir(self, op, path, count):
+        try:
+            os.rmdir(path)
+        except OSError as e:
+            op.error(path, e)
+        if count:
+            op.add_progress(0, 1)
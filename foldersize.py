@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+Calcul parallèle de la taille récursive d'un dossier.
+
+Chaque dossier est lu par os.scandir dans un pool de threads (scandir et stat
+libèrent le GIL). Les totaux partiels sont remontés au fur et à mesure ; le
+total d'un sous-dossier terminé est mis en cache sous la clé (st_dev, st_ino)
+avec sa date de modification et la liste de ses sous-dossiers, ce qui évite
+de reparcourir un dossier imbriqué déjà compté lors d'un calcul précédent.
+
+Un total en cache n'est repris qu'après un stat de chacun des dossiers de
+son sous-arbre : une création, une suppression ou un renommage à n'importe
+quelle profondeur change la date d'un de ces dossiers, et le sous-arbre est
+alors reparcouru. Cela ne coûte qu'un stat par dossier, sans scandir ni
+stat des fichiers. Chaque sous-dossier est vérifié dans sa propre tâche du
+pool, et le verdict de chaque dossier vérifié est noté : quand un dossier
+est reparcouru, ses sous-dossiers ne sont pas stat une seconde fois.
+
+En revanche, un fichier modifié sur place (sans création ni suppression) ne
+change la date d'aucun dossier : son ancienne taille reste comptée jusqu'à
+ce que son dossier change.
+
+Aucune dépendance Qt.
+"""
+import os
+import stat
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+PROGRESS_INTERVAL = 0.1
+CACHE_MAX_ENTRIES = 1000000
+
+
+class SubtreeCache(object):
+    """
+    Totaux (octets, fichiers, dossiers) des sous-arbres, bornés en nombre (LRU),
+    avec les sous-dossiers directs de chacun : ((nom, clé, mtime), ...).
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def get(self, key, mtime):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[0] != mtime:
+                return None
+            self._items.move_to_end(key)
+            return item[1:]
+
+    def put(self, key, mtime, nbytes, files, dirs, children=()):
+        with self._lock:
+            self._items[key] = (mtime, nbytes, files, dirs, children)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+class _Node(object):
+    __slots__ = ("path", "key", "mtime", "parent", "pending", "bytes", "files", "dirs", "children")
+
+    def __init__(self, path, key, mtime, parent):
+        self.path = path
+        self.key = key
+        self.mtime = mtime
+        self.parent = parent
+        self.pending = 1  # le dossier lui-même, puis un par sous-dossier soumis
+        self.bytes = 0
+        self.files = 0
+        self.dirs = 0
+        self.children = ()  # (nom, clé, mtime) des sous-dossiers directs
+
+
+class FolderSizeWalker(object):
+    """
+    Parcours d'une arborescence ; run() bloque jusqu'à la fin ou l'annulation.
+    Les liens symboliques ne sont pas suivis (comptés comme des fichiers).
+    @param on_progress : fonction(octets, fichiers, dossiers) appelée au plus
+                         tous les PROGRESS_INTERVAL secondes, depuis un thread du pool
+    @param on_subtree : fonction(chemin, octets, fichiers, dossiers) appelée à la
+                        fin de chaque sous-dossier, depuis un thread du pool
+    @param on_cached : comme on_subtree, pour un sous-dossier dont le total est
+                       repris du cache (ses propres sous-dossiers ne sont pas signalés)
+    """
+
+    def __init__(self, root, workers=DEFAULT_WORKERS, cache=None, cancelled=None,
+                 on_progress=None, on_subtree=None, on_cached=None):
+        self.root = root
+        self.workers = workers
+        self.cache = cache
+        self.cancelled = cancelled or threading.Event()
+        self.on_progress = on_progress
+        self.on_subtree = on_subtree
+        self.on_cached = on_cached
+        self.errors = 0
+
+        self._lock = threading.Lock()
+        self._verdicts = {}  # chemin -> totaux en cache vérifiés, ou None
+        self._done = threading.Event()
+        self._result = (0, 0, 0)
+        self._totals = [0, 0, 0]
+        self._last_progress = 0.0
+        self._executor = None
+
+    def run(self):
+        """
+        @return : (octets, fichiers, dossiers), ou None si le calcul a été annulé
+        """
+        try:
+            st = os.stat(self.root)
+        except OSError:
+            with self._lock:
+                self.errors += 1
+            return 0, 0, 0
+        root = _Node(self.root, (st.st_dev, st.st_ino), st.st_mtime_ns, None)
+        with ThreadPoolExecutor(self.workers) as executor:
+            self._executor = executor
+            executor.submit(self._scan, root)
+            while not self._done.wait(PROGRESS_INTERVAL):
+                if self.cancelled.is_set():
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    break
+        if self.cancelled.is_set():
+            return None
+        self._report(force=True)
+        return self._result
+
+    def _scan(self, node):
+        if self.cancelled.is_set():
+            self._done.set()
+            return
+        if node.parent is not None:
+            cached = self._cached(node.path, node.key, node.mtime)
+            if cached is not None:
+                self._reuse(node, cached)
+                return
+        nbytes = files = errors = 0
+        children = []
+        try:
+            with os.scandir(node.path) as it:
+                for entry in it:
+                    if self.cancelled.is_set():
+                        break
+                    try:
+                        st = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        errors += 1
+                        continue
+                    if stat.S_ISDIR(st.st_mode):
+                        children.append((entry.path, (st.st_dev, st.st_ino), st.st_mtime_ns))
+                    else:
+                        nbytes += st.st_size
+                        files += 1
+        except OSError:
+            errors += 1
+        if self.cancelled.is_set():
+            self._done.set()  # totaux partiels : rien ne doit entrer dans le cache
+            return
+
+        node.children = tuple((os.path.basename(path), key, mtime) for path, key, mtime in children)
+        submit = [_Node(path, key, mtime, node) for path, key, mtime in children]
+        with self._lock:
+            self.errors += errors
+            node.bytes += nbytes
+            node.files += files
+            node.pending += len(submit)
+            self._totals[0] += nbytes
+            self._totals[1] += files
+            self._totals[2] += len(submit)
+        for child in submit:
+            try:
+                self._executor.submit(self._scan, child)
+            except RuntimeError:
+                return  # pool arrêté : calcul annulé
+        self._report()
+        self._complete(node)
+
+    def _reuse(self, node, cached):
+        # sous-dossier repris du cache : ses totaux remontent directement au parent
+        parent = node.parent
+        with self._lock:
+            parent.bytes += cached[0]
+            parent.files += cached[1]
+            parent.dirs += cached[2] + 1
+            self._totals[0] += cached[0]
+            self._totals[1] += cached[1]
+            self._totals[2] += cached[2]
+        if self.on_cached is not None:
+            self.on_cached(node.path, *cached)
+        self._report()
+        self._complete(parent)
+
+    def _cached(self, path, key, mtime):
+        """
+        @return : (octets, fichiers, dossiers) en cache du dossier path, si ni
+                  lui ni aucun dossier de son sous-arbre n'a changé, sinon None
+        """
+        if self.cache is None:
+            return None
+        with self._lock:
+            if path in self._verdicts:
+                return self._verdicts.pop(path)
+        item = self.cache.get(key, mtime)
+        if item is None:
+            return None
+        # parcours en profondeur ; un dossier est valide quand tout son sous-arbre l'est
+        verdicts = {}
+        stack = [(path, item, iter(item[3]))]
+        while stack:
+            folder, item, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                for name, _, _ in item[3]:
+                    del verdicts[os.path.join(folder, name)]  # repris avec folder
+                verdicts[folder] = item[:3]
+                continue
+            name, key, mtime = child
+            sub = os.path.join(folder, name)
+            try:
+                st = os.stat(sub, follow_symlinks=False)
+            except OSError:
+                st = None
+            inner = None
+            if st is not None and (st.st_dev, st.st_ino) == key and st.st_mtime_ns == mtime:
+                inner = self.cache.get(key, mtime)  # None si évincé du cache
+            if inner is None:
+                # la branche en cours change : ses dossiers seront reparcourus,
+                # ceux déjà vérifiés à côté restent valides
+                for folder, _, _ in stack:
+                    verdicts[folder] = None
+                break
+            stack.append((sub, inner, iter(inner[3])))
+        cached = verdicts.pop(path)
+        if verdicts:
+            with self._lock:
+                self._verdicts.update(verdicts)
+        return cached
+
+    def _complete(self, node):
+        # remonte les totaux tant que des dossiers se terminent
+        while node is not None:
+            with self._lock:
+                node.pending -= 1
+                if node.pending:
+                    return
+                parent = node.parent
+                if parent is not None:
+                    parent.bytes += node.bytes
+                    parent.files += node.files
+                    parent.dirs += node.dirs + 1
+            if self.cache is not None:
+                self.cache.put(node.key, node.mtime, node.bytes, node.files, node.dirs, node.children)
+            if self.on_subtree is not None:
+                self.on_subtree(node.path, node.bytes, node.files, node.dirs)
+            if parent is None:
+                self._result = (node.bytes, node.files, node.dirs)
+                self._done.set()
+            node = parent
+
+    def _report(self, force=False):
+        if self.on_progress is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_progress < PROGRESS_INTERVAL:
+                return
+            self._last_progress = now
+            totals = tuple(self._totals)
+        self.on_progress(*totals)
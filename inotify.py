@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Surveillance des dossiers par inotify (Linux).
+
+QFileSystemWatcher signale seulement « le dossier a changé », ce qui oblige
+à relire tout le dossier ; sur un dossier de compilation qui change des
+milliers de fois par seconde, c'est une relecture permanente. Ici, les
+noms touchés sont collectés par dossier et transmis à cadence fixe : le
+service n'a plus qu'à relire ces entrées. Un débordement de la file du
+noyau (IN_Q_OVERFLOW) est signalé pour qu'on relise tout.
+"""
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+
+from PyQt5.QtCore import QObject, QSocketNotifier, QTimer, pyqtSignal
+
+FLUSH_MS = 100  # cadence de transmission des changements
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_EXCL_UNLINK = 0x04000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+              IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_EXCL_UNLINK)
+
+_EVENT = struct.Struct("iIII")
+_libc = None
+
+
+def _load_libc():
+    global _libc
+    if _libc is None and sys.platform.startswith("linux"):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            libc.inotify_init1
+        except (OSError, AttributeError):
+            return None
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        _libc = libc
+    return _libc
+
+
+def inotify_available():
+    return _load_libc() is not None
+
+
+class InotifyWatcher(QObject):
+    """
+    Equivalent de QFileSystemWatcher pour des dossiers, avec changements détaillés.
+    changed(dossier, noms) : les entrées noms de dossier ont été créées,
+    supprimées ou modifiées depuis la dernière transmission.
+    directoryChanged(dossier) : le dossier lui-même a été supprimé ou déplacé.
+    overflowed() : des événements ont été perdus, tout doit être relu.
+    """
+    changed = pyqtSignal(str, object)
+    directoryChanged = pyqtSignal(str)
+    overflowed = pyqtSignal()
+
+    def __init__(self, parent=None):
+        QObject.__init__(self, parent)
+        libc = _load_libc()
+        if libc is None:
+            raise OSError("inotify indisponible")
+        self._libc = libc
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        self._paths = {}  # wd -> dossier
+        self._wds = {}  # dossier -> wd
+        self._pending = {}  # dossier -> noms touchés
+
+        self._notifier = QSocketNotifier(self._fd, QSocketNotifier.Read, self)
+        self._notifier.activated.connect(self._read)
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(FLUSH_MS)
+        self._timer.timeout.connect(self._flush)
+
+    def addPath(self, path):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            return False  # limite max_user_watches atteinte, droits...
+        self._paths[wd] = path
+        self._wds[path] = wd
+        return True
+
+    def removePath(self, path):
+        wd = self._wds.pop(path, None)
+        if wd is None:
+            return False
+        self._paths.pop(wd, None)
+        self._pending.pop(path, None)
+        self._libc.inotify_rm_watch(self._fd, wd)
+        return True
+
+    def directories(self):
+        return list(self._wds)
+
+    def close(self):
+        if self._fd >= 0:
+            self._notifier.setEnabled(False)
+            os.close(self._fd)
+            self._fd = -1
+
+    def _read(self):
+        try:
+            data = os.read(self._fd, 256 * 1024)
+        except BlockingIOError:
+            return
+        except OSError:
+            return
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            wd, mask, cookie, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                self._pending.clear()
+                self.overflowed.emit()
+                continue
+            path = self._paths.get(wd)
+            if path is None:
+                continue
+            if mask & IN_IGNORED:
+                # watch retiré par le noyau (dossier supprimé)
+                del self._paths[wd]
+                self._wds.pop(path, None)
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                self.directoryChanged.emit(path)
+                continue
+            if name:
+                self._pending.setdefault(path, set()).add(os.fsdecode(name))
+        if self._pending and not self._timer.isActive():
+            self._timer.start()
+
+    def _flush(self):
+        pending, self._pending = self._pending, {}
+        for path, names in pending.items():
+            self.changed.emit(path, names)
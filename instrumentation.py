@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+Mesure des temps du chemin de navigation.
+
+Chaque mesure (énumération d'un dossier, lot de stat, remise à zéro d'un
+modèle, peinture d'une vue...) alimente un histogramme à échelle
+log-linéaire, à la manière de HdrHistogram : 32 sous-intervalles par
+puissance de deux, soit une précision relative d'environ 3 % sur toute la
+plage, en microsecondes. Les histogrammes existent pour l'ensemble des
+dossiers et par dossier (les plus récents seulement).
+
+Les dernières mesures sont aussi gardées comme événements, exportables au
+format Chrome trace (chrome://tracing, Perfetto).
+
+Désactivé par défaut : record() rend la main dès le premier test et span()
+renvoie un objet vide partagé. S'active avec EXPLORER_TRACE=1 ou
+RECORDER.enable().
+
+Aucune dépendance Qt.
+"""
+import json
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict, deque
+
+SUB_BITS = 5
+DIRECTORY_HISTOGRAMS = 256  # dossiers suivis individuellement
+TRACE_EVENTS = 100000
+
+clock = time.perf_counter_ns
+
+
+class Histogram(object):
+    """
+    Histogramme log-linéaire de valeurs entières positives (microsecondes).
+    """
+
+    def __init__(self):
+        self.counts = array('Q')
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    @staticmethod
+    def bucket(value):
+        shift = max(0, value.bit_length() - SUB_BITS - 1)
+        return (shift << SUB_BITS) + (value >> shift)
+
+    @staticmethod
+    def bucket_value(index):
+        """
+        @return : plus petite valeur de l'intervalle index
+        """
+        shift = max(0, (index >> SUB_BITS) - 1)
+        return (index - (shift << SUB_BITS)) << shift
+
+    def record(self, value):
+        value = max(0, int(value))
+        index = self.bucket(value)
+        if index >= len(self.counts):
+            self.counts.extend([0] * (index + 1 - len(self.counts)))
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.min = value if self.min is None else min(self.min, value)
+
+    def merge(self, other):
+        if len(other.counts) > len(self.counts):
+            self.counts.extend([0] * (len(other.counts) - len(self.counts)))
+        for index, n in enumerate(other.counts):
+            self.counts[index] += n
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+
+    def percentile(self, p):
+        if not self.count:
+            return 0
+        rank = max(1, int(round(self.count * p / 100.0)))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                # plus grande valeur équivalente de l'intervalle, comme HdrHistogram
+                return min(self.max, self.bucket_value(index + 1) - 1)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "min_us": self.min or 0,
+            "mean_us": self.mean(),
+            "p50_us": self.percentile(50),
+            "p90_us": self.percentile(90),
+            "p99_us": self.percentile(99),
+            "max_us": self.max,
+            "buckets": [[self.bucket_value(i), n] for i, n in enumerate(self.counts) if n],
+        }
+
+
+class _NullSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span(object):
+    __slots__ = ("recorder", "name", "path", "start")
+
+    def __init__(self, recorder, name, path):
+        self.recorder = recorder
+        self.name = name
+        self.path = path
+
+    def __enter__(self):
+        self.start = clock()
+        return self
+
+    def __exit__(self, *exc):
+        self.recorder.record(self.name, self.start, path=self.path)
+        return False
+
+
+class Recorder(object):
+    """
+    Histogrammes et événements ; record() peut être appelé depuis n'importe quel thread.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.reset()
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def reset(self):
+        with self._lock:
+            self.epoch = clock()
+            self.totals = OrderedDict()  # nom -> Histogram, tous dossiers confondus
+            self.directories = OrderedDict()  # (nom, dossier) -> Histogram, LRU
+            self.events = deque(maxlen=TRACE_EVENTS)
+
+    def record(self, name, start, end=None, path=None):
+        """
+        Enregistre une durée mesurée avec clock().
+        @param path : dossier concerné, pour l'histogramme par dossier
+        """
+        if not self.enabled:
+            return
+        end = clock() if end is None else end
+        micros = (end - start) // 1000
+        with self._lock:
+            histogram = self.totals.get(name)
+            if histogram is None:
+                histogram = self.totals[name] = Histogram()
+            histogram.record(micros)
+            if path is not None:
+                key = (name, path)
+                histogram = self.directories.get(key)
+                if histogram is None:
+                    histogram = self.directories[key] = Histogram()
+                    if len(self.directories) > DIRECTORY_HISTOGRAMS:
+                        self.directories.popitem(last=False)
+                else:
+                    self.directories.move_to_end(key)
+                histogram.record(micros)
+            self.events.append((name, path, start, end, threading.get_ident()))
+
+    def span(self, name, path=None):
+        """
+        Mesure d'un bloc : with RECORDER.span("nom", dossier): ...
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, path)
+
+    def summary(self):
+        """
+        @return : liste de (nom, nombre, p50, p99, max) en microsecondes
+        """
+        with self._lock:
+            return [(name, h.count, h.percentile(50), h.percentile(99), h.max)
+                    for name, h in self.totals.items()]
+
+    def to_json(self):
+        with self._lock:
+            return {
+                "totals": dict((name, h.to_dict()) for name, h in self.totals.items()),
+                "directories": [dict(h.to_dict(), name=name, path=path)
+                                for (name, path), h in self.directories.items()],
+            }
+
+    def chrome_trace(self):
+        """
+        @return : événements au format Chrome trace (phase X, durées en microsecondes)
+        """
+        pid = os.getpid()
+        with self._lock:
+            events = list(self.events)
+            epoch = self.epoch
+        trace = []
+        for name, path, start, end, tid in events:
+            event = {"name": name, "cat": "explorer", "ph": "X", "pid": pid, "tid": tid,
+                     "ts": (start - epoch) / 1000.0, "dur": (end - start) / 1000.0}
+            if path is not None:
+                event["args"] = {"path": path}
+            trace.append(event)
+        return {"traceEvents": trace, "displayTimeUnit": "ms"}
+
+    def export(self, path, chrome=False):
+        data = self.chrome_trace() if chrome else self.to_json()
+        with open(path, "w") as f:
+            json.dump(data, f)
+
+
+RECORDER = Recorder(enabled=os.environ.get("EXPLORER_TRACE", "0") != "0")
+
+
+def format_summary(summary, names=None):
+    """
+    @return : texte court pour la barre d'état, ex. "listing 3.1/12 ms"
+    """
+    parts = []
+    for name, count, p50, p99, _ in summary:
+        if count and (names is None or name in names):
+            parts.append("{0} {1:.1f}/{2:.1f} ms".format(name, p50 / 1000.0, p99 / 1000.0))
+    return " · ".join(parts)
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""
+Modèle de liste du panneau de fichiers.
+
+Le contenu vient du DirectoryService (snapshots), partagé avec l'arborescence :
+le dossier est énuméré par lots en arrière-plan et exposé à la vue
+progressivement via canFetchMore/fetchMore. Un changement de dossier annule
+immédiatement l'énumération en cours.
+"""
+import os
+import stat
+
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, Qt, pyqtSignal
+from PyQt5.QtWidgets import QFileIconProvider
+
+from explorer.entrystore import EntryStore, RowSelection
+from explorer.instrumentation import RECORDER, clock
+from explorer.treeview import TEXT_PLAIN, URI_LIST, LazyMimeData
+
+FETCH_STEP = 256  # nombre de lignes ajoutées à la vue par fetchMore
+
+
+class ListingModel(QAbstractListModel):
+    """
+    Remplace QFileSystemModel pour le panneau de liste.
+    Seules les lignes demandées par la vue sont insérées ; le reste attend
+    dans l'instantané jusqu'au prochain fetchMore.
+    """
+    directoryLoaded = pyqtSignal(str)
+    directoryFailed = pyqtSignal(str, str)  # chemin, message
+    rootPathChanged = pyqtSignal(str)
+
+    def __init__(self, service, parent=None):
+        QAbstractListModel.__init__(self, parent)
+        self.service = service
+        self._root = ""
+        self._entries = EntryStore()
+        self._rows = 0
+        self._eager = False  # toutes les lignes exposées sans attendre la vue (tri, filtre)
+        self._removing = 0
+        self._reset_started = 0
+        self._navigated = 0  # clock() du dernier changement de dossier, jusqu'à la première ligne
+
+        service.aboutToReset.connect(self._on_about_to_reset)
+        service.reset.connect(self._on_reset)
+        service.appended.connect(self._on_appended)
+        service.aboutToRemove.connect(self._on_about_to_remove)
+        service.removed.connect(self._on_removed)
+        service.changed.connect(self._on_changed)
+        service.loaded.connect(self._on_loaded)
+        service.failed.connect(self._on_failed)
+
+        provider = QFileIconProvider()
+        self._dir_icon = provider.icon(QFileIconProvider.Folder)
+        self._file_icon = provider.icon(QFileIconProvider.File)
+        self.thumbnails = None
+
+    def setThumbnails(self, service):
+        """
+        Active (service de miniatures) ou désactive (None) les miniatures des images.
+        """
+        if self.thumbnails is not None:
+            self.thumbnails.thumbnailReady.disconnect(self._on_thumbnail)
+        self.thumbnails = service
+        if service is not None:
+            service.thumbnailReady.connect(self._on_thumbnail)
+        if self._rows:
+            self.dataChanged.emit(self.index(0), self.index(self._rows - 1), [Qt.DecorationRole])
+
+    def setEager(self, eager):
+        """
+        En mode eager, chaque ligne de l'instantané est exposée dès son arrivée :
+        un tri ou un filtre au-dessus du modèle a besoin du dossier entier.
+        """
+        self._eager = eager
+        if eager:
+            self.fetchMore()
+
+    def loading(self):
+        """
+        @return : True tant que le dossier courant est en cours d'énumération
+        """
+        snap = self.service.snapshot(self._root)
+        return snap is None or not snap.complete or snap.busy
+
+    def thumbnailKey(self, row):
+        """
+        @return : (chemin, mtime) de la miniature de la ligne, ou None si elle n'en a pas
+        """
+        if self.thumbnails is None or not stat.S_ISREG(self._entries.modes[row]):
+            return None
+        name = self._entries.name(row)
+        if not self.thumbnails.handles(name):
+            return None
+        return os.path.join(self._root, name), self._entries.mtimes[row]
+
+    def rootPath(self):
+        return self._root
+
+    def setRootPath(self, path):
+        """
+        Affiche le contenu de path. La référence sur le dossier précédent est
+        rendue, ce qui annule son énumération si personne d'autre ne l'utilise.
+        """
+        old = self._root
+        if path == old:
+            self.service.refresh(path)
+            return
+        self._navigated = clock()
+        with RECORDER.span("model_reset", path):
+            self.beginResetModel()
+            snap = self.service.acquire(path)
+            self._root = path
+            self._entries = snap.store
+            self._rows = len(self._entries) if self._eager else min(FETCH_STEP, len(self._entries))
+            self.endResetModel()
+        self._first_row()
+        if old:
+            self.service.release(old)
+        self.rootPathChanged.emit(path)
+        if snap.complete and not snap.busy:
+            self.directoryLoaded.emit(path)
+
+    def cancel(self):
+        self.service.cancel(self._root)
+
+    def filePath(self, index):
+        return os.path.join(self._root, self._entries.name(index.row()))
+
+    def indexForName(self, name):
+        """
+        @return : index de l'entrée name, dont la ligne est rendue visible par
+                  la vue si besoin ; index invalide si elle n'existe pas
+        """
+        row = self._entries.find(name)
+        if row < 0:
+            return QModelIndex()
+        self._expose(row)
+        return self.index(row)
+
+    def indexesForNames(self, names, hints=None):
+        """
+        Comme indexForName pour plusieurs noms, en un seul parcours de
+        l'instantané et une seule insertion de lignes.
+        @param hints : {nom : ligne} probables, voir EntryStore.find_many
+        @return : {nom : index} des noms trouvés
+        """
+        rows = self._entries.find_many(names, hints)
+        if rows:
+            self._expose(max(rows.values()))
+        return {name: self.index(row) for name, row in rows.items()}
+
+    def _expose(self, row):
+        if row >= self._rows:
+            stop = min(len(self._entries), row + FETCH_STEP)
+            self.beginInsertRows(QModelIndex(), self._rows, stop - 1)
+            self._rows = stop
+            self.endInsertRows()
+
+    def isDir(self, index):
+        return stat.S_ISDIR(self._entries.modes[index.row()])
+
+    def entries(self):
+        return self._entries
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self._rows
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= self._rows:
+            return None
+        row = index.row()
+        if role == Qt.DisplayRole:
+            return self._entries.name(row)
+        if role == Qt.DecorationRole:
+            key = self.thumbnailKey(row)
+            if key is not None:
+                return self.thumbnails.icon(*key)
+            return self._dir_icon if stat.S_ISDIR(self._entries.modes[row]) else self._file_icon
+        return None
+
+    def flags(self, index):
+        flags = QAbstractListModel.flags(self, index)
+        if index.isValid():
+            flags |= Qt.ItemIsDragEnabled
+        return flags
+
+    def mimeTypes(self):
+        return [URI_LIST, TEXT_PLAIN]
+
+    def supportedDragActions(self):
+        return Qt.CopyAction | Qt.MoveAction | Qt.LinkAction
+
+    def mimeData(self, indexes):
+        """
+        Glisser : seules les plages de lignes sont gardées, sur une vue figée
+        de l'instantané ; les URL sont produites à la demande de la cible.
+        """
+        rows = sorted(set(map(QModelIndex.row, indexes)))
+        return LazyMimeData(RowSelection(self._root, self._entries.view(), rows))
+
+    def canFetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return False
+        return self._rows < len(self._entries)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        count = len(self._entries) - self._rows
+        if not self._eager:
+            count = min(FETCH_STEP, count)
+        if count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self._rows, self._rows + count - 1)
+        self._rows += count
+        self.endInsertRows()
+        self._first_row()
+
+    def _first_row(self):
+        if self._navigated and self._rows:
+            RECORDER.record("first_row", self._navigated, path=self._root)
+            self._navigated = 0
+
+    def _on_about_to_reset(self, path):
+        if path == self._root:
+            self._reset_started = clock()
+            self.beginResetModel()
+
+    def _on_reset(self, path):
+        if path == self._root:
+            self._entries = self.service.snapshot(path).store
+            self._rows = min(max(self._rows, FETCH_STEP), len(self._entries))
+            if self._eager:
+                self._rows = len(self._entries)
+            self.endResetModel()
+            RECORDER.record("model_reset", self._reset_started, path=path)
+            self._first_row()
+
+    def _on_appended(self, path, first, last):
+        # la vue a déjà tout consommé : elle ne redemandera pas d'elle-même
+        if path == self._root and (self._rows == first or self._eager):
+            self.fetchMore()
+
+    def _on_about_to_remove(self, path, first, last):
+        if path != self._root or first >= self._rows:
+            self._removing = 0
+            return
+        last = min(last, self._rows - 1)
+        self._removing = last - first + 1
+        self.beginRemoveRows(QModelIndex(), first, last)
+
+    def _on_removed(self, path, first, last):
+        if path == self._root and self._removing:
+            self._rows -= self._removing
+            self._removing = 0
+            self.endRemoveRows()
+
+    def _on_changed(self, path, rows):
+        if path != self._root:
+            return
+        rows = [row for row in rows if row < self._rows]
+        if rows:
+            self.dataChanged.emit(self.index(min(rows)), self.index(max(rows)))
+
+    def _on_loaded(self, path):
+        if path == self._root:
+            self.directoryLoaded.emit(path)
+
+    def _on_failed(self, path, message):
+        if path == self._root:
+            self.directoryFailed.emit(path, message)
+
+    def _on_thumbnail(self, path):
+        dirpath, name = os.path.split(path)
+        if dirpath != self._root:
+            return
+        row = self._entries.find(name)
+        if 0 <= row < self._rows:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.DecorationRole])
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Affichage des mesures (instrumentation) dans la fenêtre.
+
+Le résumé des histogrammes est rafraîchi dans la barre d'état ; la durée de
+peinture des vues est mesurée par un filtre d'événements posé sur leur
+viewport. Rien n'est installé tant que les mesures sont désactivées.
+"""
+from PyQt5.QtCore import QEvent, QObject, QTimer
+from PyQt5.QtWidgets import QLabel
+
+from explorer.instrumentation import RECORDER, clock, format_summary
+
+REFRESH_MS = 500
+STATUS_NAMES = ("first_row", "listing", "stat_batch", "model_reset", "paint_list", "paint_tree")
+
+
+class MetricsStatus(QObject):
+    """
+    Mesures de peinture des vues et résumé dans la barre d'état.
+    @param views : dictionnaire nom de la mesure -> vue (QAbstractScrollArea)
+    """
+
+    def __init__(self, statusbar, views, recorder=RECORDER, parent=None):
+        QObject.__init__(self, parent)
+        self.recorder = recorder
+        self.views = views
+        self._viewports = dict((view.viewport(), (name, view)) for name, view in views.items())
+        self.label = QLabel(statusbar)
+        statusbar.addPermanentWidget(self.label)
+        self._timer = QTimer(self)
+        self._timer.setInterval(REFRESH_MS)
+        self._timer.timeout.connect(self.refresh)
+        self.setEnabled(recorder.enabled)
+
+    def setEnabled(self, enabled):
+        self.recorder.enable(enabled)
+        for viewport in self._viewports:
+            if enabled:
+                viewport.installEventFilter(self)
+            else:
+                viewport.removeEventFilter(self)
+        self.label.setVisible(enabled)
+        if enabled:
+            self._timer.start()
+            self.refresh()
+        else:
+            self._timer.stop()
+
+    def refresh(self):
+        self.label.setText(format_summary(self.recorder.summary(), STATUS_NAMES) or "Mesures : en attente")
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Paint and obj in self._viewports:
+            name, view = self._viewports[obj]
+            start = clock()
+            view.viewportEvent(event)  # la peinture elle-même
+            self.recorder.record(name, start)
+            return True
+        return QObject.eventFilter(self, obj, event)
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+Planification des changements de dossier du panneau de liste.
+
+Les demandes successives (flèche maintenue dans l'arborescence) sont
+regroupées : seule la dernière est listée après un court délai, et
+l'énumération devenue inutile est annulée. Au repos, les dossiers voisins
+de la sélection sont préchargés dans un cache mémoire borné.
+
+L'historique (Précédent, Suivant) garde pour chaque dossier visité l'état
+de la liste quand on l'a quitté ; la liste elle-même reste quelque temps
+dans un second cache borné, le cache d'historique du DirectoryService.
+"""
+import threading
+from collections import OrderedDict
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+
+from explorer.backends import backend_for
+from explorer.entrystore import EntryStore
+
+DEBOUNCE_MS = 120
+PREFETCH_MAX_DIRS = 8
+PREFETCH_MAX_BYTES = 64 * 1024 * 1024
+HISTORY_MAX_ENTRIES = 100
+HISTORY_MAX_DIRS = 32  # listes gardées pour un retour instantané
+HISTORY_MAX_BYTES = 64 * 1024 * 1024
+MAX_SELECTED = 1000  # noms sélectionnés retenus par entrée de l'historique
+
+
+class PrefetchCache(object):
+    """
+    Listes préchargées (ou récemment quittées), évincées de la moins récente
+    à la plus récente. Une liste est retirée du cache quand le modèle la prend.
+    """
+
+    def __init__(self, max_dirs=PREFETCH_MAX_DIRS, max_bytes=PREFETCH_MAX_BYTES):
+        self.max_dirs = max_dirs
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+        self._bytes = 0
+
+    def __contains__(self, path):
+        with self._lock:
+            return path in self._items
+
+    def put(self, path, mtime, store):
+        nbytes = store.nbytes()
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(path, None)
+            if old is not None:
+                self._bytes -= old[1].nbytes()
+            self._items[path] = (mtime, store)
+            self._bytes += nbytes
+            while len(self._items) > self.max_dirs or self._bytes > self.max_bytes:
+                _, (_, evicted) = self._items.popitem(last=False)
+                self._bytes -= evicted.nbytes()
+
+    def take(self, path):
+        """
+        @return : (mtime, EntryStore) ou None
+        """
+        with self._lock:
+            item = self._items.pop(path, None)
+            if item is not None:
+                self._bytes -= item[1].nbytes()
+            return item
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+
+class ViewState(object):
+    """
+    État de la liste d'un dossier, tel qu'on l'a quitté.
+    @param first_row : nom de la première ligne visible
+    @param current : nom de la ligne courante
+    @param selected : noms des lignes sélectionnées (au plus MAX_SELECTED)
+    @param rows : {nom : ligne dans l'instantané} de ces noms au départ, vérifiées
+                  d'abord au retour : si le dossier n'a pas changé, rien n'est cherché
+    """
+
+    def __init__(self, first_row=None, current=None, selected=(), rows=None):
+        self.first_row = first_row
+        self.current = current
+        self.selected = list(selected)[:MAX_SELECTED]
+        self.rows = rows or {}
+
+    def names(self):
+        return [name for name in [self.first_row, self.current] + self.selected if name is not None]
+
+
+class NavigationHistory(object):
+    """
+    Dossiers visités, du plus ancien au plus récent, et position courante.
+    """
+
+    def __init__(self, max_entries=HISTORY_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = []  # [chemin, ViewState ou None]
+        self._index = -1
+
+    def current(self):
+        return self._entries[self._index][0] if self._entries else None
+
+    def visit(self, path):
+        """
+        Nouveau dossier : les entrées suivantes (Suivant) sont oubliées.
+        """
+        if path == self.current():
+            return
+        del self._entries[self._index + 1:]
+        self._entries.append([path, None])
+        if len(self._entries) > self.max_entries:
+            del self._entries[:len(self._entries) - self.max_entries]
+        self._index = len(self._entries) - 1
+
+    def save_state(self, path, state):
+        if path == self.current():
+            self._entries[self._index][1] = state
+
+    def can_go_back(self):
+        return self._index > 0
+
+    def can_go_forward(self):
+        return self._index + 1 < len(self._entries)
+
+    def back(self):
+        """
+        @return : (chemin, ViewState ou None) de l'entrée précédente, ou None
+        """
+        if not self.can_go_back():
+            return None
+        self._index -= 1
+        return tuple(self._entries[self._index])
+
+    def forward(self):
+        """
+        @return : (chemin, ViewState ou None) de l'entrée suivante, ou None
+        """
+        if not self.can_go_forward():
+            return None
+        self._index += 1
+        return tuple(self._entries[self._index])
+
+
+class _PrefetchTask(QRunnable):
+
+    def __init__(self, path, cancelled, prefetch):
+        QRunnable.__init__(self)
+        self.path = path
+        self.cancelled = cancelled
+        self.prefetch = prefetch
+
+    def run(self):
+        if self.cancelled.is_set():
+            return
+        store = EntryStore()
+        backend = backend_for(self.path)
+        try:
+            mtime = backend.mtime(self.path)
+            for batch in backend.iter_batches(self.path, self.cancelled):
+                store.extend(batch)
+        except OSError:
+            return
+        if not self.cancelled.is_set():
+            self.prefetch.put(self.path, mtime, store)
+
+
+class NavigationScheduler(QObject):
+    """
+    Intermédiaire entre les événements de navigation et le ListingModel.
+    aboutToNavigate(ancien, nouveau) : émis juste avant de changer de dossier,
+    quand la liste montre encore l'ancien.
+    @param model : ListingModel dont le DirectoryService lit le même PrefetchCache
+    @param sibling_paths : fonction sans argument retournant les dossiers à précharger
+    """
+    aboutToNavigate = pyqtSignal(str, str)
+
+    def __init__(self, model, prefetch, sibling_paths=None, delay=DEBOUNCE_MS, parent=None):
+        QObject.__init__(self, parent)
+        self.model = model
+        self.prefetch = prefetch
+        self.sibling_paths = sibling_paths
+        self._pending = None
+        self._prefetch_cancelled = threading.Event()
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(delay)
+        self._timer.timeout.connect(self._on_timeout)
+
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(1)
+
+        self.model.directoryLoaded.connect(self._on_loaded)
+
+    def request(self, path):
+        """
+        Demande différée : relancée à chaque appel, seule la dernière aboutit.
+        """
+        self._pending = path
+        self._cancel_prefetch()
+        self.model.cancel()  # la liste affichée n'est plus celle demandée
+        self._timer.start()
+
+    def navigate(self, path):
+        """
+        Demande immédiate (clic) ; annule toute demande différée.
+        """
+        self._timer.stop()
+        self._pending = None
+        self._cancel_prefetch()
+        if path != self.model.rootPath():
+            self.aboutToNavigate.emit(self.model.rootPath(), path)
+        self.model.setRootPath(path)
+
+    def _on_timeout(self):
+        if self._pending is not None:
+            self.navigate(self._pending)
+
+    def _cancel_prefetch(self):
+        self._prefetch_cancelled.set()
+        self._prefetch_cancelled = threading.Event()
+
+    def _on_loaded(self, path):
+        if self._pending is not None or self.sibling_paths is None:
+            return
+        for sibling in self.sibling_paths():
+            if (sibling and sibling != path and sibling not in self.prefetch and
+                    sibling not in self.model.service):
+                self._pool.start(_PrefetchTask(sibling, self._prefetch_cancelled, self.prefetch))
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Clés de tri et filtre à jokers des listes de dossiers.
+
+Les clés de tri sont calculées une fois par entrée, à mesure que le dossier
+arrive : type (dossier ou fichier) et clé naturelle du nom (« fichier2 »
+avant « fichier10 »), tirée en un seul passage du tampon des noms de
+l'EntryStore. Tailles et dates sont lues directement dans ses colonnes.
+Utilisé par le panneau de liste (sorting) et par le mode sans interface
+(cli), qui affichent ainsi les mêmes listes.
+
+Aucune dépendance Qt.
+"""
+import bisect
+import fnmatch
+import re
+import stat
+from array import array
+from itertools import compress
+
+COLUMNS = ("none", "name", "size", "mtime")  # "none" : ordre de l'énumération
+
+_DIGITS = re.compile(rb"[0-9]+")
+_FLIP = bytes.maketrans(b"\x00\x01", b"\x01\x00")
+
+
+_LENGTHS = [bytes((length,)) for length in range(256)]
+
+
+def _natural_number(match):
+    # longueur (un octet) puis chiffres sans zéros de tête : l'ordre des octets devient celui des nombres
+    digits = match[0].lstrip(b"0") or b"0"
+    return _LENGTHS[min(len(digits), 255)] + digits
+
+
+def natural_keys(store, start, stop):
+    """
+    Clés naturelles des lignes start à stop (exclue) : noms en minuscules
+    (ASCII), nombres comparés par valeur. Les clés sont des str latin-1, que
+    le tri de Python compare le plus vite.
+    """
+    if start >= stop:
+        return []
+    names, offsets = store.name_columns()
+    base = offsets[start]
+    raw = bytes(names[base:offsets[stop]]).lower()
+    parts = [raw[a - base:b - base] for a, b in zip(offsets[start:stop], offsets[start + 1:stop + 1])]
+    joined = _DIGITS.sub(_natural_number, b"\0".join(parts))
+    return joined.decode("latin-1").split("\0")
+
+
+def wildcard(pattern):
+    """
+    @param pattern : motif à jokers (* ? [..]) ; sans joker, le texte est
+                     cherché n'importe où dans le nom
+    @return : expression régulière sur les noms décodés en latin-1, ou None
+    """
+    pattern = pattern.strip()
+    if not pattern:
+        return None
+    if not any(c in pattern for c in "*?["):
+        pattern = "*{0}*".format(pattern)
+    pattern = pattern.encode("utf-8", "surrogateescape").decode("latin-1")
+    return re.compile(fnmatch.translate(pattern), re.IGNORECASE | re.ASCII)
+
+
+def match_mask(store, start, stop, regex):
+    """
+    @return : bytearray, 1 pour chaque ligne de start à stop (exclue) dont le nom correspond
+    """
+    if start >= stop:
+        return bytearray()
+    names, offsets = store.name_columns()
+    base = offsets[start]
+    text = bytes(names[base:offsets[stop]]).decode("latin-1")
+    match = regex.match
+    return bytearray(match(text[a - base:b - base]) is not None
+                     for a, b in zip(offsets[start:stop], offsets[start + 1:stop + 1]))
+
+
+class SortColumns(object):
+    """
+    Clés de tri d'un EntryStore, tenues à jour pour les lignes ajoutées en
+    fin (extend) et les lignes retirées (remove). Les clés des noms ne sont
+    calculées que pour le tri par nom.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.dirs = bytearray()
+        self.names = []
+
+    def extend(self, stop, names=False):
+        """
+        Calcule les clés jusqu'à la ligne stop (exclue).
+        """
+        if len(self.dirs) < stop:
+            self.dirs.extend(map(stat.S_ISDIR, self.store.modes[len(self.dirs):stop]))
+        if names and len(self.names) < stop:
+            self.names.extend(natural_keys(self.store, len(self.names), stop))
+
+    def remove(self, first, last):
+        del self.dirs[first:last + 1]
+        del self.names[first:last + 1]
+
+    def copy(self):
+        """
+        @return : SortColumns du même EntryStore, aux clés copiées, que l'on
+                  peut compléter dans un autre thread
+        """
+        columns = SortColumns(self.store)
+        columns.dirs = bytearray(self.dirs)
+        columns.names = list(self.names)
+        return columns
+
+    def key(self, column):
+        if column == "name":
+            return self.names.__getitem__
+        if column == "size":
+            return self.store.sizes.__getitem__
+        if column == "mtime":
+            return self.store.mtimes.__getitem__
+        return None
+
+    def argsort(self, rows, column, descending=False):
+        """
+        @param rows : lignes à trier (déjà filtrées)
+        @return : array des lignes dans l'ordre d'affichage, dossiers en tête
+                  sauf dans l'ordre de l'énumération
+        """
+        key = self.key(column)
+        if key is None:
+            return array('q', rows)
+        ordered = sorted(rows, key=key)
+        dirs = list(compress(ordered, map(self.dirs.__getitem__, ordered)))
+        files = list(compress(ordered, map(self.dirs.translate(_FLIP).__getitem__, ordered)))
+        if descending:
+            dirs.reverse()
+            files.reverse()
+        return array('q', dirs + files)
+
+    def reverse(self, order):
+        """
+        @param order : lignes triées par argsort, dans un sens
+        @return : array des mêmes lignes triées dans l'autre sens, dossiers
+                  toujours en tête, sans refaire le tri
+        """
+        dirs = self.dirs
+        low, high = 0, len(order)
+        while low < high:  # fin du groupe des dossiers
+            middle = (low + high) // 2
+            if dirs[order[middle]]:
+                low = middle + 1
+            else:
+                high = middle
+        head, tail = order[:low], order[low:]
+        head.reverse()
+        tail.reverse()
+        return head + tail
+
+    def position(self, order, row, column, descending=False):
+        """
+        @return : rang où insérer row dans order, trié par argsort
+        """
+        key = self.key(column)
+        if key is None:
+            return bisect.bisect_left(order, row)
+        dirs = self.dirs
+        group, value = not dirs[row], key(row)
+        low, high = 0, len(order)
+        while low < high:
+            middle = (low + high) // 2
+            other = order[middle]
+            other_group, other_value = not dirs[other], key(other)
+            if group != other_group:
+                before = group < other_group
+            else:
+                before = other_value < value if descending else value < other_value
+            if before:
+                high = middle
+            else:
+                low = middle + 1
+        return low
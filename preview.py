@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+Lecture par fenêtres d'un fichier de taille quelconque, pour l'aperçu.
+
+Le fichier est lu par os.pread, fenêtre par fenêtre : seuls les octets de
+la fenêtre affichée sont lus, qu'il fasse un kilo-octet ou 20 Go. Chaque
+lecture est bornée par la taille actuelle du fichier, si bien qu'un journal
+tronqué pendant l'aperçu (logrotate copytruncate) donne des lignes vides
+au lieu du SIGBUS d'une projection mmap. Seuls les fichiers ordinaires sont
+ouverts, sans blocage (O_NONBLOCK) : un tube nommé ne gèle pas l'interface. La position dans le
+fichier est un décalage en octets, pas un numéro de ligne : aller à la fin
+ou au milieu ne demande que de chercher le début de la ligne la plus
+proche. Une ligne de plus de MAX_LINE octets est coupée en morceaux.
+
+Les numéros de ligne viennent d'un index clairsemé, construit en
+arrière-plan par lectures successives : le nombre de fins de ligne avant
+chaque bloc de BLOCK octets. Le numéro d'une ligne se déduit de son bloc et
+d'un comptage dans ce bloc.
+
+Une entrée d'archive ne se lit pas à une position quelconque : ses
+ARCHIVE_LIMIT premiers octets sont lus en mémoire.
+
+Aucune dépendance Qt.
+"""
+import bisect
+import errno
+import os
+import stat
+import threading
+from array import array
+
+from explorer.backends import backend_for
+
+BLOCK = 64 * 1024  # granularité de l'index des lignes
+MAX_LINE = 4096  # au-delà, une ligne est affichée en plusieurs morceaux
+SNIFF_BYTES = 8192  # octets examinés pour reconnaître un fichier binaire
+HEX_WIDTH = 16  # octets par ligne en mode hexadécimal
+ARCHIVE_LIMIT = 16 * 1024 * 1024
+_TEXT_BYTES = bytes(range(32, 127)) + b"\t\n\r\f\b\x1b"
+
+
+def is_binary(head):
+    """
+    @param head : premiers octets d'un fichier
+    @return : True si head ne ressemble pas à du texte
+    """
+    if not head:
+        return False
+    if b"\0" in head:
+        return True
+    control = len(head.translate(None, _TEXT_BYTES + bytes(range(128, 256))))
+    return control > len(head) // 10
+
+
+def open_regular(path):
+    """
+    Ouvre path en lecture sans bloquer (tube nommé, périphérique).
+    @return : descripteur
+    @raise OSError : path n'est pas un fichier ordinaire
+    """
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_NONBLOCK", 0))
+    try:
+        if not stat.S_ISREG(os.fstat(fd).st_mode):
+            raise OSError(errno.EINVAL, "pas un fichier ordinaire", path)
+    except BaseException:
+        os.close(fd)
+        raise
+    return fd
+
+
+class _FileData(object):
+    """
+    Les octets d'un fichier ouvert, lus à la demande par os.pread, avec ce
+    que FileWindow utilise des bytes : tranches, find et rfind bornés.
+    """
+
+    def __init__(self, fd):
+        self.fd = fd
+
+    def read(self, start, stop):
+        stop = min(stop, os.fstat(self.fd).st_size)  # le fichier a pu raccourcir
+        if start >= stop:
+            return b""
+        return os.pread(self.fd, stop - start, start)
+
+    def __getitem__(self, key):
+        return self.read(key.start or 0, key.stop)
+
+    def find(self, sub, start, stop):
+        found = self.read(start, stop).find(sub)
+        return found + start if found >= 0 else -1
+
+    def rfind(self, sub, start, stop):
+        found = self.read(start, stop).rfind(sub)
+        return found + start if found >= 0 else -1
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FileWindow(object):
+    """
+    Accès en lecture seule à un fichier, sans jamais le lire en entier.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.truncated = False  # entrée d'archive plus grande que ARCHIVE_LIMIT
+        backend = backend_for(path)
+        if backend.local:
+            self.buffer = _FileData(open_regular(path))
+            self.size = os.fstat(self.buffer.fd).st_size
+        else:
+            with backend.open(path) as f:
+                self.buffer = f.read(ARCHIVE_LIMIT + 1)
+            self.truncated = len(self.buffer) > ARCHIVE_LIMIT
+            self.buffer = self.buffer[:ARCHIVE_LIMIT]
+            self.size = len(self.buffer)
+        self.local = backend.local
+        self.binary = is_binary(self.buffer[:SNIFF_BYTES])
+
+    def close(self):
+        if isinstance(self.buffer, _FileData):
+            self.buffer.close()
+        self.buffer = b""
+        self.size = 0
+
+    def line_start(self, offset):
+        """
+        @return : début de la ligne (ou du morceau de ligne) qui contient offset
+        """
+        offset = max(0, min(offset, self.size))
+        floor = max(0, offset - MAX_LINE)
+        newline = self.buffer.rfind(b"\n", floor, offset)
+        if newline >= 0:
+            return newline + 1
+        return floor
+
+    def next_line(self, offset):
+        """
+        @return : début de la ligne suivant celle qui commence à offset
+        """
+        stop = min(self.size, offset + MAX_LINE)
+        newline = self.buffer.find(b"\n", offset, stop)
+        return newline + 1 if newline >= 0 else stop
+
+    def previous_line(self, offset):
+        return self.line_start(offset - 1) if offset > 0 else 0
+
+    def last_lines(self, count):
+        """
+        @return : début de la count-ième ligne avant la fin
+        """
+        offset = self.size
+        if offset and self.buffer[offset - 1:offset] == b"\n":
+            offset -= 1  # la fin de ligne finale n'ouvre pas de ligne vide
+        offset = self.line_start(offset)
+        for _ in range(count - 1):
+            offset = self.previous_line(offset)
+        return offset
+
+    def lines(self, offset, count):
+        """
+        @return : [(décalage, texte)] des count lignes à partir de offset
+        """
+        rows = []
+        while len(rows) < count and offset < self.size:
+            end = self.next_line(offset)
+            text = self.buffer[offset:end].rstrip(b"\r\n").decode("utf-8", "replace").expandtabs(4)
+            rows.append((offset, text))
+            offset = end
+        return rows
+
+    def hex_rows(self, offset, count):
+        """
+        @return : [(décalage, texte)] de count lignes hexadécimales à partir de offset
+        """
+        rows = []
+        offset -= offset % HEX_WIDTH
+        for start in range(offset, min(self.size, offset + count * HEX_WIDTH), HEX_WIDTH):
+            chunk = self.buffer[start:start + HEX_WIDTH]
+            hex_part = " ".join("{0:02x}".format(b) for b in chunk)
+            text = "".join(chr(b) if 32 <= b < 127 else "." for b in chunk)
+            rows.append((start, "{0:010x}  {1:<{2}}  {3}".format(start, hex_part, HEX_WIDTH * 3 - 1, text)))
+        return rows
+
+
+class LineIndex(object):
+    """
+    Nombre de fins de ligne avant chaque bloc de BLOCK octets, calculé dans
+    un thread. Les méthodes répondent None pour la partie pas encore indexée.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.counts = array('q', [0])  # fins de ligne avant chaque bloc indexé
+        self.complete = False
+        self._cancelled = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, name="preview-index", daemon=True).start()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def progress(self):
+        """
+        @return : part du fichier indexée, entre 0 et 1
+        """
+        if self.complete or not self.window.size:
+            return 1.0
+        return min(1.0, (len(self.counts) - 1) * BLOCK / self.window.size)
+
+    def _run(self):
+        window = self.window
+        counts = self.counts
+        if window.local:
+            chunk = bytearray(BLOCK)
+            with open(open_regular(window.path), "rb", buffering=0) as f:
+                while not self._cancelled.is_set() and (len(counts) - 1) * BLOCK < window.size:
+                    n = f.readinto(chunk)
+                    if not n:
+                        break
+                    counts.append(counts[-1] + (chunk.count(b"\n") if n == BLOCK else chunk.count(b"\n", 0, n)))
+        else:
+            buffer = window.buffer
+            for start in range(0, window.size, BLOCK):
+                counts.append(counts[-1] + buffer[start:start + BLOCK].count(b"\n"))
+        self.complete = not self._cancelled.is_set()
+
+    def line_count(self):
+        """
+        @return : nombre de lignes du fichier, ou None avant la fin de l'index
+        """
+        if not self.complete:
+            return None
+        window = self.window
+        last = window.buffer[window.size - 1:window.size] if window.size else b"\n"
+        return self.counts[-1] + (last != b"\n")
+
+    def line_of(self, offset):
+        """
+        @return : numéro (à partir de 0) de la ligne qui contient offset
+        """
+        block = offset // BLOCK
+        if block >= len(self.counts):
+            return None
+        return self.counts[block] + self.window.buffer[block * BLOCK:offset].count(b"\n")
+
+    def offset_of(self, line):
+        """
+        @return : décalage du début de la ligne line (à partir de 0)
+        """
+        if line <= 0:
+            return 0
+        counts = self.counts
+        block = bisect.bisect_left(counts, line) - 1
+        if block + 1 >= len(counts):
+            return None if not self.complete else self.window.size
+        data = self.window.buffer[block * BLOCK:(block + 1) * BLOCK]  # contient la fin de ligne cherchée
+        offset = 0
+        for _ in range(line - counts[block]):
+            offset = data.find(b"\n", offset) + 1
+            if not offset:
+                return None  # fichier raccourci depuis l'indexation
+        return block * BLOCK + offset
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Enumération d'un dossier avec os.scandir, découpée en lots.
+
+Ce module n'importe pas Qt : il est appelé depuis les threads de travail
+du modèle de liste et peut servir tel quel en dehors de l'interface.
+"""
+import os
+
+FIRST_BATCH = 64  # premier lot réduit : la première ligne s'affiche sans attendre
+BATCH_SIZE = 4096
+
+
+def entry_info(entry):
+    """
+    Extrait les métadonnées utiles d'un os.DirEntry.
+    Les liens sont suivis pour que les liens vers des dossiers restent
+    navigables ; un lien cassé retombe sur lstat.
+    @param entry : os.DirEntry
+    @return : (nom, taille, mtime, mode)
+    """
+    try:
+        st = entry.stat()
+    except OSError:
+        try:
+            st = entry.stat(follow_symlinks=False)
+        except OSError:
+            return entry.name, 0, 0.0, 0
+    return entry.name, st.st_size, st.st_mtime, st.st_mode
+
+
+def stat_entry(dirpath, name):
+    """
+    Equivalent de entry_info pour une entrée désignée par son nom.
+    @return : (nom, taille, mtime, mode) ou None si l'entrée n'existe plus
+    """
+    path = os.path.join(dirpath, name)
+    try:
+        st = os.stat(path)
+    except OSError:
+        try:
+            st = os.lstat(path)
+        except OSError:
+            return None
+    return name, st.st_size, st.st_mtime, st.st_mode
+
+
+def iter_batches(path, cancelled=None, first=FIRST_BATCH, size=BATCH_SIZE):
+    """
+    Parcourt le dossier path et produit des listes d'entrées (voir entry_info).
+    Le premier lot contient au plus first entrées, les suivants au plus size.
+    @param cancelled : threading.Event optionnel ; le parcours s'arrête dès qu'il est levé
+    """
+    batch = []
+    limit = first
+    with os.scandir(path) as it:
+        for entry in it:
+            if cancelled is not None and cancelled.is_set():
+                return
+            batch.append(entry_info(entry))
+            if len(batch) >= limit:
+                yield batch
+                batch = []
+                limit = size
+    if batch:
+        yield batch
@@ -0,0 +1,373 @@
+# -*- coding: utf-8 -*-
+"""
+Index des noms de fichiers par trigrammes.
+
+Chaque nom (en minuscules, encadré d'octets nuls pour marquer son début et
+sa fin) est découpé en trigrammes ; un trigramme pointe vers le tableau des
+identifiants des chemins qui le contiennent. Une
+recherche part de la liste la plus courte de la requête, des identifiants
+les plus récents vers les plus anciens, et s'arrête dès qu'elle a assez de
+candidats ; elle les classe ensuite (sous-chaîne, préfixe, sous-séquence).
+Les chemins sont rangés comme dans EntryStore : un tampon d'octets et un
+tableau d'offsets.
+
+L'index se construit au fil des dossiers listés par l'explorateur, se met
+à jour à chaque changement signalé et se sauvegarde entre deux sessions.
+
+Aucune dépendance Qt.
+"""
+import bisect
+import heapq
+import os
+import pickle
+import re
+import threading
+from array import array
+from collections import Counter
+
+from explorer.dircache import default_cache_dir
+
+INDEX_VERSION = 3
+MAX_SCANNED_ELEMENTS = 200000  # budget de la recherche approchée, en identifiants parcourus
+MAX_CANDIDATES = 1000  # candidats classés au plus par recherche
+WINDOW = 4096  # identifiants de la liste la plus courte intersectés à la fois
+VERIFY_RATIO = 8  # au-delà, vérifier les noms d'une fenêtre coûte moins que lire la liste
+FUZZY_RANGE = 65536  # identifiants comptés à la fois par la recherche approchée
+ADD_CHUNK = 2000  # noms indexés par prise du verrou
+
+
+def trigrams(text):
+    return set(text[i:i + 3] for i in range(len(text) - 2))
+
+
+def _subsequence(query):
+    """
+    @return : expression qui trouve les lettres de query dans l'ordre, sans
+              franchir la fin d'un nom (octet nul)
+    """
+    return re.compile(b"[^\\0]*?".join(re.escape(query[i:i + 1]) for i in range(len(query))))
+
+
+def _score(name, query, grams, subsequence):
+    """
+    Note d'un nom pour une requête (octets, minuscules) ; 0 si aucun rapport.
+    @param grams : trigrammes de query
+    @param subsequence : _subsequence(query)
+    """
+    pos = name.find(query)
+    if pos == 0:
+        return 1000 - len(name)
+    if pos > 0:
+        return 800 - pos - len(name)
+    # sous-séquence : les lettres de la requête apparaissent dans l'ordre
+    if subsequence.search(name) is not None:
+        return 400 - len(name)
+    shared = sum(1 for gram in grams if gram in name)
+    return 10 * shared if shared else 0
+
+
+class SearchIndex(object):
+    """
+    Index en mémoire ; les méthodes peuvent être appelées depuis plusieurs threads.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._paths = bytearray()
+        self._offsets = array('Q', [0])
+        self._name_starts = array('I')  # longueur du dossier + séparateur, par chemin
+        self._lower = bytearray(b"\0")  # noms en minuscules, chacun suivi d'un octet nul
+        self._lower_offsets = array('Q', [1])
+        self._alive = bytearray()  # 1 si le chemin est toujours indexé
+        self._folders = bytearray()  # 1 si le chemin est un dossier
+        self._dead = 0
+        self._dirs = {}  # dossier -> array d'identifiants
+        self._postings = {}  # trigramme -> array d'identifiants, croissants
+        self._version = 0  # incrémenté à chaque modification
+
+    def __len__(self):
+        return len(self._alive) - self._dead
+
+    def path(self, i):
+        return os.fsdecode(bytes(self._paths[self._offsets[i]:self._offsets[i + 1]]))
+
+    def name(self, i):
+        return self.path(i)[self._name_starts[i]:]
+
+    def _lower_name(self, i):
+        return bytes(self._lower[self._lower_offsets[i]:self._lower_offsets[i + 1] - 1])
+
+    def add(self, dirpath, names, folders=()):
+        """
+        @param folders : ceux des noms qui sont des dossiers
+        """
+        names = list(names)
+        # par tranches : une recherche n'attend jamais la fin d'un gros dossier
+        for start in range(0, len(names), ADD_CHUNK):
+            self._add(dirpath, names[start:start + ADD_CHUNK], folders)
+
+    def _add(self, dirpath, names, folders):
+        with self.lock:
+            self._version += 1
+            ids = self._dirs.get(dirpath)
+            if ids is None:
+                ids = self._dirs[dirpath] = array('I')
+            prefix = len(os.path.join(dirpath, ""))
+            for name in names:
+                i = len(self._alive)
+                self._paths += os.fsencode(os.path.join(dirpath, name))
+                self._offsets.append(len(self._paths))
+                self._name_starts.append(prefix)
+                lower = name.lower()
+                self._lower += os.fsencode(lower) + b"\0"
+                self._lower_offsets.append(len(self._lower))
+                self._alive.append(1)
+                self._folders.append(name in folders)
+                ids.append(i)
+                for gram in trigrams("\0" + lower + "\0"):
+                    posting = self._postings.get(gram)
+                    if posting is None:
+                        posting = self._postings[gram] = array('I')
+                    posting.append(i)
+
+    def remove(self, dirpath, names):
+        with self.lock:
+            ids = self._dirs.get(dirpath)
+            if not ids:
+                return
+            self._version += 1
+            names = set(names)
+            kept = array('I')
+            for i in ids:
+                if self.name(i) in names:
+                    self._alive[i] = 0
+                    self._dead += 1
+                else:
+                    kept.append(i)
+            self._dirs[dirpath] = kept
+
+    def replace_directory(self, dirpath, names, folders=()):
+        """
+        Aligne les entrées indexées de dirpath sur names : seules les différences
+        sont ajoutées ou retirées.
+        @param folders : ceux des noms qui sont des dossiers
+        """
+        names = set(names)
+        folders = set(folders)
+        with self.lock:
+            known = set()
+            for i in self._dirs.get(dirpath, ()):
+                name = self.name(i)
+                known.add(name)
+                self._folders[i] = name in folders
+            gone = known - names
+            if gone:
+                self.remove(dirpath, gone)
+        self.add(dirpath, sorted(names - known), folders)
+
+    def clear_directory(self, dirpath):
+        with self.lock:
+            self._version += 1
+            for i in self._dirs.pop(dirpath, ()):
+                self._alive[i] = 0
+                self._dead += 1
+
+    def needs_compaction(self):
+        return self._dead > 100000 and self._dead * 4 > len(self._alive)
+
+    def compact(self):
+        """
+        Reconstruit l'index sans les chemins supprimés. La reconstruction se fait
+        hors du verrou, les recherches continuant sur l'index actuel ; elle n'est
+        substituée que si rien n'a changé entre-temps.
+        @return : True si l'index a été compacté
+        """
+        with self.lock:
+            version = self._version
+            dirs = [(dirpath, array('I', ids)) for dirpath, ids in self._dirs.items()]
+            alive = bytes(self._alive)
+            folders = bytes(self._folders)
+        fresh = SearchIndex()
+        for dirpath, ids in dirs:
+            ids = [i for i in ids if alive[i]]
+            fresh.add(dirpath, [self.name(i) for i in ids], set(self.name(i) for i in ids if folders[i]))
+        with self.lock:
+            if self._version != version:
+                return False  # on recommencera à la prochaine vérification
+            for field in ("_paths", "_offsets", "_name_starts", "_lower", "_lower_offsets",
+                          "_alive", "_folders", "_dead", "_dirs", "_postings"):
+                setattr(self, field, getattr(fresh, field))
+            self._version += 1
+        return True
+
+    def search(self, query, limit=50):
+        """
+        @return : liste de chemins, du plus pertinent au moins pertinent
+        """
+        return [path for path, _ in self.search_entries(query, limit)]
+
+    def search_entries(self, query, limit=50):
+        """
+        @return : liste de (chemin, True si c'est un dossier), du plus pertinent
+                  au moins pertinent
+        """
+        query = query.strip().lower()
+        if not query:
+            return []
+        key = os.fsencode(query)
+        subsequence = _subsequence(key)
+        with self.lock:
+            grams = trigrams(query)
+            # les mieux notés d'abord, quel que soit le nombre de noms qui contiennent la requête
+            candidates = self._prefix_candidates(query, key)
+            if grams:
+                candidates.update(self._exact_candidates(grams, key))
+                if len(candidates) < limit:
+                    candidates.update(self._fuzzy_candidates(grams))
+                if len(candidates) < limit and len(grams) == 1:
+                    candidates.update(self._subsequence_candidates(subsequence))
+            else:
+                candidates.update(self._scan_candidates(key, limit))
+            key_grams = trigrams(key)
+            lower, offsets, alive = self._lower, self._lower_offsets, self._alive
+            scored = []
+            for i in candidates:
+                if alive[i]:
+                    score = _score(bytes(lower[offsets[i]:offsets[i + 1] - 1]), key, key_grams, subsequence)
+                    if score > 0:
+                        scored.append((score, i))
+            best = heapq.nlargest(limit, scored)
+            return [(self.path(i), bool(self._folders[i])) for _, i in best]
+
+    def _prefix_candidates(self, query, key):
+        """
+        Noms égaux à la requête, puis noms qui commencent par elle, au plus
+        MAX_CANDIDATES de chaque : les trigrammes des débuts et fins de noms
+        (octet nul) les désignent directement.
+        """
+        found = set()
+        for text, needle in (("\0" + query + "\0", b"\0" + key + b"\0"), ("\0" + query, b"\0" + key)):
+            grams = trigrams(text)
+            if grams:
+                found.update(self._exact_candidates(grams, needle))
+        return found
+
+    def _exact_candidates(self, grams, needle):
+        """
+        Identifiants dont le nom contient tous les trigrammes grams, au plus
+        MAX_CANDIDATES, les plus récemment indexés.
+        La liste la plus courte est parcourue par fenêtres depuis la fin ; les
+        autres, triées comme elle, ne sont lues que sur l'intervalle de chaque
+        fenêtre, à moins qu'il ne soit plus court de chercher needle dans les noms
+        eux-mêmes (encadrés de leurs octets nuls).
+        """
+        lists = sorted((self._postings.get(g, ()) for g in grams), key=len)
+        shortest, others = lists[0], lists[1:]
+        found = set()
+        stop = len(shortest)
+        while stop > 0 and len(found) < MAX_CANDIDATES:
+            start = max(0, stop - WINDOW)
+            window = set(shortest[start:stop])
+            low, high = shortest[start], shortest[stop - 1]
+            for posting in others:
+                first = bisect.bisect_left(posting, low)
+                last = bisect.bisect_right(posting, high)
+                if last - first > VERIFY_RATIO * len(window):
+                    window = [i for i in window if self._lower.find(
+                        needle, self._lower_offsets[i] - 1, self._lower_offsets[i + 1]) >= 0]
+                    break
+                window.intersection_update(posting[first:last])
+            found.update(sorted(window)[len(found) - MAX_CANDIDATES:])
+            stop = start
+        return found
+
+    def _fuzzy_candidates(self, grams):
+        """
+        Tolère une faute de frappe : il suffit de partager la moitié des
+        trigrammes de la requête. Les identifiants sont comptés par tranches, des
+        plus récents aux plus anciens, jusqu'à MAX_CANDIDATES candidats ou
+        MAX_SCANNED_ELEMENTS identifiants parcourus.
+        """
+        lists = [self._postings[g] for g in grams if g in self._postings]
+        needed = max(1, (len(grams) + 1) // 2)
+        found = []
+        budget = MAX_SCANNED_ELEMENTS
+        high = len(self._alive)
+        while lists and high > 0 and budget > 0 and len(found) < MAX_CANDIDATES:
+            low = max(0, high - FUZZY_RANGE)
+            counts = Counter()
+            for posting in lists:
+                part = posting[bisect.bisect_left(posting, low):bisect.bisect_left(posting, high)]
+                budget -= len(part)
+                counts.update(part)
+            found.extend(i for i, n in counts.items() if n >= needed)
+            high = low
+        return found[:MAX_CANDIDATES]
+
+    def _scan_candidates(self, key, limit):
+        """
+        Requête trop courte pour les trigrammes : recherche directe dans le tampon des noms.
+        """
+        found = []
+        pos = self._lower.find(key)
+        while pos >= 0 and len(found) < MAX_CANDIDATES:
+            i = bisect.bisect_right(self._lower_offsets, pos) - 1
+            found.append(i)
+            pos = self._lower.find(key, self._lower_offsets[i + 1])
+        return found
+
+    def _subsequence_candidates(self, subsequence):
+        """
+        Requête de trois lettres, trop courte pour la recherche approchée : les
+        noms qui en contiennent les lettres dans l'ordre (« tst » : « test »).
+        @param subsequence : _subsequence(requête)
+        """
+        found = []
+        match = subsequence.search(self._lower)
+        while match is not None and len(found) < MAX_CANDIDATES:
+            i = bisect.bisect_right(self._lower_offsets, match.start()) - 1
+            found.append(i)
+            match = subsequence.search(self._lower, self._lower_offsets[i + 1])
+        return found
+
+    def save(self, path=None):
+        path = path or default_index_path()
+        with self.lock:
+            state = (INDEX_VERSION, self._paths, self._offsets, self._name_starts, self._lower,
+                     self._lower_offsets, self._alive, self._folders, self._dead, self._dirs, self._postings)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def read(self, path=None):
+        """
+        Remplace le contenu de l'index par l'index sauvegardé.
+        @return : True si la sauvegarde a pu être lue
+        """
+        try:
+            with open(path or default_index_path(), "rb") as f:
+                state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            return False
+        if state[0] != INDEX_VERSION:
+            return False
+        with self.lock:
+            self._version += 1
+            (_, self._paths, self._offsets, self._name_starts, self._lower,
+             self._lower_offsets, self._alive, self._folders, self._dead, self._dirs, self._postings) = state
+        return True
+
+    @classmethod
+    def load(cls, path=None):
+        """
+        @return : l'index sauvegardé, ou un index vide s'il est absent ou illisible
+        """
+        index = cls()
+        index.read(path)
+        return index
+
+
+def default_index_path():
+    return os.path.join(default_cache_dir(), "names.index")
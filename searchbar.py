@@ -0,0 +1,472 @@
+# -*- coding: utf-8 -*-
+"""
+Barre de chemin et recherche instantanée.
+
+Le textEdit du haut affiche le dossier courant. Un texte qui commence par un
+séparateur est un chemin (Entrée pour y aller) ; tout autre texte est une
+recherche dans l'index des noms (search_index), dont les résultats
+remplacent le contenu du panneau de liste pendant la frappe.
+
+L'index est alimenté par les instantanés du DirectoryService et mis à jour
+dans un thread dédié, puis sauvegardé à la fermeture. Les recherches ont
+leur propre thread : seule la dernière requête tapée est traitée, et les
+résultats d'une requête dépassée sont ignorés.
+
+La recherche dans le contenu des fichiers (contentsearch) et la comparaison
+de deux dossiers (compare) affichent leurs résultats dans le même panneau,
+au fur et à mesure qu'ils arrivent.
+"""
+import os
+import queue
+import stat
+import threading
+
+from PyQt5.QtCore import QAbstractListModel, QEvent, QModelIndex, QObject, Qt, QTimer, pyqtSignal
+from PyQt5.QtWidgets import QFileIconProvider, QLabel, QToolButton
+
+from explorer.backends import is_folder
+from explorer.compare import FOLDER, LEFT_ONLY, RIGHT_ONLY, TreeComparison
+from explorer.contentsearch import ContentSearch
+from explorer.entrystore import EntryStore
+from explorer.search_index import SearchIndex
+
+SEARCH_DELAY_MS = 40
+MIN_QUERY = 2
+
+
+class IndexFeeder(object):
+    """
+    Tient l'index à jour à partir des signaux du service. Un dossier est
+    indexé en entier à son premier chargement (ou après une réinitialisation
+    de son instantané), puis seulement par les lignes ajoutées ou retirées.
+    Les mises à jour sont appliquées dans l'ordre par un thread unique ;
+    l'index sauvegardé est chargé par ce même thread avant toute mise à jour.
+    """
+
+    def __init__(self, service, path=None):
+        self.service = service
+        self.path = path
+        self.index = SearchIndex()
+        self._synced = set()  # dossiers dont l'index suit l'instantané par les lignes ajoutées ou retirées
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="search-index", daemon=True)
+        self._thread.start()
+
+        service.reset.connect(self._on_reset)
+        service.loaded.connect(self._on_loaded)
+        service.appended.connect(self._on_appended)
+        service.aboutToRemove.connect(self._on_about_to_remove)
+
+    def shutdown(self, save=True):
+        if save:
+            self._queue.put(("save", None, None))
+        self._queue.put(None)
+        self._thread.join()
+
+    def _names(self, path, first, last):
+        snap = self.service.snapshot(path)
+        if snap is None or not snap.complete:
+            return None  # énumération en cours : l'ensemble sera indexé au chargement
+        return [snap.store.name(i) for i in range(first, last + 1)]
+
+    def _folders(self, path, first, last):
+        store = self.service.snapshot(path).store
+        return set(store.name(i) for i in range(first, last + 1) if stat.S_ISDIR(store.modes[i]))
+
+    def _on_reset(self, path):
+        self._synced.discard(path)
+
+    def _on_loaded(self, path):
+        if path in self._synced:
+            return  # déjà suivi : les lignes ajoutées ou retirées ont été transmises
+        snap = self.service.snapshot(path)
+        if snap is not None:
+            self._synced.add(path)
+            self._queue.put(("replace", path, snap.store.to_columns()))
+
+    def _on_appended(self, path, first, last):
+        names = self._names(path, first, last)
+        if names:
+            self._queue.put(("add", path, (names, self._folders(path, first, last))))
+
+    def _on_about_to_remove(self, path, first, last):
+        names = self._names(path, first, last)
+        if names:
+            self._queue.put(("remove", path, names))
+
+    def _run(self):
+        self.index.read(self.path)
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            op, path, data = item
+            if op == "replace":
+                store = EntryStore.from_columns(*data)
+                names = list(store.names())
+                self.index.replace_directory(path, names, (name for name, mode in zip(names, store.modes)
+                                                            if stat.S_ISDIR(mode)))
+            elif op == "add":
+                self.index.add(path, *data)
+            elif op == "remove":
+                self.index.remove(path, data)
+            elif op == "save":
+                try:
+                    self.index.save(self.path)
+                except OSError as e:
+                    print("index de recherche non sauvegardé : {0}".format(e))
+            if self.index.needs_compaction():
+                self.index.compact()
+
+
+class SearchResultsModel(QAbstractListModel):
+    """
+    Chemins trouvés par la recherche, affichés par leur nom.
+    """
+
+    def __init__(self, parent=None):
+        QAbstractListModel.__init__(self, parent)
+        self._paths = []
+        self._tips = {}  # chemin -> détail affiché dans l'infobulle
+        self._labels = {}  # chemin -> texte affiché à la place du nom
+        self._folders = set()  # chemins qui sont des dossiers, connus à la recherche
+        provider = QFileIconProvider()
+        self._dir_icon = provider.icon(QFileIconProvider.Folder)
+        self._file_icon = provider.icon(QFileIconProvider.File)
+
+    def setPaths(self, paths, folders=()):
+        """
+        @param folders : ceux des chemins qui sont des dossiers
+        """
+        self.beginResetModel()
+        self._paths = list(paths)
+        self._tips = {}
+        self._labels = {}
+        self._folders = set(folders)
+        self.endResetModel()
+
+    def appendPaths(self, paths, tips=None, labels=None, folders=()):
+        """
+        Ajoute des chemins à la fin, pour les résultats qui arrivent au fil
+        d'une recherche.
+        @param tips : {chemin : détail de l'infobulle}
+        @param labels : {chemin : texte affiché à la place du nom}
+        @param folders : ceux des chemins qui sont des dossiers
+        """
+        if not paths:
+            return
+        first = len(self._paths)
+        self.beginInsertRows(QModelIndex(), first, first + len(paths) - 1)
+        self._paths.extend(paths)
+        if tips:
+            self._tips.update(tips)
+        if labels:
+            self._labels.update(labels)
+        self._folders.update(folders)
+        self.endInsertRows()
+
+    def filePath(self, index):
+        return self._paths[index.row()]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._paths)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        path = self._paths[index.row()]
+        if role == Qt.DisplayRole:
+            label = self._labels.get(path)
+            return label if label is not None else os.path.basename(path) or path
+        if role == Qt.ToolTipRole:
+            tip = self._tips.get(path)
+            return path if tip is None else "{0}\n{1}".format(path, tip)
+        if role == Qt.DecorationRole:
+            return self._dir_icon if path in self._folders else self._file_icon
+        return None
+
+
+class PathBar(QObject):
+    """
+    Comportement du textEdit de la barre du haut.
+    navigateRequested(chemin) : l'utilisateur a validé un chemin de dossier.
+    resultsShown(modèle ou None) : afficher ce modèle dans la liste (None : revenir au dossier).
+    """
+    navigateRequested = pyqtSignal(str)
+    resultsShown = pyqtSignal(object)
+    _found = pyqtSignal(int, object)
+
+    def __init__(self, edit, index, parent=None):
+        QObject.__init__(self, parent)
+        self.edit = edit
+        self.index = index
+        self.results = SearchResultsModel(self)
+        self._searching = False
+        self._updating = False
+        self._generation = 0  # incrémenté dès que les résultats attendus ne valent plus
+        self._queries = queue.Queue()
+        self._found.connect(self._on_found)
+        self._thread = threading.Thread(target=self._run, name="search-query", daemon=True)
+        self._thread.start()
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(SEARCH_DELAY_MS)
+        self._timer.timeout.connect(self._search)
+
+        edit.setAcceptRichText(False)
+        edit.setLineWrapMode(edit.NoWrap)
+        edit.textChanged.connect(self._on_text_changed)
+        edit.installEventFilter(self)
+
+    def text(self):
+        return self.edit.toPlainText().strip()
+
+    def setPath(self, path):
+        """
+        Affiche le dossier courant sans déclencher de recherche.
+        """
+        self._updating = True
+        self.edit.setPlainText(path)
+        self._updating = False
+        self._show_results(False)
+
+    def eventFilter(self, obj, event):
+        if obj is self.edit and event.type() == QEvent.KeyPress:
+            if event.key() in (Qt.Key_Return, Qt.Key_Enter):
+                text = self.text()
+                if is_folder(text):
+                    self.navigateRequested.emit(text)
+                return True  # pas de retour à la ligne
+            if event.key() == Qt.Key_Escape:
+                self._show_results(False)
+                return True
+        return QObject.eventFilter(self, obj, event)
+
+    def _on_text_changed(self):
+        if not self._updating:
+            self._generation += 1
+            self._timer.start()
+
+    def _search(self):
+        text = self.text()
+        if len(text) < MIN_QUERY or text.startswith(os.sep):
+            self._show_results(False)
+            return
+        self._queries.put((self._generation, text))
+
+    def _run(self):
+        while True:
+            item = self._queries.get()
+            try:
+                while True:
+                    item = self._queries.get_nowait()  # seule la dernière requête compte
+            except queue.Empty:
+                pass
+            generation, text = item
+            self._found.emit(generation, self.index.search_entries(text))
+
+    def _on_found(self, generation, entries):
+        if generation != self._generation:
+            return
+        self.results.setPaths([path for path, _ in entries], [path for path, folder in entries if folder])
+        self._show_results(True)
+
+    def _show_results(self, shown):
+        if not shown:
+            self._generation += 1
+        if shown != self._searching:
+            self._searching = shown
+            self.resultsShown.emit(self.results if shown else None)
+
+
+class ContentSearchPanel(QObject):
+    """
+    Recherche dans le contenu des fichiers, suivie dans la barre d'état. Les
+    fichiers trouvés sont ajoutés à mesure à un SearchResultsModel.
+    resultsShown(modèle ou None) : comme pour PathBar.
+    """
+    resultsShown = pyqtSignal(object)
+    _hits = pyqtSignal(object, object)
+    _finished = pyqtSignal(object)
+
+    def __init__(self, statusbar, parent=None):
+        QObject.__init__(self, parent)
+        self.results = SearchResultsModel(self)
+        self.search = None
+        self._text = ""
+        self._shown = False
+        self._hits.connect(self._on_hits)
+        self._finished.connect(self._on_finished)
+
+        self.label = QLabel(statusbar)
+        self.cancel_button = QToolButton(statusbar)
+        self.cancel_button.setText("Annuler")
+        self.cancel_button.clicked.connect(self.cancel)
+        for widget in (self.label, self.cancel_button):
+            statusbar.addWidget(widget)
+            widget.hide()
+
+    def start(self, root, text):
+        """
+        Cherche text dans les fichiers de root ; /texte/ est une expression régulière.
+        @raise re.error : expression régulière invalide
+        """
+        regex = len(text) > 2 and text.startswith("/") and text.endswith("/")
+        search = ContentSearch(root, text[1:-1] if regex else text, regex=regex,
+                               on_hits=self._hits.emit, on_finished=self._finished.emit)
+        self.cancel()
+        self.search = search
+        self._text = text
+        self.results.setPaths([])
+        self._shown = True
+        self.resultsShown.emit(self.results)
+        self.label.show()
+        self.cancel_button.show()
+        self._show_progress()
+        search.start()
+
+    def cancel(self):
+        if self.search is not None:
+            self.search.cancel()
+
+    def hide(self):
+        """
+        Arrête la recherche et rend le panneau de liste au dossier courant.
+        """
+        self.cancel()
+        self.search = None
+        self.label.hide()
+        self.cancel_button.hide()
+        if self._shown:
+            self._shown = False
+            self.resultsShown.emit(None)
+
+    def _show_progress(self):
+        search = self.search
+        self.label.setText("« {0} » : {1} fichier{2} trouvé{2} sur {3} examiné{4}…".format(
+            self._text, search.matched, "s" if search.matched > 1 else "", search.files,
+            "s" if search.files > 1 else ""))
+
+    def _on_hits(self, search, results):
+        if search is not self.search:
+            return
+        self.results.appendPaths(
+            [path for path, _ in results],
+            {path: "\n".join("{0} : {1}".format(line, text) for line, text in hits) for path, hits in results})
+        self._show_progress()
+
+    def _on_finished(self, search):
+        if search is not self.search:
+            return
+        self.cancel_button.hide()
+        text = "« {0} » : {1} fichier{2} trouvé{2} sur {3} examiné{4}".format(
+            self._text, search.matched, "s" if search.matched > 1 else "", search.files,
+            "s" if search.files > 1 else "")
+        if search.truncated:
+            text += " (résultats limités)"
+        elif search.cancelled():
+            text += " (annulée)"
+        self.label.setText(text)
+
+
+class ComparePanel(QObject):
+    """
+    Comparaison de deux dossiers, suivie dans la barre d'état. Les
+    différences sont ajoutées à mesure à un SearchResultsModel, avec leur
+    chemin relatif et leur état.
+    resultsShown(modèle ou None) : comme pour PathBar.
+    """
+    resultsShown = pyqtSignal(object)
+    _diffs = pyqtSignal(object, object)
+    _progress = pyqtSignal(object)
+    _finished = pyqtSignal(object)
+
+    def __init__(self, statusbar, parent=None):
+        QObject.__init__(self, parent)
+        self.results = SearchResultsModel(self)
+        self.comparison = None
+        self._shown = False
+        self._diffs.connect(self._on_diffs)
+        self._progress.connect(self._on_progress)
+        self._finished.connect(self._on_finished)
+
+        self.label = QLabel(statusbar)
+        self.cancel_button = QToolButton(statusbar)
+        self.cancel_button.setText("Annuler")
+        self.cancel_button.clicked.connect(self.cancel)
+        for widget in (self.label, self.cancel_button):
+            statusbar.addWidget(widget)
+            widget.hide()
+
+    def start(self, left, right, check_contents=False):
+        """
+        Compare left et right ; check_contents : relire les fichiers de même
+        taille dont seule la date diffère.
+        """
+        comparison = TreeComparison(left, right, check_contents, on_diffs=self._diffs.emit,
+                                    on_progress=self._progress.emit, on_finished=self._finished.emit)
+        self.cancel()
+        self.comparison = comparison
+        self.results.setPaths([])
+        self._shown = True
+        self.resultsShown.emit(self.results)
+        self.label.show()
+        self.cancel_button.show()
+        self._on_progress(comparison)
+        comparison.start()
+
+    def cancel(self):
+        if self.comparison is not None:
+            self.comparison.cancel()
+
+    def hide(self):
+        """
+        Arrête la comparaison et rend le panneau de liste au dossier courant.
+        """
+        self.cancel()
+        self.comparison = None
+        self.label.hide()
+        self.cancel_button.hide()
+        if self._shown:
+            self._shown = False
+            self.resultsShown.emit(None)
+
+    def _status(self, comparison):
+        text = "{0} ↔ {1} : {2} différence{3} sur {4} fichier{5}".format(
+            comparison.left, comparison.right, comparison.differences, "s" if comparison.differences > 1 else "",
+            comparison.files, "s" if comparison.files > 1 else "")
+        if comparison.checked:
+            text += ", {0} relu{1}".format(comparison.checked, "s" if comparison.checked > 1 else "")
+        return text
+
+    def _on_diffs(self, comparison, diffs):
+        if comparison is not self.comparison:
+            return
+        paths, tips, labels, folders = [], {}, {}, []
+        for relative, status, detail in diffs:
+            # le côté où le fichier existe, pour pouvoir l'ouvrir
+            path = os.path.join(comparison.right if status == RIGHT_ONLY else comparison.left, relative)
+            paths.append(path)
+            labels[path] = "{0}  —  {1}".format(relative, status)
+            tips[path] = "{0} ({1})".format(status, detail) if detail else status
+            if status in (LEFT_ONLY, RIGHT_ONLY) and detail == FOLDER:
+                folders.append(path)
+        self.results.appendPaths(paths, tips, labels, folders)
+
+    def _on_progress(self, comparison):
+        if comparison is self.comparison:
+            self.label.setText(self._status(comparison) + "…")
+
+    def _on_finished(self, comparison):
+        if comparison is not self.comparison:
+            return
+        self.cancel_button.hide()
+        text = self._status(comparison)
+        if comparison.truncated:
+            text += " (résultats limités)"
+        elif comparison.cancelled():
+            text += " (annulée)"
+        elif comparison.errors:
+            text += " ({0} illisible{1})".format(comparison.errors, "s" if comparison.errors > 1 else "")
+        self.label.setText(text)
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""
+Totaux de la sélection du panneau de liste (nombre, taille, types).
+
+Qt ne signale que les plages ajoutées et retirées de la sélection. Les
+totaux sont donc tenus à jour par différences : chaque plage est évaluée
+en temps constant grâce à des sommes préfixes calculées une fois par
+dossier à partir des colonnes de l'EntryStore (tailles, modes, noms), sans
+aucun stat. Ctrl+A sur un million de lignes ou un Maj+clic ne coûtent
+qu'une soustraction par colonne.
+
+Les sommes préfixes des types sont gardées par blocs de BLOCK lignes ; le
+reste d'une plage est compté dans le tableau des codes de type (au plus
+BLOCK octets de chaque côté). Pour un grand dossier, les sommes sont
+calculées en arrière-plan dès son affichage.
+"""
+import stat
+import threading
+from array import array
+from itertools import accumulate
+
+from PyQt5.QtCore import QObject, Qt, QTimer, pyqtSignal
+from PyQt5.QtWidgets import QLabel
+
+from explorer.details import format_size
+
+BLOCK = 64
+WARM_ROWS = 20000  # au-delà, les sommes sont calculées d'avance en arrière-plan
+WARM_CHUNK = 16384  # lignes calculées par prise du verrou
+CATEGORIES = ("dossiers", "images", "audio", "vidéos", "documents", "archives", "code", "autres")
+DIRECTORY, OTHER = 0, len(CATEGORIES) - 1
+EXTENSIONS = {}
+for _code, _suffixes in (
+        (1, "png jpg jpeg gif bmp svg webp tif tiff ico xcf psd raw heic"),
+        (2, "mp3 ogg flac wav m4a aac opus wma"),
+        (3, "mp4 mkv avi mov webm wmv flv mpg mpeg m4v"),
+        (4, "pdf txt md rst doc docx odt ods odp xls xlsx ppt pptx rtf csv epub tex"),
+        (5, "zip tar gz tgz bz2 xz zst 7z rar iso deb rpm jar whl"),
+        (6, "py c h cpp hpp js ts java rs go rb php sh html css json xml yml yaml toml ini ui")):
+    for _suffix in _suffixes.split():
+        EXTENSIONS[_suffix.encode()] = _code
+
+
+def category(name, mode):
+    """
+    @param name : nom en octets
+    @return : indice dans CATEGORIES
+    """
+    if stat.S_ISDIR(mode):
+        return DIRECTORY
+    dot = name.rfind(b".")
+    if dot <= 0:
+        return OTHER
+    return EXTENSIONS.get(name[dot + 1:].lower(), OTHER)
+
+
+class PrefixColumns(object):
+    """
+    Sommes préfixes d'un EntryStore, dans l'ordre des lignes de order (trié
+    ou filtré) s'il est donné. Les lignes ajoutées à la fin sont intégrées à
+    la demande, et seulement jusqu'à la dernière ligne demandée ; toute autre
+    modification impose invalidate().
+    Pour un grand dossier, warm() fait le calcul d'avance dans un thread.
+    """
+
+    def __init__(self, store, order=None):
+        self.store = store
+        self.order = order
+        self._lock = threading.Lock()
+        self._warming = False
+        self._stopped = False
+        self.generation = 0
+        self.invalidate()
+
+    def invalidate(self):
+        with self._lock:
+            self.generation += 1
+            self.codes = bytearray()
+            self.bytes = array('q', [0])  # octets des fichiers avant chaque ligne
+            self.blocks = [array('I', [0]) for _ in CATEGORIES]  # comptes avant chaque bloc
+
+    def __len__(self):
+        return len(self.store) if self.order is None else len(self.order)
+
+    def stop(self):
+        """
+        Arrête le calcul d'avance : ces sommes ne serviront plus.
+        """
+        self._stopped = True
+
+    def warm(self):
+        if self._warming or len(self.codes) >= len(self):
+            return
+        self._warming = True
+        threading.Thread(target=self._warm, name="selection-prefix", daemon=True).start()
+
+    def _warm(self):
+        try:
+            while not self._stopped:
+                with self._lock:
+                    done, total = len(self.codes), len(self)
+                    if done >= total:
+                        return
+                    self._extend(min(total, done + WARM_CHUNK))
+        finally:
+            self._warming = False
+
+    def _extend(self, stop):
+        """
+        Calcule les lignes jusqu'à stop (exclue) ; appelé avec le verrou.
+        """
+        store = self.store
+        start = len(self.codes)
+        if start >= stop:
+            return
+        names, offsets = store.name_columns()
+        get = EXTENSIONS.get
+        codes = bytearray()
+        if self.order is None:
+            rows = zip(offsets[start:stop], offsets[start + 1:stop + 1], store.modes[start:stop])
+            sizes = store.sizes[start:stop]
+        else:
+            selected = self.order[start:stop]
+            rows = ((offsets[row], offsets[row + 1], store.modes[row]) for row in selected)
+            sizes = [store.sizes[row] for row in selected]
+        for a, b, mode in rows:
+            if stat.S_ISDIR(mode):
+                codes.append(DIRECTORY)
+                continue
+            dot = names.rfind(b".", a, b)
+            codes.append(get(bytes(names[dot + 1:b]).lower(), OTHER) if dot > a else OTHER)
+        running = accumulate((0 if code == DIRECTORY else size for code, size in zip(codes, sizes)),
+                             initial=self.bytes[-1])
+        next(running)  # la valeur initiale est déjà dans le tableau
+        self.bytes.extend(running)
+        self.codes += codes
+        # comptes par type au début de chaque bloc complet
+        for first in range((len(self.blocks[0]) - 1) * BLOCK, len(self.codes) - BLOCK + 1, BLOCK):
+            chunk = self.codes[first:first + BLOCK]
+            for k, block in enumerate(self.blocks):
+                block.append(block[-1] + chunk.count(k))
+
+    def _count_before(self, k, row):
+        block = row // BLOCK
+        return self.blocks[k][block] + self.codes[block * BLOCK:row].count(k)
+
+    def totals(self, first, last):
+        """
+        @return : (octets, comptes par catégorie) des lignes first à last incluses
+        """
+        stop = last + 1
+        with self._lock:
+            self._extend(stop)
+            counts = [self._count_before(k, stop) - self._count_before(k, first)
+                      for k in range(len(CATEGORIES))]
+            return self.bytes[stop] - self.bytes[first], counts
+
+
+class SelectionTotals(object):
+
+    def __init__(self):
+        self.count = 0
+        self.bytes = 0
+        self.categories = [0] * len(CATEGORIES)
+        self.sized = True  # False si une partie de la sélection n'a pas de taille connue
+
+    def add(self, count, nbytes, categories, sign=1):
+        self.count += sign * count
+        self.bytes += sign * nbytes
+        for k, n in enumerate(categories):
+            self.categories[k] += sign * n
+
+    def text(self):
+        if not self.count:
+            return ""
+        text = "{0} élément{1} sélectionné{1}".format(self.count, "s" if self.count > 1 else "")
+        if not self.sized:
+            return text
+        text += " — {0}".format(format_size(self.bytes))
+        parts = ["{0} : {1}".format(CATEGORIES[k], n) for k, n in enumerate(self.categories) if n]
+        if parts:
+            text += " ({0})".format(", ".join(parts))
+        return text
+
+
+class SelectionAggregator(QObject):
+    """
+    Suit la sélection d'une vue et affiche ses totaux dans la barre d'état.
+    Le modèle doit offrir entries() (EntryStore) pour les tailles et les
+    types, et order() si ses lignes ne sont pas dans l'ordre de l'EntryStore ;
+    sinon seul le nombre d'éléments est tenu.
+    """
+    totalsChanged = pyqtSignal(object)
+
+    def __init__(self, view, statusbar, parent=None):
+        QObject.__init__(self, parent)
+        self.view = view
+        self.totals = SelectionTotals()
+        self._model = None
+        self._selection_model = None
+        self._columns = None
+        self.label = QLabel(statusbar)
+        statusbar.addPermanentWidget(self.label)
+        self._recount_timer = QTimer(self)
+        self._recount_timer.setSingleShot(True)
+        self._recount_timer.timeout.connect(self.recount)
+        self.attach()
+
+    def attach(self):
+        """
+        A appeler après chaque setModel() de la vue.
+        """
+        if self._selection_model is not None:
+            self._selection_model.selectionChanged.disconnect(self._on_selection_changed)
+            for signal in self._model_signals(self._model):
+                signal.disconnect(self._schedule_recount)
+            self._model.dataChanged.disconnect(self._on_data_changed)
+            self._model.rowsInserted.disconnect(self._on_rows_inserted)
+        self._model = self.view.model()
+        self._selection_model = self.view.selectionModel()
+        self._columns = None
+        if self._selection_model is not None:
+            self._selection_model.selectionChanged.connect(self._on_selection_changed)
+            for signal in self._model_signals(self._model):
+                signal.connect(self._schedule_recount)
+            self._model.dataChanged.connect(self._on_data_changed)
+            self._model.rowsInserted.connect(self._on_rows_inserted)
+        self.recount()
+        self._warm()
+
+    @staticmethod
+    def _model_signals(model):
+        # la sélection est décalée ou vidée sans selectionChanged : on recompte ses plages
+        return (model.modelReset, model.rowsRemoved, model.layoutChanged, model.rowsMoved)
+
+    def _prefix(self):
+        entries = getattr(self._model, "entries", None)
+        if entries is None:
+            return None
+        store = entries()
+        order = self._model.order() if hasattr(self._model, "order") else None
+        if self._columns is None or self._columns.store is not store or self._columns.order is not order:
+            self._columns = PrefixColumns(store, order)
+        return self._columns
+
+    def _warm(self, *args):
+        columns = self._prefix()
+        if columns is not None and len(columns) >= WARM_ROWS:
+            columns.warm()
+
+    def _on_rows_inserted(self, parent, first, last):
+        if last + 1 < self._model.rowCount():
+            self._schedule_recount()  # insertion au milieu (liste triée) : les sommes sont décalées
+        else:
+            self._warm()
+
+    def _apply(self, selection, sign):
+        columns = self._prefix()
+        for selected_range in selection:
+            first, last = selected_range.top(), selected_range.bottom()
+            if columns is None:
+                self.totals.add(last - first + 1, 0, (), sign)
+            else:
+                nbytes, counts = columns.totals(first, last)
+                self.totals.add(last - first + 1, nbytes, counts, sign)
+
+    def _on_selection_changed(self, selected, deselected):
+        if self._recount_timer.isActive():
+            return  # un recomptage complet est déjà prévu
+        self._apply(deselected, -1)
+        self._apply(selected, 1)
+        self._show()
+
+    def _on_data_changed(self, first, last, roles=()):
+        if not roles or Qt.DisplayRole in roles:  # taille ou date modifiée, pas une miniature
+            self._schedule_recount()
+
+    def _schedule_recount(self, *args):
+        if self._columns is not None:
+            self._columns.stop()  # sans attendre le calcul en cours : d'autres sommes le remplacent
+            self._columns = None
+        self._recount_timer.start(0)
+
+    def recount(self):
+        """
+        Recalcule les totaux à partir des plages de la sélection courante.
+        """
+        self._recount_timer.stop()
+        self._warm()
+        self.totals = SelectionTotals()
+        self.totals.sized = hasattr(self._model, "entries")
+        if self._selection_model is not None:
+            self._apply(self._selection_model.selection(), 1)
+        self._show()
+
+    def _show(self):
+        self.label.setText(self.totals.text())
+        self.totalsChanged.emit(self.totals)
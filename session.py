@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Etat de la fenêtre d'une session à l'autre.
+
+A la fermeture, l'explorateur enregistre le dossier courant, les noeuds
+dépliés de l'arborescence, la première ligne visible de la liste et le mode
+d'affichage. Au démarrage, la fenêtre est reconstruite d'abord à partir de
+cet état (les listes viennent du cache des dossiers), le reste de
+l'interface est mis en place ensuite.
+
+Aucune dépendance Qt.
+"""
+import json
+import os
+
+from explorer.dircache import default_cache_dir
+
+SESSION_VERSION = 1
+MAX_EXPANDED = 200  # noeuds dépliés restaurés au plus
+
+
+def default_session_path():
+    return os.path.join(default_cache_dir(), "session.json")
+
+
+class Session(object):
+    """
+    @param folder : dossier affiché dans la liste
+    @param expanded : chemins des noeuds dépliés, parents avant enfants
+    @param first_row : nom de la première ligne visible de la liste
+    @param mode : "list", "icons" ou "details"
+    """
+
+    def __init__(self, folder=None, expanded=(), first_row=None, mode="list"):
+        self.folder = folder
+        self.expanded = list(expanded)[:MAX_EXPANDED]
+        self.first_row = first_row
+        self.mode = mode
+
+    def save(self, path=None):
+        path = path or default_session_path()
+        state = {"version": SESSION_VERSION, "folder": self.folder, "expanded": self.expanded,
+                 "first_row": self.first_row, "mode": self.mode}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=None):
+        """
+        @return : la session enregistrée, ou None si elle est absente,
+                  illisible ou si son dossier n'existe plus
+        """
+        try:
+            with open(path or default_session_path()) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(state, dict) or state.get("version") != SESSION_VERSION:
+            return None
+        folder = state.get("folder")
+        if not isinstance(folder, str) or not os.path.isdir(folder):
+            return None
+        expanded = [p for p in state.get("expanded") or () if isinstance(p, str)]
+        return cls(folder, sorted(expanded, key=len), state.get("first_row"), state.get("mode") or "list")
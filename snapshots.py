@@ -0,0 +1,516 @@
+# -*- coding: utf-8 -*-
+"""
+Service unique d'instantanés de dossiers.
+
+L'arborescence (dossiers seulement) et la liste (toutes les entrées) lisent
+les mêmes instantanés : un dossier affiché dans les deux panneaux n'est
+énuméré et surveillé qu'une fois. Chaque vue prend une référence avec
+acquire() et la rend avec release() ; la surveillance est posée à la première
+référence et l'instantané évincé à la dernière.
+
+Sous Linux, la surveillance passe par inotify : les changements arrivent
+par lots à cadence fixe et ne touchent que les lignes concernées ; la file
+du noyau qui déborde provoque une relecture complète. Les noms touchés sont
+relus (stat) dans un thread de travail, qui retrouve leurs lignes par un
+dictionnaire nom -> ligne gardé avec l'instantané ; les lots arrivés
+pendant ce temps sont regroupés pour la tâche suivante. Ailleurs, on retombe
+sur QFileSystemWatcher et une revalidation du dossier.
+
+Les dossiers d'une archive sont énumérés par leur backend (voir backends) ;
+ils ne sont ni surveillés ni mis en cache, leur index en tient lieu.
+
+Un instantané complet libéré par sa dernière vue est gardé dans le cache
+d'historique (borné) : revenir au dossier l'affiche aussitôt, puis la
+date de modification du dossier décide en arrière-plan s'il faut le relire.
+
+Les modifications d'un instantané suivent le protocole des modèles Qt :
+un signal aboutTo... est émis avant la modification, le signal
+correspondant après.
+"""
+import threading
+
+from PyQt5.QtCore import QFileSystemWatcher, QObject, QRunnable, QThreadPool, pyqtSignal
+
+from explorer.backends import backend_for
+from explorer.entrystore import EntryStore, diff_entries
+from explorer.inotify import InotifyWatcher, inotify_available
+from explorer.instrumentation import RECORDER, clock
+from explorer.scanner import stat_entry
+
+ENTRY_BYTES = 48  # ordre de grandeur d'une entrée dans un EntryStore
+MAX_REMOVE_RANGES = 16  # au-delà, une remise à zéro coûte moins que des suppressions successives
+MAX_INCREMENTAL = 4096  # au-delà, relire le dossier coûte moins que des stat un par un
+
+
+class Snapshot(object):
+    """
+    Etat d'un dossier partagé entre les vues.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.store = EntryStore()
+        self.mtime = 0.0
+        self.complete = False
+        self.refs = 0
+        self.generation = 0
+        self.busy = False  # une tâche d'énumération est en cours
+        self.dirty = False  # une revalidation a été demandée pendant la tâche en cours
+        self.cancelled = threading.Event()
+        self.started = 0  # clock() au lancement de la tâche en cours
+        self.task = None  # nom de la mesure de la tâche en cours
+        self.rows = None  # {nom : ligne} de store, construit au premier changement signalé par inotify
+        self.touched = set()  # noms signalés pendant la tâche en cours, relus ensuite
+
+
+class _ScanSignals(QObject):
+    batchReady = pyqtSignal(str, int, object)
+    revalidated = pyqtSignal(str, int, object, object, object)
+    changes = pyqtSignal(str, int, object, object, object, object)
+    failed = pyqtSignal(str, int, str)
+    finished = pyqtSignal(str, int, float)
+
+
+class _ScanTask(QRunnable):
+    """
+    Enumération complète d'un dossier, émise par lots.
+    Si un cache est fourni, la liste complète y est enregistrée à la fin.
+    """
+
+    def __init__(self, path, generation, cancelled, signals, stats, cache=None):
+        QRunnable.__init__(self)
+        self.path = path
+        self.generation = generation
+        self.cancelled = cancelled
+        self.signals = signals
+        self.stats = stats
+        self.cache = cache
+
+    def run(self):
+        backend = backend_for(self.path)
+        mtime = backend.mtime(self.path)
+        cache = self.cache if backend.local else None
+        store = EntryStore() if cache is not None and cache.enabled else None
+        limit = self.cache.max_bytes // (4 * ENTRY_BYTES) if store is not None else 0
+        self.stats.count("scandir")
+        try:
+            start = clock()
+            for batch in backend.iter_batches(self.path, self.cancelled):
+                if self.cancelled.is_set():
+                    return
+                RECORDER.record("stat_batch", start, path=self.path)
+                self.stats.count("stat", len(batch))
+                self.signals.batchReady.emit(self.path, self.generation, batch)
+                if store is not None:
+                    store.extend(batch)
+                    if len(store) > limit:
+                        store = None  # trop gros pour le cache
+                start = clock()
+        except OSError as e:
+            self.signals.failed.emit(self.path, self.generation, str(e))
+            return
+        if self.cancelled.is_set():
+            return
+        self.signals.finished.emit(self.path, self.generation, mtime)
+        if store is not None:
+            cache.put(self.path, mtime, store.to_columns())
+
+
+class _RevalidateTask(QRunnable):
+    """
+    Relit un dossier déjà connu et émet uniquement les différences.
+    old n'est pas modifié par le service tant que la tâche est en cours.
+    @param old_mtime : date de modification du dossier quand old a été lu (0 :
+                       inconnue) ; si elle n'a pas changé, le dossier n'est pas relu
+    """
+
+    def __init__(self, path, generation, cancelled, signals, stats, old, old_mtime=None, cache=None):
+        QRunnable.__init__(self)
+        self.path = path
+        self.generation = generation
+        self.cancelled = cancelled
+        self.signals = signals
+        self.stats = stats
+        self.old = old
+        self.old_mtime = old_mtime
+        self.cache = cache
+
+    def run(self):
+        backend = backend_for(self.path)
+        mtime = backend.mtime(self.path)
+        if self.old_mtime and mtime == self.old_mtime:
+            self.stats.count("mtime_unchanged")
+            self.signals.finished.emit(self.path, self.generation, mtime)
+            return
+        cache = self.cache if backend.local else None
+        new = EntryStore()
+        self.stats.count("scandir")
+        try:
+            start = clock()
+            for batch in backend.iter_batches(self.path, self.cancelled):
+                RECORDER.record("stat_batch", start, path=self.path)
+                self.stats.count("stat", len(batch))
+                new.extend(batch)
+                start = clock()
+        except OSError as e:
+            self.signals.failed.emit(self.path, self.generation, str(e))
+            if cache is not None:
+                cache.discard(self.path)
+            return
+        if self.cancelled.is_set():
+            return
+        removed, changed, added = diff_entries(self.old, new)
+        self.signals.revalidated.emit(self.path, self.generation, removed, changed, added)
+        self.signals.finished.emit(self.path, self.generation, mtime)
+        if cache is not None and (removed or changed or added or mtime != self.old_mtime):
+            cache.put(self.path, mtime, new.to_columns())
+
+
+class _ChangesTask(QRunnable):
+    """
+    Relit les seules entrées touchées d'un dossier et émet les différences.
+    store n'est pas modifié par le service tant que la tâche est en cours.
+    @param rows : {nom : ligne} de store, ou None pour le construire ici ;
+                  rendu avec les différences pour les tâches suivantes
+    """
+
+    def __init__(self, path, generation, cancelled, signals, stats, store, names, rows):
+        QRunnable.__init__(self)
+        self.path = path
+        self.generation = generation
+        self.cancelled = cancelled
+        self.signals = signals
+        self.stats = stats
+        self.store = store
+        self.names = names
+        self.rows = rows
+
+    def run(self):
+        mtime = backend_for(self.path).mtime(self.path)
+        rows = self.rows
+        if rows is None:
+            rows = {name: row for row, name in enumerate(self.store.names())}
+        store = self.store
+        removed, changed, added = [], [], []
+        for name in self.names:
+            if self.cancelled.is_set():
+                return
+            row = rows.get(name, -1)
+            info = stat_entry(self.path, name)
+            if info is None:
+                if row >= 0:
+                    removed.append(row)
+            elif row < 0:
+                added.append(info)
+            elif (store.sizes[row], store.mtimes[row], store.modes[row]) != info[1:]:
+                changed.append((row,) + info[1:])
+        self.stats.count("stat", len(self.names))
+        self.signals.changes.emit(self.path, self.generation, sorted(removed), changed, added, rows)
+        self.signals.finished.emit(self.path, self.generation, mtime)
+
+
+class ServiceStats(object):
+    """
+    Compteurs d'appels système et d'accès aux caches, pour mesurer le coût
+    d'une navigation (scandir : un par énumération, stat : un par entrée).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+
+
+class DirectoryService(QObject):
+    """
+    Source unique des listes de dossiers pour les modèles de l'explorateur.
+    @param cache : DirectoryCache optionnel (persistant)
+    @param prefetch : PrefetchCache optionnel (préchargement des voisins)
+    @param history : PrefetchCache optionnel, où vont les instantanés libérés
+    """
+    aboutToReset = pyqtSignal(str)
+    reset = pyqtSignal(str)
+    appended = pyqtSignal(str, int, int)
+    aboutToRemove = pyqtSignal(str, int, int)
+    removed = pyqtSignal(str, int, int)
+    changed = pyqtSignal(str, object)
+    loaded = pyqtSignal(str)
+    failed = pyqtSignal(str, str)
+
+    def __init__(self, parent=None, cache=None, prefetch=None, history=None):
+        QObject.__init__(self, parent)
+        self.cache = cache
+        self.prefetch = prefetch
+        self.history = history
+        self.stats = ServiceStats()
+        self._snapshots = {}
+
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(2)
+        self._signals = _ScanSignals(self)
+        self._signals.batchReady.connect(self._on_batch)
+        self._signals.revalidated.connect(self._on_revalidated)
+        self._signals.changes.connect(self._on_changes)
+        self._signals.failed.connect(self._on_failed)
+        self._signals.finished.connect(self._on_finished)
+
+        self._watcher = None
+        if inotify_available():
+            try:
+                self._watcher = InotifyWatcher(self)
+            except OSError:
+                pass
+        if self._watcher is not None:
+            self._watcher.changed.connect(self._on_entries_changed)
+            self._watcher.overflowed.connect(self._on_overflow)
+        else:
+            self._watcher = QFileSystemWatcher(self)
+        self._watcher.directoryChanged.connect(self.refresh)
+        self._deferred_watches = None
+
+    def deferWatches(self):
+        """
+        Au démarrage : les surveillances des dossiers acquis ne sont posées
+        qu'à l'appel de startWatching().
+        """
+        if self._deferred_watches is None:
+            self._deferred_watches = []
+
+    def startWatching(self):
+        deferred, self._deferred_watches = self._deferred_watches, None
+        for path in deferred or ():
+            if path in self._snapshots:
+                self._watch(path)
+
+    def _watch(self, path):
+        if not backend_for(path).local:
+            return  # archive : lecture seule, rien à surveiller
+        if not self._watcher.addPath(path):
+            self.stats.count("watch_failed")
+        self.stats.count("watch")
+
+    def snapshot(self, path):
+        return self._snapshots.get(path)
+
+    def __contains__(self, path):
+        return path in self._snapshots
+
+    def acquire(self, path):
+        """
+        Prend une référence sur l'instantané de path, qui est chargé et
+        surveillé s'il ne l'était pas encore.
+        @return : Snapshot
+        """
+        snap = self._snapshots.get(path)
+        if snap is None:
+            snap = self._snapshots[path] = Snapshot(path)
+            if self._deferred_watches is not None:
+                self._deferred_watches.append(path)
+            else:
+                self._watch(path)
+        snap.refs += 1
+        if not snap.complete and not snap.busy:
+            self._load(snap)
+        return snap
+
+    def release(self, path):
+        """
+        Rend une référence ; le dernier utilisateur retire la surveillance
+        et libère l'instantané.
+        """
+        snap = self._snapshots.get(path)
+        if snap is None:
+            return
+        snap.refs -= 1
+        if snap.refs > 0:
+            return
+        snap.cancelled.set()
+        self._watcher.removePath(path)
+        del self._snapshots[path]
+        if self.history is not None and snap.complete and not snap.busy:
+            self.history.put(path, snap.mtime, snap.store)
+
+    def cancel(self, path):
+        """
+        Interrompt l'énumération en cours de path ; un prochain acquire la relance.
+        Une énumération dont une autre vue attend aussi le résultat continue :
+        seul le demandeur s'en désintéresse.
+        """
+        snap = self._snapshots.get(path)
+        if snap is None or not snap.busy or snap.refs > 1:
+            return
+        snap.cancelled.set()
+        snap.generation += 1
+        snap.busy = False
+        snap.dirty = False
+        snap.touched.clear()
+
+    def refresh(self, path):
+        """
+        Revalide un instantané complet en arrière-plan ; seules les différences
+        sont appliquées.
+        """
+        snap = self._snapshots.get(path)
+        if snap is None:
+            return
+        if snap.busy:
+            snap.dirty = True
+            return
+        if not snap.complete:
+            self._load(snap)
+            return
+        self._start(snap, _RevalidateTask, snap.store, cache=self.cache)
+
+    def _start(self, snap, task_class, *args, **kwargs):
+        snap.generation += 1
+        snap.cancelled = threading.Event()
+        snap.busy = True
+        snap.dirty = False
+        snap.task = {_ScanTask: "listing", _ChangesTask: "changes"}.get(task_class, "revalidate")
+        snap.started = clock()
+        task = task_class(snap.path, snap.generation, snap.cancelled, self._signals, self.stats,
+                          *args, **kwargs)
+        self._pool.start(task)
+
+    def _load(self, snap):
+        cached = self.prefetch.take(snap.path) if self.prefetch is not None else None
+        recent = None
+        if cached is None and self.history is not None:
+            cached = recent = self.history.take(snap.path)
+        if cached is None and self.cache is not None:
+            cached = self.cache.get(snap.path)
+        if recent is not None:
+            self.stats.count("history_hit")
+        elif cached is not None:
+            self.stats.count("cache_hit")
+
+        self.aboutToReset.emit(snap.path)
+        snap.mtime, snap.store = cached if cached is not None else (0.0, EntryStore())
+        snap.rows = None
+        snap.complete = cached is not None
+        self.reset.emit(snap.path)
+
+        if cached is not None:
+            # dossier inchangé depuis la lecture (date identique) : pas relu
+            self._start(snap, _RevalidateTask, snap.store, snap.mtime, cache=self.cache)
+        else:
+            self._start(snap, _ScanTask, cache=self.cache)
+
+    def _current(self, path, generation):
+        snap = self._snapshots.get(path)
+        if snap is None or snap.generation != generation:
+            return None
+        return snap
+
+    def _on_batch(self, path, generation, batch):
+        snap = self._current(path, generation)
+        if snap is not None:
+            self._append(snap, batch)
+
+    def _append(self, snap, batch):
+        first = len(snap.store)
+        snap.store.extend(batch)
+        if snap.rows is not None:
+            for row, entry in enumerate(batch, first):
+                snap.rows[entry[0]] = row
+        self.appended.emit(snap.path, first, len(snap.store) - 1)
+
+    def _on_revalidated(self, path, generation, removed, changed, added):
+        snap = self._current(path, generation)
+        if snap is not None:
+            self._apply(snap, removed, changed, added)
+
+    def _on_entries_changed(self, path, names):
+        """
+        Lot de noms touchés dans path (inotify) : seules ces entrées sont relues,
+        dans un thread de travail. Pendant une tâche, quelle qu'elle soit, les
+        noms s'accumulent et sont relus en une fois à la fin de celle-ci : un
+        dossier qui change sans cesse n'est pas relu en entier à chaque lot.
+        """
+        snap = self._snapshots.get(path)
+        if snap is None:
+            return
+        if snap.busy:
+            if not snap.dirty:
+                snap.touched.update(names)
+                if len(snap.touched) > MAX_INCREMENTAL:
+                    snap.touched.clear()
+                    snap.dirty = True
+            return
+        if not snap.complete or len(names) > MAX_INCREMENTAL:
+            self.refresh(path)
+            return
+        self._start(snap, _ChangesTask, snap.store, list(names), snap.rows)
+
+    def _on_changes(self, path, generation, removed, changed, added, rows):
+        snap = self._current(path, generation)
+        if snap is not None:
+            snap.rows = rows
+            self._apply(snap, removed, changed, added)
+
+    def _on_overflow(self):
+        # des événements ont été perdus : chaque dossier surveillé est relu
+        for path in list(self._snapshots):
+            self.refresh(path)
+
+    def _apply(self, snap, removed, changed, added):
+        path = snap.path
+        rows = []
+        for row, size, mtime, mode in changed:
+            snap.store.update(row, size, mtime, mode)
+            rows.append(row)
+        if rows:
+            self.changed.emit(path, rows)
+        if removed:
+            self._remove_rows(snap, removed)
+        if added:
+            self._append(snap, added)
+
+    def _remove_rows(self, snap, rows):
+        snap.rows = None  # les lignes suivantes se décalent : reconstruit à la prochaine tâche
+        ranges = []
+        for row in rows:
+            if ranges and ranges[-1][1] == row - 1:
+                ranges[-1][1] = row
+            else:
+                ranges.append([row, row])
+        if len(ranges) > MAX_REMOVE_RANGES:
+            self.aboutToReset.emit(snap.path)
+            snap.store.remove(rows)
+            self.reset.emit(snap.path)
+            return
+        for first, last in reversed(ranges):
+            self.aboutToRemove.emit(snap.path, first, last)
+            snap.store.remove(range(first, last + 1))
+            self.removed.emit(snap.path, first, last)
+
+    def _on_failed(self, path, generation, message):
+        snap = self._current(path, generation)
+        if snap is None:
+            return
+        snap.busy = False
+        snap.touched.clear()
+        self.failed.emit(path, message)
+
+    def _on_finished(self, path, generation, mtime):
+        snap = self._current(path, generation)
+        if snap is None:
+            return
+        snap.busy = False
+        snap.complete = True
+        snap.mtime = mtime
+        RECORDER.record(snap.task, snap.started, path=path)
+        self.loaded.emit(path)
+        if snap.dirty:
+            snap.touched.clear()
+            self.refresh(path)
+        elif snap.touched:
+            names, snap.touched = snap.touched, set()
+            self._on_entries_changed(path, names)
@@ -0,0 +1,402 @@
+# -*- coding: utf-8 -*-
+"""
+Tri et filtre du panneau de liste.
+
+Les clés de tri (ordering) sont calculées une fois par entrée, à mesure que
+le dossier arrive. Un tri produit une permutation des lignes de
+l'instantané ; changer de colonne, d'ordre ou de filtre ne fait que
+remplacer cette permutation (layoutChanged), sans réinitialiser le modèle
+ni perdre la sélection.
+
+La permutation de toutes les lignes, avant filtre, est gardée tant que le
+dossier ne change pas : changer de filtre la filtre à nouveau, inverser
+l'ordre la retourne, sans rien retrier. Au-delà de SORT_SYNC_MAX lignes,
+clés, tri et filtre sont calculés dans un thread ; la liste garde son
+ordre d'ici là.
+
+Pendant l'énumération d'un dossier, les lignes arrivées sont ajoutées en
+fin de liste et le tri complet est fait une fois le dossier chargé.
+"""
+from array import array
+from itertools import compress
+
+from PyQt5.QtCore import QAbstractProxyModel, QModelIndex, QObject, QRunnable, Qt, QThreadPool, QTimer, pyqtSignal
+
+from explorer.ordering import COLUMNS, SortColumns, match_mask, wildcard
+
+INSERT_MAX = 64  # au-delà, des lignes ajoutées à un dossier chargé sont triées en une fois
+RESORT_MS = 200  # regroupement des tris après des modifications
+PERSISTENT_SCAN = 16  # au-delà, les index persistants sont replacés par une table inverse
+SORT_SYNC_MAX = 20000  # au-delà, le tri est calculé dans un thread
+
+
+def _arrange(columns, count, sort, regex, full=None):
+    """
+    Tri et filtre des lignes 0 à count (exclue).
+    @param sort : (colonne, décroissant)
+    @param full : permutation de toutes les lignes déjà triée selon sort, ou None
+    @return : (permutation de toutes les lignes, lignes affichées)
+    """
+    column, descending = sort
+    columns.extend(count, names=column == "name")
+    if full is None:
+        full = columns.argsort(range(count), column, descending)
+    if regex is None:
+        return full, array('q', full)
+    mask = match_mask(columns.store, 0, count, regex)
+    return full, array('q', compress(full, map(mask.__getitem__, full)))
+
+
+class _SortSignals(QObject):
+    finished = pyqtSignal(int, int, object, object, object)
+
+
+class _SortTask(QRunnable):
+
+    def __init__(self, generation, columns, count, sort, regex, full, signals):
+        QRunnable.__init__(self)
+        self.generation = generation
+        self.columns = columns
+        self.count = count
+        self.sort = sort
+        self.regex = regex
+        self.full = full
+        self.signals = signals
+
+    def run(self):
+        full, order = _arrange(self.columns, self.count, self.sort, self.regex, self.full)
+        self.signals.finished.emit(self.generation, self.count, self.columns, full, order)
+
+
+class SortFilterModel(QAbstractProxyModel):
+    """
+    Tri et filtre au-dessus d'un ListingModel. Sans tri ni filtre, les lignes
+    restent celles du modèle source, chargées à la demande de la vue ; sinon
+    le modèle source expose tout le dossier (setEager) et la vue lit les
+    lignes au travers de la permutation.
+    """
+
+    def __init__(self, source, parent=None):
+        QAbstractProxyModel.__init__(self, parent)
+        self._column = "none"
+        self._descending = False
+        self._regex = None
+        self._columns = None
+        self._order = range(0)  # lignes source dans l'ordre d'affichage (range sans tri ni filtre)
+        self._inverse = None  # ligne source -> ligne affichée, calculée à la demande
+        self._unsorted = False  # des lignes attendent en fin de liste le prochain tri
+        self._full = None  # permutation de toutes les lignes, triée selon _full_sort
+        self._full_sort = None
+        self._generation = 0  # incrémenté quand un tri en cours ne vaut plus
+        self._sorting = False  # un tri est calculé dans le thread
+        self._resort_timer = QTimer(self)
+        self._resort_timer.setSingleShot(True)
+        self._resort_timer.timeout.connect(self.resort)
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(1)
+        self._signals = _SortSignals(self)
+        self._signals.finished.connect(self._on_sorted)
+
+        self.setSourceModel(source)
+        source.modelAboutToBeReset.connect(self.beginResetModel)
+        source.modelReset.connect(self._on_reset)
+        source.rowsInserted.connect(self._on_inserted)
+        source.rowsAboutToBeRemoved.connect(self._on_about_to_remove)
+        source.rowsRemoved.connect(self._on_removed)
+        source.dataChanged.connect(self._on_data_changed)
+        source.directoryLoaded.connect(self._on_loaded)
+        self._rebuild()
+
+    # --- réglages
+
+    def sortColumn(self):
+        return self._column
+
+    def descending(self):
+        return self._descending
+
+    def active(self):
+        return self._column != "none" or self._regex is not None
+
+    def sorting(self):
+        """
+        @return : True tant que le tri demandé est calculé dans le thread
+        """
+        return self._sorting
+
+    def setSort(self, column, descending=False):
+        if column not in COLUMNS:
+            raise ValueError("colonne de tri inconnue : {0}".format(column))
+        self._column = column
+        self._descending = descending
+        self.resort()
+
+    def setFilter(self, pattern):
+        """
+        @param pattern : motif à jokers (voir wildcard), vide pour tout afficher
+        """
+        self._regex = wildcard(pattern)
+        self.resort()
+
+    # --- accès du reste de l'explorateur
+
+    def rootPath(self):
+        return self.sourceModel().rootPath()
+
+    def filePath(self, index):
+        return self.sourceModel().filePath(self.mapToSource(index))
+
+    def isDir(self, index):
+        return self.sourceModel().isDir(self.mapToSource(index))
+
+    def entries(self):
+        return self.sourceModel().entries()
+
+    def order(self):
+        """
+        @return : lignes de entries() dans l'ordre d'affichage, ou None si
+                  c'est l'ordre de entries()
+        """
+        return self._order if self.active() else None
+
+    def indexForName(self, name):
+        return self.mapFromSource(self.sourceModel().indexForName(name))
+
+    def indexesForNames(self, names, hints=None):
+        return {name: self.mapFromSource(index)
+                for name, index in self.sourceModel().indexesForNames(names, hints).items()}
+
+    def thumbnailKey(self, row):
+        return self.sourceModel().thumbnailKey(self._order[row])
+
+    # --- QAbstractProxyModel
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._order)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else 1
+
+    def index(self, row, column=0, parent=QModelIndex()):
+        if parent.isValid() or column != 0 or not 0 <= row < len(self._order):
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index):
+        return QModelIndex()
+
+    def mapToSource(self, index):
+        if not index.isValid() or index.row() >= len(self._order):
+            return QModelIndex()
+        return self.sourceModel().index(self._order[index.row()])
+
+    def mapFromSource(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        if not self.active():
+            return self.index(index.row())
+        row = self._inverse_map()[index.row()] if index.row() < len(self._columns.dirs) else -1
+        return self.index(row) if row >= 0 else QModelIndex()
+
+    # --- permutation
+
+    def _inverse_map(self):
+        if self._inverse is None:
+            inverse = array('q', [-1]) * len(self._columns.dirs)
+            for position, row in enumerate(self._order):
+                inverse[row] = position
+            self._inverse = inverse
+        return self._inverse
+
+    def _sort(self):
+        """
+        @return : (colonne, décroissant) ; l'ordre de l'énumération n'a pas de sens
+        """
+        return self._column, self._descending and self._column != "none"
+
+    def _rebuild(self):
+        self._generation += 1
+        self._sorting = False
+        self._columns = SortColumns(self.sourceModel().entries())
+        self._full = None
+        self._inverse = None
+        self._unsorted = False
+        count = self.sourceModel().rowCount()
+        if not self.active():
+            self._order = range(count)
+        elif count > SORT_SYNC_MAX:
+            # en attendant le tri : l'ordre de l'énumération, ou rien si un filtre est actif
+            self._order = array('q') if self._regex is not None else array('q', range(count))
+            self._start_sort(count, None)
+        else:
+            self._full, self._order = _arrange(self._columns, count, self._sort(), self._regex)
+            self._full_sort = self._sort()
+
+    def resort(self):
+        """
+        Recalcule la permutation et replace les index persistants (sélection,
+        ligne courante) : la vue ne voit qu'un changement de disposition. La
+        permutation complète est reprise, ou retournée, si elle est à jour.
+        """
+        self._resort_timer.stop()
+        self._generation += 1
+        self._sorting = False
+        # le tri porte sur tout le dossier : les lignes manquantes arrivent d'abord par _on_inserted
+        self.sourceModel().setEager(self.active())
+        count = self.sourceModel().rowCount()
+        if not self.active():
+            self._set_order(range(count))
+            return
+        sort = self._sort()
+        full = None
+        if self._full is not None:
+            if self._full_sort == sort:
+                full = self._full
+            elif self._full_sort == (sort[0], not sort[1]):
+                full = self._columns.reverse(self._full)
+        if count > SORT_SYNC_MAX and (full is None or self._regex is not None):
+            self._start_sort(count, full)
+            return
+        self._full, order = _arrange(self._columns, count, sort, self._regex, full)
+        self._full_sort = sort
+        self._set_order(order)
+
+    def _start_sort(self, count, full):
+        self._sorting = True
+        self._unsorted = True  # les lignes qui arrivent d'ici là restent en fin de liste
+        self._pool.start(_SortTask(self._generation, self._columns.copy(), count, self._sort(), self._regex,
+                                   full, self._signals))
+
+    def _on_sorted(self, generation, count, columns, full, order):
+        if generation != self._generation:
+            return
+        self._sorting = False
+        if count != self.sourceModel().rowCount():
+            # lignes arrivées entre-temps : le dossier chargé sera trié de nouveau
+            if not self.sourceModel().loading():
+                self.resort()
+            return
+        self._columns = columns
+        self._full, self._full_sort = full, self._sort()
+        self._set_order(order)
+
+    def _set_order(self, order):
+        self.layoutAboutToBeChanged.emit()
+        persistent = self.persistentIndexList()
+        old = self._order
+        sources = [old[index.row()] if index.row() < len(old) else -1 for index in persistent]
+        self._order = order
+        self._inverse = None
+        self._unsorted = False
+        if persistent:
+            self.changePersistentIndexList(persistent, [self.index(row) if row >= 0 else QModelIndex()
+                                                        for row in self._positions(sources)])
+        self.layoutChanged.emit()
+
+    def _positions(self, sources):
+        if len(sources) > PERSISTENT_SCAN:
+            inverse = self._inverse_map()
+            return [inverse[row] if 0 <= row < len(inverse) else -1 for row in sources]
+        positions = []
+        for row in sources:
+            try:
+                positions.append(self._order.index(row))
+            except ValueError:
+                positions.append(-1)
+        return positions
+
+    # --- suivi du modèle source
+
+    def _on_reset(self):
+        self._rebuild()
+        self.endResetModel()
+
+    def _on_inserted(self, parent, first, last):
+        self._full = None
+        if not self.active():
+            # lignes ajoutées en fin par le modèle source
+            self.beginInsertRows(QModelIndex(), first, last)
+            self._order = range(last + 1)
+            self.endInsertRows()
+            return
+        columns = self._columns
+        # pendant un tri, le thread calcule les clés manquantes sur sa copie
+        columns.extend(last + 1, names=self._column == "name" and not self._sorting)
+        rows = range(first, last + 1)
+        if self._regex is not None:
+            rows = compress(rows, match_mask(columns.store, first, last + 1, self._regex))
+        rows = list(rows)
+        if not rows:
+            return
+        self._inverse = None
+        if isinstance(self._order, range):
+            self._order = array('q', self._order)  # tri ou filtre demandé, pas encore appliqué
+        loading = self.sourceModel().loading()
+        if self._column == "none" or self._unsorted or loading or len(rows) > INSERT_MAX:
+            # en fin de liste ; triées avec le reste une fois le dossier chargé
+            end = len(self._order)
+            self.beginInsertRows(QModelIndex(), end, end + len(rows) - 1)
+            self._order.extend(rows)
+            self.endInsertRows()
+            if self._column != "none":
+                self._unsorted = True
+                if not loading:
+                    self._resort_timer.start(RESORT_MS)
+            return
+        for row in rows:
+            position = columns.position(self._order, row, self._column, self._descending)
+            self.beginInsertRows(QModelIndex(), position, position)
+            self._order.insert(position, row)
+            self.endInsertRows()
+
+    def _on_about_to_remove(self, parent, first, last):
+        if self.active():
+            positions = [position for position, row in enumerate(self._order) if first <= row <= last]
+        else:
+            positions = range(first, min(last + 1, len(self._order)))
+        # plages contiguës, de la fin vers le début
+        ranges = []
+        for position in reversed(positions):
+            if ranges and ranges[-1][0] == position + 1:
+                ranges[-1][0] = position
+            else:
+                ranges.append([position, position])
+        for start, stop in ranges:
+            self.beginRemoveRows(QModelIndex(), start, stop)
+            if self.active():
+                del self._order[start:stop + 1]
+            else:
+                self._order = range(len(self._order) - (stop - start + 1))
+            self.endRemoveRows()
+
+    def _on_removed(self, parent, first, last):
+        self._columns.remove(first, last)
+        self._full = None
+        if self._sorting:
+            # le tri en cours porte sur les anciennes lignes
+            self._generation += 1
+            self._sorting = False
+            self._resort_timer.start(RESORT_MS)
+        if self.active():
+            count = last - first + 1
+            self._order = array('q', (row - count if row > last else row for row in self._order))
+        self._inverse = None
+
+    def _on_data_changed(self, top_left, bottom_right, roles=()):
+        if not self.active():
+            self.dataChanged.emit(self.index(top_left.row()), self.index(bottom_right.row()), roles)
+            return
+        inverse = self._inverse_map()
+        rows = [inverse[row] for row in range(top_left.row(), min(bottom_right.row() + 1, len(inverse)))]
+        rows = [row for row in rows if row >= 0]
+        if rows:
+            self.dataChanged.emit(self.index(min(rows)), self.index(max(rows)), roles)
+        if self._column in ("size", "mtime") and (not roles or Qt.DisplayRole in roles):
+            self._full = None
+            self._resort_timer.start(RESORT_MS)
+
+    def _on_loaded(self, path):
+        if self._unsorted and not self._sorting:
+            self.resort()
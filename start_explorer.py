@@ -1,11 +1,36 @@
+import sys
+
+if __name__ == "__main__" and sys.argv[1:2] and sys.argv[1].startswith("--"):
+    # mode sans interface : la commande est traitée avant d'importer PyQt
+    from explorer.cli import main as cli_main
+    sys.exit(cli_main(sys.argv[1:]))
+
 from PyQt5 import QtGui, QtWidgets, QtCore
 
 from PyQt5.QtCore import *
 from PyQt5.QtWidgets import QMainWindow, QSplitter, QTreeView, QMenu
 
-import sys
+import os
+import re
+import tempfile
 
+from explorer import backends
 from explorer.Explorer import Ui_Explorer
+from explorer.dircache import DirectoryCache
+from explorer.instrumentation import RECORDER
+from explorer.listing import ListingModel
+from explorer.navigation import (HISTORY_MAX_BYTES, HISTORY_MAX_DIRS, MAX_SELECTED, NavigationHistory,
+                                 NavigationScheduler, PrefetchCache, ViewState)
+from explorer.searchbar import ComparePanel, ContentSearchPanel, IndexFeeder, PathBar
+from explorer.session import Session
+from explorer.snapshots import DirectoryService
+from explorer.sorting import SortFilterModel
+from explorer.treemodel import DirTreeModel
+
+DEFERRED_MS = 500  # seconde phase du démarrage si la fenêtre n'est pas peinte avant
+FILTER_DELAY_MS = 150  # frappe dans le champ de filtre regroupée
+FAILURE_MS = 10000  # durée d'affichage d'un dossier illisible dans la barre d'état
+SORT_COLUMNS = (("none", "Ordre du disque"), ("name", "Nom"), ("size", "Taille"), ("mtime", "Date"))
 
 
 class XTreeView(QTreeView):
@@ -34,67 +59,642 @@ class ExploreClockScreen(QMainWindow):
         self.setup_gui()
 
     def setup_gui(self):
+        """
+        Première phase : de quoi afficher la fenêtre telle qu'à la fermeture
+        précédente (arborescence, liste, chemin). Les listes viennent du cache
+        des dossiers ; le reste est mis en place par setup_deferred() une fois
+        la fenêtre peinte.
+        """
         path = QDir.rootPath()
+        self.session = Session.load() or Session(path)
+        self._deferred_done = False
         #self.ui.treeView=QTreeView()
         splitter = QSplitter(Qt.Horizontal)
 
-        self.dirModel = QtWidgets.QFileSystemModel()
-        self.dirModel.setRootPath(QDir.rootPath())
-        self.dirModel.setFilter(QDir.NoDotAndDotDot | QDir.AllDirs)
+        # un seul service d'instantanés pour l'arborescence et la liste :
+        # chaque dossier n'est énuméré et surveillé qu'une fois
+        self.dirCache = DirectoryCache()
+        self.prefetch = PrefetchCache()
+        self.recent = PrefetchCache(HISTORY_MAX_DIRS, HISTORY_MAX_BYTES)  # dossiers quittés récemment
+        self.dirService = DirectoryService(self, cache=self.dirCache, prefetch=self.prefetch, history=self.recent)
+        self.dirService.deferWatches()  # surveillances posées après le premier affichage
+
+        self.dirModel = DirTreeModel(self.dirService, path, self)
         self.ui.treeView.setModel(self.dirModel)
-        self.ui.treeView.setRootIndex(self.dirModel.index(path))
         self.ui.treeView.clicked.connect(self.on_clicked)
+        self.ui.treeView.collapsed.connect(self.dirModel.collapse)
         #self.ui.treeView.setSelectionModel(self.dirModel)
         # self.ui.treeView.setSelectionCallback(self.select_item())
         # self.ui.treeView.setContextMenuPolicy()
 
         self.ui.treeView.show()
-        self.fileModel = QtWidgets.QFileSystemModel()
-        self.fileModel.setFilter(QDir.NoDotAndDotDot | QDir.AllDirs | QDir.Files)
-        self.ui.listView.setModel(self.fileModel)
-        self.ui.listView.setRootIndex(self.dirModel.index(path))
-
-        self.ui.treeView.hideColumn(1)
-        self.ui.treeView.hideColumn(2)
-        self.ui.treeView.hideColumn(3)
+        # liste alimentée par lots en arrière-plan (scandir), annulable à chaque clic
+        self.fileModel = ListingModel(self.dirService, self)
+        self.navigator = NavigationScheduler(self.fileModel, self.prefetch, self.sibling_paths, parent=self)
+        # tri et filtre : permutation des lignes, sans réinitialiser la liste
+        self.listModel = SortFilterModel(self.fileModel, self)
+        self.ui.listView.setUniformItemSizes(True)
+        self.ui.listView.setModel(self.listModel)
+        self.ui.listView.doubleClicked.connect(self.on_list_activated)
+        self.thumbnails = None  # créé au premier passage en mode icônes
+
+        # barre du haut : chemin courant, ou recherche dans l'index des noms
+        self.indexFeeder = IndexFeeder(self.dirService)
+        self.pathBar = PathBar(self.ui.textEdit, self.indexFeeder.index, self)
+        self.pathBar.navigateRequested.connect(self.navigator.navigate)
+        self.pathBar.resultsShown.connect(self.show_results)
+        self.fileModel.rootPathChanged.connect(self.pathBar.setPath)
+        self.fileModel.directoryFailed.connect(self.on_listing_failed)
+
+        # historique : Précédent, Suivant et Home ; chaque dossier quitté garde l'état de sa liste
+        self.history = NavigationHistory()
+        self._history_target = None  # dossier demandé par Précédent ou Suivant
+        self.pb_back = self._history_button("◀", "Précédent (Alt+Gauche)", self.go_back)
+        self.pb_forward = self._history_button("▶", "Suivant (Alt+Droite)", self.go_forward)
+        self.ui.horizontalLayout.insertWidget(0, self.pb_back)
+        self.ui.horizontalLayout.insertWidget(1, self.pb_forward)
+        self.ui.pb_home.clicked.connect(self.go_home)
+        for key, slot in ((QtGui.QKeySequence.Back, self.go_back), (QtGui.QKeySequence.Forward, self.go_forward)):
+            action = QtWidgets.QAction(self)
+            action.setShortcut(key)
+            action.triggered.connect(slot)
+            self.addAction(action)
+        self.navigator.aboutToNavigate.connect(self.leave_folder)
+        self.fileModel.rootPathChanged.connect(self.on_history_visit)
+        self.fileModel.setRootPath(self.session.folder)
+
         self.ui.treeView.installEventFilter(self)
         #self.ui.treeView.CurrentChanged
 
+        # état de la session précédente, appliqué au fil des chargements
+        self._pending_expand = list(self.session.expanded)
+        self._restoring = False
+        self._pending_view = (self.session.folder, ViewState(self.session.first_row), None, 0)
+        self.dirModel.rowsInserted.connect(self._restore_tree)
+        self.fileModel.rowsInserted.connect(self._restore_view)
+        self.fileModel.modelReset.connect(self._restore_view)
+        self.fileModel.directoryLoaded.connect(self._restore_view)
+        self.listModel.layoutChanged.connect(self._restore_view)
+        self._restore_tree()
+        self._restore_view()
+        # seconde phase dès la première peinture de la liste, ou au plus tard après DEFERRED_MS
+        self.ui.listView.viewport().installEventFilter(self)
+        QTimer.singleShot(DEFERRED_MS, self.setup_deferred)
+
+    def setup_deferred(self):
+        """
+        Seconde phase, après le premier affichage : modules et panneaux dont
+        la fenêtre n'a pas besoin pour se peindre, importés seulement ici.
+        """
+        if self._deferred_done:
+            return
+        self._deferred_done = True
+        from explorer.details import DuplicatePanel, FolderSizePanel, PreviewPanel
+        from explorer.metricsbar import MetricsStatus
+        from explorer.selection import SelectionAggregator
+        from explorer.transfers import TransferPanel
+
+        self.dirService.startWatching()
+
+        # page de détails (page1) : taille récursive du dossier courant, aperçu du fichier sélectionné
+        self.sizePanel = FolderSizePanel(self.ui.frame_3, self)
+        self.sizePanel.folderActivated.connect(self.navigator.navigate)
+        self.previewPanel = PreviewPanel(self.ui.frame, self)
+        self.duplicatePanel = DuplicatePanel(self.ui.frame_2, self)
+        self.duplicatePanel.fileActivated.connect(self.show_file)
+        self.fileModel.rootPathChanged.connect(self.on_folder_changed)
+        pages = QtWidgets.QActionGroup(self)
+        self.action_list = self.ui.menuAffichage.addAction("Liste")
+        self.action_icons = self.ui.menuAffichage.addAction("Icônes")
+        self.action_details = self.ui.menuAffichage.addAction("Détails")
+        for action in (self.action_list, self.action_icons, self.action_details):
+            action.setCheckable(True)
+            pages.addAction(action)
+        self.action_list.setChecked(True)
+        self.action_list.triggered.connect(lambda: self.show_icons(False))
+        self.action_icons.triggered.connect(lambda: self.show_icons(True))
+        self.action_details.triggered.connect(lambda: self.show_page(self.ui.page1))
+
+        # mesures du chemin de navigation (EXPLORER_TRACE=1 pour les activer au démarrage)
+        self.metrics = MetricsStatus(self.ui.statusbar, {"paint_list": self.ui.listView,
+                                                         "paint_tree": self.ui.treeView}, parent=self)
+        self.ui.menuAffichage.addSeparator()
+        self.action_metrics = self.ui.menuAffichage.addAction("Mesures")
+        self.action_metrics.setCheckable(True)
+        self.action_metrics.setChecked(RECORDER.enabled)
+        self.action_metrics.toggled.connect(self.metrics.setEnabled)
+        self.ui.menuAffichage.addAction("Exporter les mesures…").triggered.connect(self.export_metrics)
+
+        # tri (menu Affichage) et filtre à jokers (barre d'état) du panneau de liste
+        self.ui.menuAffichage.addSeparator()
+        sort_menu = self.ui.menuAffichage.addMenu("Trier par")
+        columns = QtWidgets.QActionGroup(self)
+        for column, text in SORT_COLUMNS:
+            action = sort_menu.addAction(text)
+            action.setCheckable(True)
+            action.setChecked(column == self.listModel.sortColumn())
+            action.setData(column)
+            columns.addAction(action)
+        columns.triggered.connect(lambda action: self.listModel.setSort(action.data(),
+                                                                        self.action_descending.isChecked()))
+        sort_menu.addSeparator()
+        self.action_descending = sort_menu.addAction("Ordre décroissant")
+        self.action_descending.setCheckable(True)
+        self.action_descending.toggled.connect(
+            lambda checked: self.listModel.setSort(self.listModel.sortColumn(), checked))
+        self.filterEdit = QtWidgets.QLineEdit(self.ui.statusbar)
+        self.filterEdit.setPlaceholderText("Filtrer (*.txt)")
+        self.filterEdit.setClearButtonEnabled(True)
+        self.filterEdit.setMaximumWidth(180)
+        self.ui.statusbar.addPermanentWidget(self.filterEdit)
+        self._filter_timer = QTimer(self)
+        self._filter_timer.setSingleShot(True)
+        self._filter_timer.setInterval(FILTER_DELAY_MS)
+        self._filter_timer.timeout.connect(lambda: self.listModel.setFilter(self.filterEdit.text()))
+        self.filterEdit.textChanged.connect(self._filter_timer.start)
+        self.fileModel.rootPathChanged.connect(self.clear_filter)
+
+        # totaux de la sélection (nombre, taille, types) tenus par différences
+        self.selectionTotals = SelectionAggregator(self.ui.listView, self.ui.statusbar, self)
+
+        # copier / couper / coller / supprimer : moteur en arrière-plan, suivi dans la barre d'état
+        self.transfers = TransferPanel(self.ui.statusbar, self)
+        self.transfers.extracted.connect(self.open_files)
+        self._cut_paths = []
+        self.ui.listView.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
+        self.ui.listView.setDragEnabled(True)
+        self.ui.listView.setDragDropMode(QtWidgets.QAbstractItemView.DragOnly)
+        self.ui.treeView.setDragEnabled(True)
+        self.ui.treeView.setDragDropMode(QtWidgets.QAbstractItemView.DragOnly)
+        self.ui.listView.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.ui.listView.customContextMenuRequested.connect(self.context_menu)
+        self.action_open = self._list_action("Ouvrir", None, self.menu_open)
+        self.action_copy = self._list_action("Copier", QtGui.QKeySequence.Copy, lambda: self.copy_selection(False))
+        self.action_cut = self._list_action("Couper", QtGui.QKeySequence.Cut, lambda: self.copy_selection(True))
+        self.action_paste = self._list_action("Coller", QtGui.QKeySequence.Paste, self.paste)
+        self.action_delete = self._list_action("Supprimer", QtGui.QKeySequence.Delete, self.delete_selection)
+
+        # recherche dans le contenu du dossier choisi dans l'arborescence, résultats dans la liste
+        self.contentSearch = ContentSearchPanel(self.ui.statusbar, self)
+        self.contentSearch.resultsShown.connect(self.show_results)
+        self.fileModel.rootPathChanged.connect(self.contentSearch.hide)
+        # comparaison du dossier choisi avec un autre, différences dans la liste
+        self.comparePanel = ComparePanel(self.ui.statusbar, self)
+        self.comparePanel.resultsShown.connect(self.show_results)
+        self.fileModel.rootPathChanged.connect(self.comparePanel.hide)
+        self.ui.treeView.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.ui.treeView.customContextMenuRequested.connect(self.tree_context_menu)
+
+        if self.session.mode == "icons":
+            self.action_icons.setChecked(True)
+            self.show_icons(True)
+        elif self.session.mode == "details":
+            self.action_details.setChecked(True)
+            self.show_page(self.ui.page1)
+
         # self.ui.treeView.itemSelectionChanged.connect(self.loadAllMessages)
 
+    def _restore_tree(self, *args):
+        """
+        Déplie les noeuds de la session précédente à mesure que leurs parents
+        sont chargés, puis sélectionne le dossier courant.
+        """
+        if self._restoring:
+            return  # rappel depuis expand() : la boucle ci-dessous reprend
+        self._restoring = True
+        progress = True
+        while progress:
+            progress = False
+            for path in list(self._pending_expand):
+                index = self.dirModel.indexForPath(path)
+                if index.isValid():
+                    self._pending_expand.remove(path)
+                    self.ui.treeView.expand(index)
+                    progress = True
+                elif not self._may_appear(path):
+                    self._pending_expand.remove(path)  # disparu depuis la fermeture
+        self._restoring = False
+        if not self._pending_expand:
+            self.dirModel.rowsInserted.disconnect(self._restore_tree)
+            index = self.dirModel.indexForPath(self.session.folder)
+            if index.isValid():
+                self.ui.treeView.setCurrentIndex(index)
+                self.ui.treeView.scrollTo(index)
+
+    def _may_appear(self, path):
+        """
+        @return : False si path ne peut plus apparaître dans l'arborescence :
+                  son parent est chargé sans lui, ou ne sera pas déplié
+        """
+        parent = os.path.dirname(path)
+        if self.dirModel.acquiredPaths().get(parent):
+            return False
+        if parent == self.dirModel.rootPath() or parent in self._pending_expand:
+            return True
+        return self.ui.treeView.isExpanded(self.dirModel.indexForPath(parent))
+
+    def _restore_view(self, *args):
+        """
+        Applique l'état de liste en attente (session précédente, Précédent ou
+        Suivant) dès que sa première ligne visible est chargée, ou à la fin
+        du chargement si elle n'existe plus.
+        """
+        if self._pending_view is None:
+            return
+        folder, state, store, searched = self._pending_view
+        if self.fileModel.rootPath() != folder:
+            self._pending_view = None
+            return
+        if self.listModel.sorting():
+            return  # reprise quand le tri arrive (layoutChanged)
+        # indexForName insère des lignes (rowsInserted) : pas d'appel imbriqué
+        self._pending_view = None
+        entries = self.fileModel.entries()
+        if state.first_row is not None:
+            if entries is not store:
+                searched = 0  # instantané remplacé : tout est à revoir
+            if not entries.find_many([state.first_row], state.rows, searched):
+                if self.fileModel.loading():
+                    # pas encore chargée : seules les lignes suivantes seront examinées
+                    self._pending_view = (folder, state, entries, len(entries))
+                    return
+        # tous les index d'abord, en un parcours : la vue ne refait sa mise en page qu'une fois
+        found = self.listModel.indexesForNames(state.names(), state.rows)
+        top = found.get(state.first_row)
+        current = found.get(state.current)
+        rows = sorted(found[name].row() for name in state.selected if name in found and found[name].isValid())
+        view = self.ui.listView
+        selection = QItemSelection()
+        start = None
+        for i, row in enumerate(rows):
+            if start is None:
+                start = row
+            if i + 1 == len(rows) or rows[i + 1] != row + 1:
+                selection.select(self.listModel.index(start), self.listModel.index(row))
+                start = None
+        if current is not None and current.isValid():
+            view.selectionModel().setCurrentIndex(current, QItemSelectionModel.NoUpdate)
+        if not selection.isEmpty():
+            view.selectionModel().select(selection, QItemSelectionModel.ClearAndSelect)
+        if top is not None and top.isValid():
+            view.scrollTo(top, QtWidgets.QAbstractItemView.PositionAtTop)
+
+    def _history_button(self, text, tip, slot):
+        button = QtWidgets.QPushButton(text, self.ui.frame_top)
+        button.setToolTip(tip)
+        button.setMinimumSize(self.ui.pb_home.minimumSize())
+        button.setMaximumSize(self.ui.pb_home.maximumSize())
+        button.setStyleSheet(self.ui.pb_home.styleSheet())
+        button.setEnabled(False)
+        button.clicked.connect(slot)
+        return button
+
+    def leave_folder(self, old, new):
+        """
+        Garde dans l'historique l'état de la liste de old, qu'on quitte.
+        """
+        view = self.ui.listView
+        if not old or view.model() is not self.listModel:
+            return
+        model = self.listModel
+        rows = {}
+
+        def name_of(index):
+            if not index.isValid():
+                return None
+            name = index.data()
+            rows[name] = model.mapToSource(index).row()
+            return name
+
+        first = name_of(view.indexAt(QPoint(0, 0)))
+        current = name_of(view.currentIndex())
+        selected = []
+        # plages de la sélection, sans construire un index par ligne sélectionnée
+        for selected_range in view.selectionModel().selection():
+            stop = min(selected_range.bottom() + 1, selected_range.top() + MAX_SELECTED - len(selected))
+            selected.extend(name_of(model.index(row)) for row in range(selected_range.top(), stop))
+            if len(selected) >= MAX_SELECTED:
+                break
+        self.history.save_state(old, ViewState(first, current, selected, rows))
+
+    def on_history_visit(self, path):
+        if path == self._history_target:
+            self._history_target = None  # déjà la position courante de l'historique
+        else:
+            self.history.visit(path)
+        self.pb_back.setEnabled(self.history.can_go_back())
+        self.pb_forward.setEnabled(self.history.can_go_forward())
+
+    def go_back(self):
+        self._go_history(self.history.back)
+
+    def go_forward(self):
+        self._go_history(self.history.forward)
+
+    def _go_history(self, move):
+        self.leave_folder(self.fileModel.rootPath(), None)  # avant que l'historique ne change de position
+        entry = move()
+        if entry is None:
+            return
+        path, state = entry
+        if path != self.fileModel.rootPath():
+            self._history_target = path
+        self._pending_view = (path, state, None, 0) if state is not None else None
+        self.navigator.navigate(path)
+        self._restore_view()
+
+    def go_home(self):
+        self.navigator.navigate(QDir.homePath())
+
+    def save_session(self):
+        view = self.ui.treeView
+        expanded = [path for path in self.dirModel.acquiredPaths()
+                    if view.isExpanded(self.dirModel.indexForPath(path))]
+        first = self.ui.listView.indexAt(QPoint(0, 0))
+        mode = "list"
+        if self.ui.stackedWidget.currentWidget() is self.ui.page1:
+            mode = "details"
+        elif self.ui.listView.viewMode() == QtWidgets.QListView.IconMode:
+            mode = "icons"
+        folder = self.fileModel.rootPath()
+        session = Session(folder, sorted(expanded, key=len),
+                          first.data() if first.isValid() and self.ui.listView.model() is self.listModel else None,
+                          mode)
+        try:
+            session.save()
+        except OSError:
+            pass
+
+    def _list_action(self, text, shortcut, slot):
+        action = QtWidgets.QAction(text, self.ui.listView)
+        if shortcut is not None:
+            action.setShortcut(shortcut)
+            action.setShortcutContext(Qt.WidgetShortcut)
+        action.triggered.connect(slot)
+        self.ui.listView.addAction(action)
+        return action
+
     def loadAllMessages(self, folder):
         item = self.treeWidget.currentItem()
 
     def eventFilter(self, obj, event):
+        if obj is self.ui.listView.viewport() and event.type() == QtCore.QEvent.Paint:
+            obj.removeEventFilter(self)
+            QTimer.singleShot(0, self.setup_deferred)
         if obj == self.ui.treeView:
 
             if event.type() == QtCore.QEvent.KeyRelease: # jamais sur key down
                 if event.key() == QtCore.Qt.Key_Return:
                     print("enter pressed")
 
-                if event.key() == QtCore.Qt.Key_Up:
-                    sel = self.ui.treeView.selectedIndexes()[0]
-                    self.on_clicked(sel)
-
-                if event.key() == QtCore.Qt.Key_Down:
-                    sel=self.ui.treeView.selectedIndexes()[0]
-                    self.on_clicked(sel)
+                # flèche maintenue : demandes regroupées par le navigateur
+                if event.key() in (QtCore.Qt.Key_Up, QtCore.Qt.Key_Down):
+                    sel = self.ui.treeView.selectedIndexes()
+                    if sel:
+                        self.navigator.request(self.dirModel.filePath(sel[0]))
 
         return super(QMainWindow, self).eventFilter(obj, event)
 
     def on_clicked(self, index):
-        path = self.dirModel.fileInfo(index).absoluteFilePath()
-        self.ui.listView.setRootIndex(self.fileModel.setRootPath(path))
+        path = self.dirModel.filePath(index)
+        self.navigator.navigate(path)
+
+    def on_folder_changed(self, path):
+        if self.ui.stackedWidget.currentWidget() is self.ui.page1:
+            self.sizePanel.show_folder(path)
+            shown = self.previewPanel.path()
+            if self.current_file() is not None or shown is None or os.path.dirname(shown) != path:
+                self.previewPanel.show_file(self.current_file())
+        else:
+            self.sizePanel.cancel()
+            self.previewPanel.clear()
+
+    def current_file(self):
+        """
+        @return : chemin du fichier courant de la liste, ou None
+        """
+        index = self.ui.listView.currentIndex()
+        if not index.isValid():
+            return None
+        path = index.model().filePath(index)
+        return None if backends.is_folder(path) else path
+
+    def show_results(self, model):
+        self.ui.listView.setModel(model if model is not None else self.listModel)
+        if self._deferred_done:
+            self.selectionTotals.attach()
+
+    def on_listing_failed(self, path, message):
+        self.ui.statusbar.showMessage("{0} : {1}".format(path, message), FAILURE_MS)
+
+    def on_list_activated(self, index):
+        path = index.model().filePath(index)
+        if not backends.is_folder(path):  # une archive s'ouvre comme un dossier
+            if index.model() is self.listModel:
+                if self._deferred_done:  # aperçu du fichier
+                    self.action_details.setChecked(True)
+                    self.show_page(self.ui.page1)
+                return
+            path = os.path.dirname(path)
+        if self._deferred_done:
+            self.contentSearch.hide()
+            self.comparePanel.hide()
+        self.pathBar.setPath(path)
+        self.navigator.navigate(path)
+
+    def show_page(self, page):
+        self.ui.stackedWidget.setCurrentWidget(page)
+        self.on_folder_changed(self.fileModel.rootPath())
+
+    def show_icons(self, icons):
+        view = self.ui.listView
+        if icons and self.thumbnails is None:
+            # mode icônes : miniatures décodées hors du thread de l'interface
+            from explorer.thumbnails import ThumbnailPrefetcher, ThumbnailService
+            self.thumbnails = ThumbnailService(self)
+            self.thumbPrefetcher = ThumbnailPrefetcher(self.ui.listView, self.thumbnails, self)
+            self.listModel.rowsInserted.connect(self.thumbPrefetcher.schedule)
+            self.listModel.modelReset.connect(self.thumbPrefetcher.schedule)
+            self.listModel.layoutChanged.connect(self.thumbPrefetcher.schedule)
+        if icons:
+            size = self.thumbnails.size
+            view.setViewMode(QtWidgets.QListView.IconMode)
+            view.setMovement(QtWidgets.QListView.Static)
+            view.setIconSize(QSize(size, size))
+            view.setGridSize(QSize(size + 32, size + 40))
+            view.setResizeMode(QtWidgets.QListView.Adjust)
+            view.setWordWrap(True)
+        else:
+            view.setViewMode(QtWidgets.QListView.ListMode)
+            view.setIconSize(QSize())
+            view.setGridSize(QSize())
+            view.setWordWrap(False)
+        self.fileModel.setThumbnails(self.thumbnails if icons else None)
+        if self.thumbnails is not None:
+            self.thumbPrefetcher.setEnabled(icons)
+        self.show_page(self.ui.page)
+
+    def clear_filter(self):
+        """
+        Un changement de dossier vide le filtre, appliqué aussitôt.
+        """
+        self._filter_timer.stop()
+        if self.filterEdit.text():
+            self.filterEdit.blockSignals(True)
+            self.filterEdit.clear()
+            self.filterEdit.blockSignals(False)
+            self.listModel.setFilter("")
+
+    def export_metrics(self):
+        path, selected = QtWidgets.QFileDialog.getSaveFileName(
+            self, "Exporter les mesures", "mesures.json",
+            "Histogrammes (*.json);;Trace Chrome (*.trace.json)")
+        if path:
+            RECORDER.export(path, chrome=selected.startswith("Trace"))
 
-    def context_menu(self):
-        menu = QMenu()
-        open = menu.addAction("Ouvrir")
-        open.triggered.connect(self.menu_open)
-        cursor = QtGui.QCursor()
-        menu.exec_(cursor.pos())
+    def sibling_paths(self):
+        index = self.ui.treeView.currentIndex()
+        if not index.isValid():
+            return []
+        paths = []
+        for row in (index.row() - 1, index.row() + 1):
+            sibling = index.sibling(row, 0)
+            if sibling.isValid():
+                paths.append(self.dirModel.filePath(sibling))
+        return paths
+
+    def selected_paths(self):
+        view = self.ui.listView
+        model = view.model()
+        return [model.filePath(index) for index in view.selectionModel().selectedIndexes()]
+
+    def clipboard_paths(self):
+        urls = QtWidgets.QApplication.clipboard().mimeData().urls()
+        return [url.toLocalFile() for url in urls if url.isLocalFile()]
+
+    def writable(self, paths):
+        """
+        @return : False si paths sont dans une archive (lecture seule)
+        """
+        return not paths or backends.backend_for(paths[0]).local
+
+    def context_menu(self, pos):
+        paths = self.selected_paths()
+        writable = self.writable(paths)
+        self.action_open.setEnabled(len(paths) == 1)
+        for action in (self.action_copy, self.action_cut, self.action_delete):
+            action.setEnabled(bool(paths) and writable)
+        self.action_paste.setEnabled(self.ui.listView.model() is self.listModel and bool(self.clipboard_paths())
+                                     and self.writable([self.fileModel.rootPath()]))
+        menu = QMenu(self)
+        menu.addAction(self.action_open)
+        menu.addSeparator()
+        for action in (self.action_copy, self.action_cut, self.action_paste):
+            menu.addAction(action)
+        menu.addSeparator()
+        menu.addAction(self.action_delete)
+        menu.exec_(self.ui.listView.viewport().mapToGlobal(pos))
+
+    def tree_context_menu(self, pos):
+        index = self.ui.treeView.indexAt(pos)
+        if not index.isValid():
+            return
+        path = self.dirModel.filePath(index)
+        menu = QMenu(self)
+        menu.addAction("Rechercher dans le contenu…").triggered.connect(lambda: self.search_contents(path))
+        menu.addAction("Rechercher les doublons").triggered.connect(lambda: self.find_duplicates(path))
+        menu.addAction("Comparer avec…").triggered.connect(lambda: self.compare_with(path))
+        menu.exec_(self.ui.treeView.viewport().mapToGlobal(pos))
+
+    def search_contents(self, path):
+        text, ok = QtWidgets.QInputDialog.getText(
+            self, "Rechercher dans le contenu",
+            "Texte à chercher dans {0}\n(/expression/ pour une expression régulière) :".format(path))
+        if not ok or not text:
+            return
+        try:
+            self.comparePanel.hide()
+            self.contentSearch.start(path, text)
+        except re.error as e:
+            QtWidgets.QMessageBox.warning(self, "Rechercher dans le contenu", "Expression invalide : {0}".format(e))
+
+    def find_duplicates(self, path):
+        self.action_details.setChecked(True)
+        self.show_page(self.ui.page1)
+        self.duplicatePanel.start(path)
+
+    def compare_with(self, path):
+        other = QtWidgets.QFileDialog.getExistingDirectory(self, "Comparer {0} avec".format(path), path)
+        if not other or os.path.abspath(other) == os.path.abspath(path):
+            return
+        answer = QtWidgets.QMessageBox.question(
+            self, "Comparer les dossiers",
+            "Relire le contenu des fichiers de même taille dont seule la date diffère ?",
+            QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No | QtWidgets.QMessageBox.Cancel,
+            QtWidgets.QMessageBox.No)
+        if answer == QtWidgets.QMessageBox.Cancel:
+            return
+        self.contentSearch.hide()
+        self.comparePanel.start(path, other, answer == QtWidgets.QMessageBox.Yes)
+
+    def show_file(self, path):
+        """
+        Va au dossier de path et affiche son aperçu.
+        """
+        folder = os.path.dirname(path)
+        self.pathBar.setPath(folder)
+        self.navigator.navigate(folder)
+        self.previewPanel.show_file(path)
 
     def menu_open(self):
-        pass
+        paths = self.selected_paths()
+        if len(paths) != 1:
+            return
+        path = paths[0]
+        if backends.is_folder(path):
+            self.pathBar.setPath(path)
+            self.navigator.navigate(path)
+            return
+        if not backends.backend_for(path).local:
+            # entrée d'archive : copiée seule dans un dossier temporaire, ouverte à la fin de l'extraction
+            self.transfers.extract([path], tempfile.mkdtemp(prefix="explorateur-"))
+            return
+        self.open_files([path])
+
+    def open_files(self, paths):
+        for path in paths:
+            QtGui.QDesktopServices.openUrl(QUrl.fromLocalFile(path))
+
+    def copy_selection(self, cut):
+        paths = self.selected_paths()
+        if not paths or not self.writable(paths):
+            return
+        data = QMimeData()
+        data.setUrls([QUrl.fromLocalFile(path) for path in paths])
+        QtWidgets.QApplication.clipboard().setMimeData(data)
+        self._cut_paths = paths if cut else []
+
+    def paste(self):
+        paths = self.clipboard_paths()
+        destination = self.fileModel.rootPath()
+        if not paths or self.ui.listView.model() is not self.listModel or not self.writable([destination]):
+            return
+        if paths == self._cut_paths:
+            self.transfers.move(paths, destination)
+            self._cut_paths = []
+            QtWidgets.QApplication.clipboard().clear()
+        else:
+            self.transfers.copy(paths, destination)
+
+    def delete_selection(self):
+        paths = self.selected_paths()
+        if not paths or not self.writable(paths):
+            return
+        text = "Supprimer définitivement {0} ?".format(
+            os.path.basename(paths[0]) if len(paths) == 1 else "{0} éléments".format(len(paths)))
+        answer = QtWidgets.QMessageBox.question(self, "Supprimer", text)
+        if answer == QtWidgets.QMessageBox.Yes:
+            self.transfers.delete(paths)
 
     def select_item(self):
         print("selected")
@@ -102,8 +702,30 @@ class ExploreClockScreen(QMainWindow):
     def close_window(self):
         self.close()
 
+    def closeEvent(self, event):
+        self.save_session()
+        self.indexFeeder.shutdown()
+        self.dirCache.flush()
+        if self.thumbnails is not None:
+            self.thumbnails.shutdown()
+        if self._deferred_done:
+            self.transfers.shutdown()
+            self.previewPanel.clear()
+            self.contentSearch.cancel()
+            self.comparePanel.cancel()
+            self.duplicatePanel.shutdown()
+        QMainWindow.closeEvent(self, event)
+
 
-def main():
+def main(argv=None):
+    """
+    Lance l'explorateur ; avec une commande (--list, --du, --search, --grep, --compare),
+    le mode sans interface (voir cli).
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0].startswith("--"):
+        from explorer.cli import main as cli_main
+        sys.exit(cli_main(argv))
     app = QtWidgets.QApplication(sys.argv)
     application = ExploreClockScreen()
     application.show()
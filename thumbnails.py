@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+Miniatures des images pour le mode icônes du panneau de liste.
+
+Le décodage et la mise à l'échelle ont lieu dans un pool de processus : le
+thread de l'interface ne fait que charger un petit PNG déjà prêt. Chaque
+miniature est rangée sur disque sous l'empreinte (sha1) du contenu de
+l'image, ce qui la retrouve après un renommage ou un déplacement, et dans un
+cache mémoire LRU d'icônes indexé par (chemin, date de modification).
+
+Seules les lignes visibles et quelques lignes suivantes sont demandées ; les
+demandes qui ne sont plus utiles sont annulées tant qu'elles attendent.
+"""
+import hashlib
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PyQt5.QtCore import QBuffer, QByteArray, QIODevice, QObject, QPoint, Qt, QTimer, pyqtSignal
+from PyQt5.QtGui import QColor, QIcon, QImageReader, QPainter, QPixmap
+
+from explorer.dircache import default_cache_dir
+
+THUMB_SIZE = 96
+MEMORY_ITEMS = 1000  # icônes gardées en mémoire
+DISK_MAX_BYTES = 128 * 1024 * 1024
+MAX_FILE_BYTES = 64 * 1024 * 1024  # au-delà, pas de miniature
+LOOKAHEAD = 32  # lignes demandées après la dernière ligne visible
+WORKERS = max(1, min(4, (os.cpu_count() or 1) - 1))
+UPDATE_DELAY_MS = 30
+
+
+def default_thumbnail_dir():
+    return os.path.join(default_cache_dir(), "thumbnails")
+
+
+def _render(path, size, cache_dir):
+    """
+    Exécuté dans un processus du pool.
+    @return : (chemin, PNG de la miniature en octets, ou None si l'image est illisible)
+    """
+    try:
+        with open(path, "rb") as f:
+            data = f.read(MAX_FILE_BYTES + 1)
+    except OSError:
+        return path, None
+    if len(data) > MAX_FILE_BYTES:
+        return path, None
+    key = "{0}-{1}".format(hashlib.sha1(data).hexdigest(), size)
+    cached = os.path.join(cache_dir, key[:2], key + ".png")
+    try:
+        with open(cached, "rb") as f:
+            png = f.read()
+        os.utime(cached)  # date d'accès pour l'éviction
+        return path, png
+    except OSError:
+        pass
+
+    buffer = QBuffer()
+    buffer.setData(QByteArray(data))
+    buffer.open(QIODevice.ReadOnly)
+    reader = QImageReader(buffer)
+    reader.setAutoTransform(True)
+    full = reader.size()
+    if full.isValid() and (full.width() > size or full.height() > size):
+        # les décodeurs qui le permettent (JPEG) ne décodent que la taille utile
+        reader.setScaledSize(full.scaled(size, size, Qt.KeepAspectRatio))
+    image = reader.read()
+    if image.isNull():
+        return path, None
+    if image.width() > size or image.height() > size:
+        image = image.scaled(size, size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+
+    out = QBuffer()
+    out.open(QIODevice.WriteOnly)
+    image.save(out, "PNG")
+    png = bytes(out.data())
+    try:
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        tmp = "{0}.{1}.tmp".format(cached, os.getpid())
+        with open(tmp, "wb") as f:
+            f.write(png)
+        os.replace(tmp, cached)
+    except OSError:
+        pass
+    return path, png
+
+
+def _prune(cache_dir, max_bytes):
+    """
+    Supprime les miniatures les moins récemment utilisées au-delà de max_bytes.
+    """
+    files = []
+    total = 0
+    for root, _, names in os.walk(cache_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+    files.sort()
+    for _, size, path in files:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+
+class ThumbnailService(QObject):
+    """
+    Fournit les icônes des images ; thumbnailReady(chemin) est émis quand une
+    miniature demandée est disponible.
+    """
+    thumbnailReady = pyqtSignal(str)
+    _rendered = pyqtSignal(object, object)
+
+    def __init__(self, parent=None, cache_dir=None, size=THUMB_SIZE, workers=WORKERS):
+        QObject.__init__(self, parent)
+        self.cache_dir = cache_dir or default_thumbnail_dir()
+        self.size = size
+        self.workers = workers
+        self.suffixes = frozenset("." + bytes(f).decode() for f in QImageReader.supportedImageFormats())
+        self.placeholder = self._make_placeholder()
+        self._icons = OrderedDict()  # (chemin, mtime) -> QIcon
+        self._pending = {}  # (chemin, mtime) -> future
+        self._failed = set()
+        self._executor = None
+        self._lock = threading.Lock()
+        self._rendered.connect(self._on_rendered)
+
+    def _make_placeholder(self):
+        pixmap = QPixmap(self.size, self.size)
+        pixmap.fill(Qt.transparent)
+        painter = QPainter(pixmap)
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(QColor(0, 0, 0, 24))
+        margin = self.size // 8
+        painter.drawRoundedRect(margin, margin, self.size - 2 * margin, self.size - 2 * margin, 6, 6)
+        painter.end()
+        return QIcon(pixmap)
+
+    def handles(self, name):
+        return os.path.splitext(name)[1].lower() in self.suffixes
+
+    def icon(self, path, mtime):
+        """
+        @return : la miniature si elle est prête, sinon l'icône d'attente (la
+                  miniature est alors demandée au pool)
+        """
+        key = (path, mtime)
+        icon = self._icons.get(key)
+        if icon is not None:
+            self._icons.move_to_end(key)
+            return icon
+        self.request(path, mtime)
+        return self.placeholder
+
+    def request(self, path, mtime):
+        key = (path, mtime)
+        if key in self._icons or key in self._pending or key in self._failed:
+            return
+        try:
+            future = self._pool().submit(_render, path, self.size, self.cache_dir)
+        except BrokenProcessPool:
+            # un processus a disparu (décodeur planté) : le pool sera recréé
+            with self._lock:
+                self._executor = None
+            self._failed.add(key)
+            return
+        self._pending[key] = future
+        future.add_done_callback(lambda f, key=key: self._done(key, f))
+
+    def retain(self, keys):
+        """
+        Annule les demandes en attente qui ne figurent pas dans keys.
+        """
+        for key, future in list(self._pending.items()):
+            if key not in keys and future.cancel():
+                del self._pending[key]
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+        self._pending.clear()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn : un fork du processus graphique (et de ses threads) n'est pas sûr
+                context = multiprocessing.get_context("spawn")
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=context)
+                self._executor.submit(_prune, self.cache_dir, DISK_MAX_BYTES)
+            return self._executor
+
+    def _done(self, key, future):
+        # thread du pool : le signal ramène le résultat dans le thread de l'interface
+        try:
+            result = future.result()
+        except CancelledError:
+            return
+        except Exception:
+            result = (key[0], None)
+        self._rendered.emit(key, result[1])
+
+    def _on_rendered(self, key, png):
+        if self._pending.pop(key, None) is None:
+            return  # demande abandonnée entre-temps
+        pixmap = QPixmap()
+        if png is None or not pixmap.loadFromData(png, "PNG"):
+            self._failed.add(key)
+            return
+        self._icons[key] = QIcon(pixmap)
+        while len(self._icons) > MEMORY_ITEMS:
+            self._icons.popitem(last=False)
+        self.thumbnailReady.emit(key[0])
+
+
+class ThumbnailPrefetcher(QObject):
+    """
+    Suit le défilement d'une vue en mode icônes : demande les miniatures des
+    lignes visibles et des LOOKAHEAD suivantes, et annule les autres.
+    """
+
+    def __init__(self, view, service, parent=None):
+        QObject.__init__(self, parent)
+        self.view = view
+        self.service = service
+        self.enabled = False
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(UPDATE_DELAY_MS)
+        self._timer.timeout.connect(self.update)
+        view.verticalScrollBar().valueChanged.connect(self.schedule)
+        view.horizontalScrollBar().valueChanged.connect(self.schedule)
+
+    def setEnabled(self, enabled):
+        self.enabled = enabled
+        if enabled:
+            self.schedule()
+        else:
+            self.service.retain(())
+
+    def schedule(self, *args):
+        if self.enabled:
+            self._timer.start()
+
+    def update(self):
+        model = self.view.model()
+        if not self.enabled or model is None or not hasattr(model, "thumbnailKey"):
+            self.service.retain(())
+            return
+        viewport = self.view.viewport().rect()
+        first = self.view.indexAt(QPoint(viewport.left() + 4, viewport.top() + 4))
+        row = first.row() if first.isValid() else 0
+        rows = model.rowCount()
+        keys = set()
+        # lignes visibles, puis LOOKAHEAD lignes au-delà du bas de la vue
+        extra = LOOKAHEAD
+        while row < rows and extra > 0:
+            rect = self.view.visualRect(model.index(row, 0))
+            if rect.top() > viewport.bottom():
+                extra -= 1
+            key = model.thumbnailKey(row)
+            if key is not None:
+                keys.add(key)
+            row += 1
+        self.service.retain(keys)
+        for path, mtime in keys:
+            self.service.request(path, mtime)
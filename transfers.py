@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Suivi des copies, déplacements et suppressions dans la barre d'état.
+
+Les opérations sont exécutées par fileops ; ce panneau affiche l'opération
+en cours (progression, débit, nombre d'opérations en attente) avec des
+boutons de pause et d'annulation, puis un message à la fin. Les fichiers
+extraits d'une archive sont annoncés par extracted.
+"""
+from PyQt5.QtCore import QObject, pyqtSignal
+from PyQt5.QtWidgets import QLabel, QProgressBar, QToolButton
+
+from explorer.details import format_size
+from explorer.fileops import COPY, DELETE, EXTRACT, FileOperationQueue
+
+MESSAGE_MS = 10000
+VERBS = {COPY: "Copie", DELETE: "Suppression", EXTRACT: "Extraction"}
+
+
+def describe(op):
+    count = len(op.sources)
+    what = "{0} élément{1}".format(count, "s" if count > 1 else "")
+    return "{0} de {1}".format(VERBS.get(op.kind, "Déplacement"), what)
+
+
+class _TransferSignals(QObject):
+    progress = pyqtSignal(object)
+    finished = pyqtSignal(object)
+
+
+class TransferPanel(QObject):
+    """
+    Possède la file d'opérations de la fenêtre ; l'affiche dans statusbar.
+    """
+    extracted = pyqtSignal(list)  # chemins des fichiers extraits, à la fin d'une extraction
+
+    def __init__(self, statusbar, parent=None):
+        QObject.__init__(self, parent)
+        self.statusbar = statusbar
+        self._signals = _TransferSignals(self)
+        self._signals.progress.connect(self._on_progress)
+        self._signals.finished.connect(self._on_finished)
+        self.queue = FileOperationQueue(on_progress=self._signals.progress.emit,
+                                        on_finished=self._signals.finished.emit)
+
+        self.label = QLabel(statusbar)
+        self.bar = QProgressBar(statusbar)
+        self.bar.setMaximumWidth(200)
+        self.bar.setRange(0, 1000)
+        self.pause_button = QToolButton(statusbar)
+        self.pause_button.setText("Pause")
+        self.pause_button.clicked.connect(self.toggle_pause)
+        self.cancel_button = QToolButton(statusbar)
+        self.cancel_button.setText("Annuler")
+        self.cancel_button.clicked.connect(self.cancel)
+        self._widgets = (self.label, self.bar, self.pause_button, self.cancel_button)
+        for widget in self._widgets:
+            statusbar.addWidget(widget)
+            widget.hide()
+        self._shown = None
+
+    def copy(self, sources, destination):
+        return self._submit(self.queue.copy(sources, destination))
+
+    def move(self, sources, destination):
+        return self._submit(self.queue.move(sources, destination))
+
+    def delete(self, sources):
+        return self._submit(self.queue.delete(sources))
+
+    def extract(self, sources, destination):
+        return self._submit(self.queue.extract(sources, destination))
+
+    def _submit(self, op):
+        if self._shown is None:
+            self._show(op)
+        return op
+
+    def toggle_pause(self):
+        op = self._shown
+        if op is None:
+            return
+        if op.state == "paused":
+            op.resume()
+        else:
+            op.pause()
+        self._show(op)
+
+    def cancel(self):
+        if self._shown is not None:
+            self._shown.cancel()
+
+    def shutdown(self):
+        self.queue.shutdown()
+
+    def _show(self, op):
+        self._shown = op
+        for widget in self._widgets:
+            widget.show()
+        self.pause_button.setText("Reprendre" if op.state == "paused" else "Pause")
+        self._update(op)
+
+    def _update(self, op):
+        text = describe(op)
+        if op.state == "paused":
+            text += " — en pause"
+        elif op.kind != DELETE and op.total_bytes:
+            text += " — {0} / {1}, {2}/s".format(format_size(op.done_bytes), format_size(op.total_bytes),
+                                                 format_size(op.throughput()))
+        elif op.total_files:
+            text += " — {0} / {1} fichiers".format(op.done_files, op.total_files)
+        waiting = len(self.queue.pending())
+        if waiting:
+            text += " ({0} en attente)".format(waiting)
+        self.label.setText(text)
+        if op.kind != DELETE and op.total_bytes:
+            self.bar.setValue(int(1000 * op.done_bytes / op.total_bytes))
+        elif op.total_files:
+            self.bar.setValue(int(1000 * op.done_files / op.total_files))
+        else:
+            self.bar.setValue(0)
+
+    def _on_progress(self, op):
+        if op is not self._shown:
+            self._show(op)
+        else:
+            self._update(op)
+
+    def _on_finished(self, op):
+        if op.state == "cancelled":
+            message = "{0} annulée".format(describe(op))
+        elif op.errors:
+            path, error = op.errors[0]
+            message = "{0} : {1} erreur(s), dont {2} ({3})".format(describe(op), len(op.errors), path, error)
+        else:
+            message = "{0} terminée".format(describe(op))
+        following = self.queue.current or next(iter(self.queue.pending()), None)
+        if following is not None:
+            self._show(following)
+        else:
+            self._shown = None
+            for widget in self._widgets:
+                widget.hide()
+        self.statusbar.showMessage(message, MESSAGE_MS)
+        if op.kind == EXTRACT and op.state == "done" and op.targets:
+            self.extracted.emit(op.targets)
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+Carte de l'occupation du disque (treemap) : arbre des dossiers et
+disposition en rectangles.
+
+L'arbre est rempli au fil d'un parcours en arrière-plan (foldersize) : chaque
+sous-dossier terminé y entre avec sa taille totale, et la taille des
+dossiers encore en cours est la somme de leurs sous-dossiers déjà connus.
+La carte peut donc être dessinée avant la fin du parcours, et se précise
+à chaque rafraîchissement. Les fichiers d'un dossier ne sont pas des nœuds :
+ils forment un seul rectangle (OWN), ce qui limite l'arbre aux dossiers.
+
+La disposition d'un dossier (algorithme « squarified » de Bruls, Huizing et
+van Wijk) est calculée dans un carré unité et gardée dans son nœud, tant
+que le dossier ne change pas et que la forme du rectangle où il est dessiné
+reste proche (ASPECT_SLACK) : redessiner, ou entrer dans un sous-dossier, ne
+recalcule que les dossiers qui ont changé. Seuls les MAX_TILES plus gros
+éléments d'un dossier ont leur rectangle, à condition de peser au moins
+MIN_FRACTION du dossier ; les autres sont regroupés (OTHERS). Le dessin
+s'arrête aux rectangles trop petits pour être vus : son coût dépend de la
+surface affichée, pas du nombre de dossiers.
+
+Les méthodes peuvent être appelées depuis plusieurs threads : l'arbre est
+protégé par lock, que le dessin doit tenir pendant qu'il parcourt l'arbre.
+
+Aucune dépendance Qt.
+"""
+import os
+import threading
+
+MAX_TILES = 200  # rectangles au plus par dossier
+MIN_FRACTION = 0.001  # en dessous, un élément rejoint OTHERS
+ASPECT_SLACK = 1.5  # écart de proportions toléré pour reprendre une disposition
+OWN, OTHERS = "fichiers", "autres"
+
+
+def squarify(sizes, x, y, width, height):
+    """
+    @param sizes : tailles positives, par ordre décroissant
+    @return : [(x, y, largeur, hauteur)] de chaque taille, qui pavent le
+              rectangle donné en gardant des rectangles proches du carré
+    """
+    rects = []
+    total = float(sum(sizes))
+    if total <= 0 or width <= 0 or height <= 0:
+        return [(x, y, 0.0, 0.0) for _ in sizes]
+    scale = width * height / total
+    count = len(sizes)
+    i = 0
+    while i < count:
+        side = min(width, height)
+        if side <= 0:
+            rects.extend((x, y, 0.0, 0.0) for _ in range(i, count))
+            break
+        first = sizes[i] * scale
+        row_sum, row_end = first, i + 1
+        worst = max(side * side / first, first / (side * side))
+        while row_end < count:
+            area = sizes[row_end] * scale
+            total_area = row_sum + area
+            # pire rapport de la rangée : le plus grand (premier) ou le plus petit (dernier) élément
+            candidate = max(side * side * first / (total_area * total_area),
+                            total_area * total_area / (side * side * area))
+            if candidate > worst:
+                break
+            row_sum, worst, row_end = total_area, candidate, row_end + 1
+        thickness = row_sum / side
+        offset = 0.0
+        for j in range(i, row_end):
+            length = sizes[j] * scale / thickness
+            if width >= height:  # colonne à gauche
+                rects.append((x, y + offset, thickness, length))
+            else:  # rangée en haut
+                rects.append((x + offset, y, length, thickness))
+            offset += length
+        if width >= height:
+            x += thickness
+            width -= thickness
+        else:
+            y += thickness
+            height -= thickness
+        i = row_end
+    return rects
+
+
+class Node(object):
+    """
+    Un dossier de la carte.
+    """
+    __slots__ = ("name", "parent", "children", "size", "own", "complete", "seen", "layout")
+
+    def __init__(self, name, parent):
+        self.name = name
+        self.parent = parent
+        self.children = {}  # nom -> Node des sous-dossiers
+        self.size = 0  # octets ; somme des sous-dossiers connus tant que le dossier n'est pas terminé
+        self.own = 0  # octets des fichiers directement dans le dossier
+        self.complete = False
+        self.seen = 0  # dernier parcours qui a terminé ce dossier
+        self.layout = None  # (proportions, [(élément, x, y, largeur, hauteur)]) dans le carré unité
+
+    def path(self):
+        parts = []
+        node = self
+        while node.parent is not None:
+            parts.append(node.name)
+            node = node.parent
+        return os.path.join(*reversed(parts)) if parts else ""
+
+
+class Treemap(object):
+    """
+    Arbre des tailles de dossiers, gardé d'un parcours à l'autre.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.version = 0  # change à chaque modification de l'arbre
+        self._root = Node("", None)
+        self._generation = 0
+
+    @staticmethod
+    def _parts(path):
+        drive, rest = os.path.splitdrive(os.path.normpath(path))
+        return [drive + os.sep] + [part for part in rest.split(os.sep) if part]
+
+    def node(self, path, create=True):
+        """
+        @return : le nœud du dossier path, ou None s'il est inconnu et que create est faux
+        """
+        with self.lock:
+            node = self._root
+            for part in self._parts(path):
+                child = node.children.get(part)
+                if child is None:
+                    if not create:
+                        return None
+                    child = node.children[part] = Node(part, node)
+                node = child
+            return node
+
+    def begin(self):
+        """
+        Annonce un nouveau parcours : les sous-dossiers qu'il ne signale pas
+        disparaîtront de leur parent à la fin de celui-ci.
+        """
+        with self.lock:
+            self._generation += 1
+
+    def add(self, path, nbytes, cached=False):
+        """
+        Un sous-dossier terminé et sa taille totale ; appelé depuis les
+        threads du parcours.
+        @param cached : taille reprise du cache, sans parcours du dossier :
+                        le détail déjà connu est gardé s'il a la même taille
+        """
+        with self.lock:
+            node = self.node(path)
+            if cached:
+                if not node.complete or node.size != nbytes:
+                    node.children.clear()
+            else:
+                for name in [name for name, child in node.children.items() if child.seen != self._generation]:
+                    del node.children[name]  # disparu depuis le parcours précédent
+            delta = nbytes - node.size
+            node.size = nbytes
+            node.own = max(0, nbytes - sum(child.size for child in node.children.values()))
+            node.complete = True
+            node.seen = self._generation
+            node.layout = None
+            parent = node.parent
+            while parent is not None:
+                parent.size += delta  # les fichiers d'un dossier terminé ne changent pas
+                parent.layout = None
+                parent = parent.parent
+            self.version += 1
+
+    def layout(self, node, aspect):
+        """
+        Disposition des éléments de node dans le carré unité, pour un
+        rectangle de proportions aspect (largeur / hauteur). Reprise du
+        nœud si elle est encore valable. A appeler sous lock.
+        @return : [(élément, x, y, largeur, hauteur)] par taille décroissante ;
+                  un élément est un Node, ou (OWN ou OTHERS, octets, nombre d'éléments)
+        """
+        cached = node.layout
+        if cached is not None and cached[0] / ASPECT_SLACK <= aspect <= cached[0] * ASPECT_SLACK:
+            return cached[1]
+        items = [child for child in node.children.values() if child.size > 0]
+        items.sort(key=lambda child: child.size, reverse=True)
+        floor = node.size * MIN_FRACTION
+        kept = [child for child in items[:MAX_TILES] if child.size >= floor]
+        rest = items[len(kept):]
+        tiles = list(kept)
+        sizes = [child.size for child in kept]
+        if node.own:
+            tiles.append((OWN, node.own, 1))
+            sizes.append(node.own)
+        if rest:
+            tiles.append((OTHERS, sum(child.size for child in rest), len(rest)))
+            sizes.append(tiles[-1][1])
+        order = sorted(range(len(tiles)), key=sizes.__getitem__, reverse=True)
+        rects = squarify([sizes[i] for i in order], 0.0, 0.0, aspect, 1.0)
+        result = [(tiles[i], x / aspect, y, width / aspect, height) for i, (x, y, width, height) in zip(order, rects)]
+        node.layout = (aspect, result)
+        return result
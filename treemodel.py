@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+Modèle de l'arborescence des dossiers.
+
+Vue filtrée (dossiers seulement) des instantanés du DirectoryService : un
+noeud déplié prend une référence sur l'instantané de son dossier et la rend
+quand il est replié.
+"""
+import bisect
+import os
+import stat
+
+from PyQt5.QtCore import QAbstractItemModel, QDir, QModelIndex, Qt
+from PyQt5.QtWidgets import QFileIconProvider
+
+from explorer.treeview import TEXT_PLAIN, URI_LIST, LazyMimeData
+
+
+class _Node(object):
+    """
+    Dossier de l'arborescence. Les enfants sont triés par _sort_key, dont les
+    clés sont gardées à côté (keys) ; chacun connaît son rang, renuméroté à
+    la demande après une insertion ou une suppression.
+    """
+
+    def __init__(self, path, name, parent=None):
+        self.path = path
+        self.name = name
+        self.parent = parent
+        self.children = None  # None : pas encore chargé
+        self.keys = None  # _sort_key de chaque enfant
+        self.acquired = False
+        self._row = 0
+        self._stale = None  # premier rang d'enfant à renuméroter
+
+    def row(self):
+        parent = self.parent
+        if parent is None:
+            return 0
+        if parent._stale is not None:
+            children = parent.children
+            for row in range(parent._stale, len(children)):
+                children[row]._row = row
+            parent._stale = None
+        return self._row
+
+    def set_children(self, names):
+        """
+        @param names : noms des sous-dossiers, triés par _sort_key
+        """
+        self.children = [_Node(os.path.join(self.path, name), name, self) for name in names]
+        self.keys = [_sort_key(name) for name in names]
+        for row, child in enumerate(self.children):
+            child._row = row
+        self._stale = None
+
+    def find(self, name):
+        """
+        @return : rang de l'enfant name, ou -1
+        """
+        if not self.children:
+            return -1
+        row = bisect.bisect_left(self.keys, _sort_key(name))
+        return row if row < len(self.children) and self.children[row].name == name else -1
+
+    def insert(self, name):
+        """
+        @return : rang où l'enfant name doit être inséré (à passer à insert_at)
+        """
+        return bisect.bisect_left(self.keys, _sort_key(name))
+
+    def insert_at(self, row, name):
+        self.children.insert(row, _Node(os.path.join(self.path, name), name, self))
+        self.keys.insert(row, _sort_key(name))
+        self._renumber(row)
+
+    def remove_at(self, row):
+        del self.children[row]
+        del self.keys[row]
+        self._renumber(row)
+
+    def _renumber(self, row):
+        self._stale = row if self._stale is None else min(self._stale, row)
+
+
+def _sort_key(name):
+    return name.lower(), name
+
+
+class DirTreeModel(QAbstractItemModel):
+    """
+    Remplace le QFileSystemModel de l'arborescence.
+    """
+
+    def __init__(self, service, root=None, parent=None):
+        QAbstractItemModel.__init__(self, parent)
+        self.service = service
+        root = root or QDir.rootPath()
+        self._root = _Node(root, root)
+        self._nodes = {}  # chemin -> noeud dont l'instantané est référencé
+
+        service.reset.connect(self._on_snapshot_changed)
+        service.removed.connect(self._on_snapshot_changed)
+        service.changed.connect(self._on_snapshot_changed)
+        service.appended.connect(self._on_appended)
+        service.loaded.connect(self._on_snapshot_changed)
+
+        self._dir_icon = QFileIconProvider().icon(QFileIconProvider.Folder)
+
+    def rootPath(self):
+        return self._root.path
+
+    def filePath(self, index):
+        return self._node(index).path
+
+    def indexForPath(self, path):
+        """
+        @return : index du dossier path s'il est déjà chargé dans l'arborescence,
+                  sinon un index invalide
+        """
+        rel = os.path.relpath(path, self._root.path)
+        if rel == os.curdir or rel == os.pardir or rel.startswith(os.pardir + os.sep):
+            return QModelIndex()
+        node = self._root
+        for name in rel.split(os.sep):
+            row = node.find(name)
+            if row < 0:
+                return QModelIndex()
+            node = node.children[row]
+        return self.createIndex(node.row(), 0, node)
+
+    def acquiredPaths(self):
+        """
+        @return : {chemin : contenu chargé} des noeuds dépliés ou en cours de chargement
+        """
+        return {path: node.children is not None for path, node in self._nodes.items()}
+
+    def _node(self, index):
+        if index.isValid():
+            return index.internalPointer()
+        return self._root
+
+    def index(self, row, column=0, parent=QModelIndex()):
+        node = self._node(parent)
+        if node.children is None or not 0 <= row < len(node.children) or column != 0:
+            return QModelIndex()
+        return self.createIndex(row, 0, node.children[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        node = index.internalPointer().parent
+        if node is None or node is self._root:
+            return QModelIndex()
+        return self.createIndex(node.row(), 0, node)
+
+    def rowCount(self, parent=QModelIndex()):
+        node = self._node(parent)
+        return len(node.children) if node.children is not None else 0
+
+    def columnCount(self, parent=QModelIndex()):
+        return 1
+
+    def hasChildren(self, parent=QModelIndex()):
+        node = self._node(parent)
+        return node.children is None or len(node.children) > 0
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole:
+            return index.internalPointer().name
+        if role == Qt.DecorationRole:
+            return self._dir_icon
+        return None
+
+    def flags(self, index):
+        flags = QAbstractItemModel.flags(self, index)
+        if index.isValid():
+            flags |= Qt.ItemIsDragEnabled
+        return flags
+
+    def mimeTypes(self):
+        return [URI_LIST, TEXT_PLAIN]
+
+    def supportedDragActions(self):
+        return Qt.CopyAction | Qt.MoveAction | Qt.LinkAction
+
+    def mimeData(self, indexes):
+        return LazyMimeData([self._node(index).path for index in indexes if index.isValid()])
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole and section == 0:
+            return "Nom"
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        node = self._node(parent)
+        return node.children is None and not node.acquired
+
+    def fetchMore(self, parent=QModelIndex()):
+        node = self._node(parent)
+        if node.acquired:
+            return
+        node.acquired = True
+        self._nodes[node.path] = node
+        snap = self.service.acquire(node.path)
+        if snap.complete or len(snap.store):
+            self._sync(node)
+
+    def collapse(self, index):
+        """
+        A appeler quand la vue replie index : les sous-noeuds sont oubliés et
+        les instantanés correspondants rendus au service.
+        """
+        node = self._node(index)
+        if node.children:
+            self.beginRemoveRows(index, 0, len(node.children) - 1)
+            children = node.children
+            node.set_children([])
+            self.endRemoveRows()
+            for child in children:
+                self._release(child)
+        node.children = None
+        node.keys = None
+        if node.acquired:
+            node.acquired = False
+            del self._nodes[node.path]
+            self.service.release(node.path)
+
+    def _release(self, node):
+        for child in node.children or ():
+            self._release(child)
+        if node.acquired:
+            node.acquired = False
+            del self._nodes[node.path]
+            self.service.release(node.path)
+
+    def _index_of(self, node):
+        if node is self._root:
+            return QModelIndex()
+        return self.createIndex(node.row(), 0, node)
+
+    def _dir_names(self, store, first=0, last=None):
+        last = len(store) - 1 if last is None else last
+        modes = store.modes
+        names = []
+        for i in range(first, last + 1):
+            if stat.S_ISDIR(modes[i]):
+                name = store.name(i)
+                if not name.startswith("."):
+                    names.append(name)
+        return names
+
+    def _insert(self, node, names):
+        parent = self._index_of(node)
+        if node.children is None:
+            node.set_children([])
+        for name in names:
+            row = node.insert(name)
+            self.beginInsertRows(parent, row, row)
+            node.insert_at(row, name)
+            self.endInsertRows()
+
+    def _sync(self, node):
+        """
+        Aligne les enfants de node sur son instantané.
+        """
+        snap = self.service.snapshot(node.path)
+        if snap is None:
+            return
+        names = set(self._dir_names(snap.store))
+        parent = self._index_of(node)
+        if node.children is None:
+            names = sorted(names, key=_sort_key)
+            if names:
+                self.beginInsertRows(parent, 0, len(names) - 1)
+            node.set_children(names)
+            if names:
+                self.endInsertRows()
+            else:
+                self.dataChanged.emit(parent, parent)  # plus de flèche de dépliage
+            return
+        for row in reversed(range(len(node.children))):
+            child = node.children[row]
+            if child.name not in names:
+                self.beginRemoveRows(parent, row, row)
+                node.remove_at(row)
+                self.endRemoveRows()
+                self._release(child)
+        known = set(child.name for child in node.children)
+        self._insert(node, [name for name in names if name not in known])
+
+    def _on_snapshot_changed(self, path, *args):
+        node = self._nodes.get(path)
+        if node is not None:
+            self._sync(node)
+
+    def _on_appended(self, path, first, last):
+        node = self._nodes.get(path)
+        if node is None:
+            return
+        snap = self.service.snapshot(path)
+        if node.children is None and not snap.complete:
+            # premier lot d'une énumération : on attend le chargement pour trier en une fois
+            return
+        self._insert(node, self._dir_names(snap.store, first, last))
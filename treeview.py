@@ -33,11 +33,88 @@ La sous-classe est effectuée afin de :
 @purpose : afficher l'arborescence du fichier .dxf, sélectionner,
           activer et définir l'ordre d'exportation des formes
 """
+from array import array
+
 from PyQt5 import QtCore
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import QByteArray, QMimeData, Qt, QUrl
 from PyQt5.QtGui import QStandardItemModel
 from PyQt5.QtWidgets import QTreeView
 
+URI_LIST = "text/uri-list"
+TEXT_PLAIN = "text/plain"
+
+
+class LazyMimeData(QMimeData):
+    """
+    Données d'un glisser-déposer produites seulement quand une cible de dépôt
+    demande un format. Au départ du glisser, seule la source compacte des
+    chemins est gardée : démarrer le glisser de cent mille fichiers coûte
+    autant que celui d'un seul.
+    @param paths : objet itérable donnant les chemins (ex. entrystore.RowSelection),
+                   parcouru à la première demande seulement
+    @param extra : formats supplémentaires, dictionnaire type -> octets
+    """
+
+    def __init__(self, paths, extra=None):
+        QMimeData.__init__(self)
+        self.paths = paths
+        self._extra = dict(extra or {})
+        self._data = {}
+
+    def formats(self):
+        return [URI_LIST, TEXT_PLAIN] + list(self._extra)
+
+    def hasFormat(self, mimetype):
+        return mimetype in (URI_LIST, TEXT_PLAIN) or mimetype in self._extra
+
+    def retrieveData(self, mimetype, preferred_type):
+        """
+        Appelée par Qt quand la cible lit un format ; le résultat est gardé.
+        """
+        if mimetype in self._extra:
+            return QByteArray(self._extra[mimetype])
+        data = self._data.get(mimetype)
+        if data is None:
+            if mimetype == URI_LIST:
+                data = b"\r\n".join(bytes(QUrl.fromLocalFile(path).toEncoded()) for path in self.paths)
+            elif mimetype == TEXT_PLAIN:
+                data = "\n".join(self.paths).encode("utf-8")
+            else:
+                return None
+            self._data[mimetype] = data
+        return QByteArray(data)
+
+
+class _ItemSelection(object):
+    """
+    Lignes glissées d'un QStandardItemModel, rangées par parent dans des
+    tableaux d'entiers ; le texte des éléments n'est lu qu'au parcours.
+    """
+
+    def __init__(self, model, indexes):
+        self.model = model
+        self.groups = []  # (QPersistentModelIndex du parent, lignes)
+        by_parent = {}
+        for index in indexes:
+            if index.column() == 0:
+                parent = QtCore.QPersistentModelIndex(index.parent())
+                rows = by_parent.get(parent)
+                if rows is None:
+                    rows = by_parent[parent] = array('I')
+                    self.groups.append((parent, rows))
+                rows.append(index.row())
+
+    def __len__(self):
+        return sum(len(rows) for _, rows in self.groups)
+
+    def __iter__(self):
+        for parent, rows in self.groups:
+            for row in rows:
+                item = self.model.itemFromIndex(self.model.index(row, 0, QtCore.QModelIndex(parent)))
+                if item is not None:
+                    path = item.data(Qt.UserRole)
+                    yield path if isinstance(path, str) else item.text()
+
 
 class TreeView(QTreeView):
     """
@@ -333,13 +410,10 @@ class MyStandardItemModel(QStandardItemModel):
         """
         Cette fonction est appelée par QT à chaque fois qu'une opération glisser est
         initié, pour sérialiser les données associées au
-        élément déplacé.  Cependant, QT ne sait pas comment sérialiser un Shape
-        ou un Layer, donc ça renvoie une erreur... puisque nous gérons le Drag & Drop
-        en interne, nous n'avons pas besoin de sérialisation, donc nous sous-classons
-        la fonction et ne retourne rien (astuce pour éviter les erreurs).
+        élément déplacé.  Le format interne de QT reste vide (le glisser-déposer
+        est géré en interne) ; les chemins (Qt.UserRole, à défaut le texte des
+        éléments) ne sont sérialisés que si une cible de dépôt les demande.
         """
-        mimeData = QtCore.QMimeData()
         # mimeData.setData("application/x-qabstractitemmodeldatalist", "")
-        mimeData.setData("application/x-qstandarditemmodeldatalist", "")
-
-        return mimeData
+        return LazyMimeData(_ItemSelection(self, index),
+                            {"application/x-qstandarditemmodeldatalist": b""})